@@ -0,0 +1,60 @@
+import collections
+import threading
+
+
+class CaseCache:
+    """
+    Keeps recently viewed cases in memory, least recently used first out once their total size grows past max_size
+    bytes. Sizes are measured again on every put, since surfaces of a loaded case change while it is viewed. Every
+    operation holds a lock, so the cache can be shared with the threads loading cases.
+    """
+
+    def __init__(self, max_size, size_of):
+        """
+        :param max_size: bytes, the most recently put case is always kept even if it is larger
+        :param size_of: callable returning the size in bytes of a cached case
+        """
+        self.max_size = max_size
+        self.size_of = size_of
+        self.__cases = collections.OrderedDict()
+        self.__lock = threading.RLock()
+
+    def __contains__(self, key):
+        with self.__lock:
+            return key in self.__cases
+
+    def __len__(self):
+        with self.__lock:
+            return len(self.__cases)
+
+    def keys(self):
+        """:return: the cached keys, least recently used first"""
+        with self.__lock:
+            return list(self.__cases)
+
+    def get(self, key):
+        """:return: the cached case, marked as most recently used, or None"""
+        with self.__lock:
+            if key not in self.__cases:
+                return None
+            self.__cases.move_to_end(key)
+            return self.__cases[key]
+
+    def put(self, key, case):
+        """
+        Adds the case as most recently used and evicts least recently used cases to stay within max_size.
+        :return: list of the evicted cases, so their resources can be released
+        """
+        with self.__lock:
+            self.__cases[key] = case
+            self.__cases.move_to_end(key)
+
+            sizes = {k: self.size_of(c) for k, c in self.__cases.items()}
+            total = sum(sizes.values())
+            evicted = []
+            for k in list(self.__cases):
+                if total <= self.max_size or k == key:
+                    break
+                total -= sizes[k]
+                evicted.append(self.__cases.pop(k))
+            return evicted
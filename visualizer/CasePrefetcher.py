@@ -0,0 +1,61 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PipelineStats import resident_memory_mb
+
+
+class CasePrefetcher:
+    """
+    Loads the cases a review is expected to visit next on background threads while the current case is inspected.
+    At most max_cases prefetched cases are kept, no prefetch starts while the process uses more than max_memory_mb of
+    resident memory, and prefetched cases which are no longer expected are dropped.
+    """
+
+    def __init__(self, load, workers, max_cases, max_memory_mb):
+        """
+        :param load: callable loading a case, e.g. vtkUtils.load_case, runs on a worker thread
+        :param workers: number of cases loaded at the same time
+        """
+        self.load = load
+        self.max_cases = max_cases
+        self.max_memory_mb = max_memory_mb
+        self.__executor = ThreadPoolExecutor(max_workers=workers)
+        self.__futures = {}  # case -> Future of the loaded case
+        self.__lock = threading.Lock()
+
+    def prefetch(self, cases):
+        """
+        :param cases: the cases expected next, most likely first
+        """
+        with self.__lock:
+            for case in list(self.__futures):
+                if case not in cases[:self.max_cases]:
+                    self.__futures.pop(case).cancel()  # a load which already started finishes, its result is dropped
+            for case in cases[:self.max_cases]:
+                if case in self.__futures:
+                    continue
+                memory_mb = resident_memory_mb()
+                if memory_mb is not None and memory_mb > self.max_memory_mb:
+                    break
+                self.__futures[case] = self.__executor.submit(self.load, case)
+
+    def take(self, case):
+        """
+        :return: the prefetched case, waiting for it if it is still loading, or None if it was not prefetched or
+                 failed to load
+        """
+        with self.__lock:
+            future = self.__futures.pop(case, None)
+        if future is None or future.cancelled():
+            return None
+        try:
+            return future.result()
+        except Exception:
+            return None  # the caller loads the case again and gets the error
+
+    def shutdown(self):
+        with self.__lock:
+            for future in self.__futures.values():
+                future.cancel()
+            self.__futures = {}
+        self.__executor.shutdown(wait=True)
@@ -0,0 +1,67 @@
+import numpy as np
+import PyQt5.QtWidgets as QtWidgets
+import PyQt5.QtCore as Qt
+import PyQt5.QtGui as QtGui
+
+
+class HistogramWidget(QtWidgets.QWidget):
+    """
+    Draws the intensity histogram of a volume (log scaled counts) with markers at the current and the automatic
+    threshold. Clicking the histogram picks the intensity under the cursor through `value_selected`, so a threshold
+    can be chosen in one step instead of scrubbing the picker.
+    """
+    value_selected = Qt.pyqtSignal(float)
+
+    def __init__(self, parent=None):
+        QtWidgets.QWidget.__init__(self, parent)
+        self.counts, self.edges = None, None
+        self.value, self.auto_value = None, None
+        self.setMinimumHeight(48)
+        self.setSizePolicy(QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Fixed)
+        self.setCursor(Qt.Qt.CrossCursor)
+
+    def set_histogram(self, histogram, auto_value=None):
+        """
+        :param histogram: (counts, edges), see volume_histogram
+        :param auto_value: the automatic threshold, drawn as a dashed marker
+        """
+        self.counts, self.edges = histogram
+        self.auto_value = auto_value
+        self.update()
+
+    def set_value(self, value):
+        self.value = value
+        self.update()
+
+    def value_at(self, x):
+        """:return: the intensity at widget x coordinate x"""
+        fraction = min(max(x / max(self.width() - 1, 1), 0.0), 1.0)
+        return float(self.edges[0] + fraction * (self.edges[-1] - self.edges[0]))
+
+    def x_of(self, value):
+        return (value - self.edges[0]) / (self.edges[-1] - self.edges[0]) * (self.width() - 1)
+
+    def paintEvent(self, event):
+        painter = QtGui.QPainter(self)
+        painter.fillRect(self.rect(), QtGui.QColor(40, 40, 40))
+        if self.counts is None:
+            return
+
+        heights = np.log1p(self.counts)
+        heights = heights / heights.max() if heights.max() else heights
+        bar_width = self.width() / float(len(heights))
+        for i, height in enumerate(heights):
+            bar_height = height * (self.height() - 2)
+            painter.fillRect(Qt.QRectF(i * bar_width, self.height() - bar_height, bar_width + 1, bar_height),
+                             QtGui.QColor(170, 170, 170))
+
+        for value, color, style in ((self.auto_value, QtGui.QColor(90, 160, 255), Qt.Qt.DashLine),
+                                    (self.value, QtGui.QColor(255, 80, 80), Qt.Qt.SolidLine)):
+            if value is not None:
+                painter.setPen(QtGui.QPen(color, 2, style))
+                x = self.x_of(value)
+                painter.drawLine(Qt.QPointF(x, 0), Qt.QPointF(x, self.height()))
+
+    def mousePressEvent(self, event):
+        if self.counts is not None and event.button() == Qt.Qt.LeftButton:
+            self.value_selected.emit(self.value_at(event.x()))
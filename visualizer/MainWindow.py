@@ -1,12 +1,16 @@
-import math
-import time
 import os
 
 import PyQt5.QtWidgets as QtWidgets
 import PyQt5.QtCore as Qt
+import PyQt5.QtGui as QtGui
 from vtk.qt.QVTKRenderWindowInteractor import QVTKRenderWindowInteractor
 from vtkUtils import *
 from config import *
+from PipelineWorker import *
+from CaseCache import *
+from CasePrefetcher import *
+from HistogramWidget import *
+from RenderScheduler import *
 
 
 class MainWindow(QtWidgets.QMainWindow, QtWidgets.QApplication):
@@ -15,28 +19,67 @@ class MainWindow(QtWidgets.QMainWindow, QtWidgets.QApplication):
         QtWidgets.QMainWindow.__init__(self, None)
 
         # base setup
-        self.renderer, self.frame, self.vtk_widget, self.interactor, self.render_window = self.setup()
-        self.brain, self.mask = setup_brain(self.renderer, self.app.BRAIN_FILE), setup_mask(self.renderer,
-                                                                                            self.app.MASK_FILE)
-
-        # setup brain projection and slicer
-        self.brain_image_prop = setup_projection(self.brain, self.renderer)
-        self.brain_slicer_props = setup_slicer(self.renderer, self.brain)  # causing issues with rotation
+        self.frame, self.vtk_widget, self.interactor, self.render_window = self.setup()
+
+        # every case is loaded into its own renderer (with brain projection and slicer), recently viewed cases stay
+        # loaded in the case cache so switching back only swaps the renderer
+        images = case_images(self.app.BRAIN_FILE or ())  # one file per modality
+        self.cases = getattr(self.app, 'CASES', None) or [(os.path.basename(images[0]), images, self.app.MASK_FILE)]
+        self.case_cache = CaseCache(CASE_CACHE_SIZE, case_memory_size)
+        self.prefetcher = CasePrefetcher(load_case, PREFETCH_WORKERS, PREFETCH_CASES,
+                                         PREFETCH_MAX_MEMORY / 1024.0 ** 2)
+        self.case_idx, self.case_step = 0, 1  # the review direction, cases ahead of it are prefetched
+        self.renderer, self.brain, self.mask, self.brain_image_prop, self.brain_slicer_props = None, None, None, None, []
+        self.nii_case = None
+        self.set_case(0, self.get_case(0))
         self.slicer_widgets = []
+        self.object_group_box = None
+        self.case_list = None
+        self.render_suspended = False
+
+        # render requests of the handlers and the interactor are coalesced into at most one frame per display interval,
+        # while the camera moves or a slice is dragged large surfaces are drawn at reduced detail
+        self.render_scheduler = RenderScheduler(self.render_window.Render, RENDER_FRAME_RATE)
+        self.interactive_detail = False
+        self.setup_interaction()
+
+        # surface pipelines run on a worker thread, finished surfaces are swapped in by surfaces_ready
+        self.pipeline_worker = PipelineWorker()
+        self.pipeline_worker.finished.connect(self.surfaces_ready)
+        self.pipeline_worker.failed.connect(self.job_failed)
+        self.pending_modality = None  # (modality, brain NiiObject) being read on the worker, see brain_modality_vc
+
+        # while the threshold changes a coarse preview is shown, the full surface follows once the value settles
+        self.preview_timer = Qt.QTimer()
+        self.preview_timer.setSingleShot(True)
+        self.preview_timer.setInterval(PREVIEW_SETTLE_DELAY)
+        self.preview_timer.timeout.connect(self.update_brain_surface)
 
         # brain pickers
         self.brain_threshold_sp = self.create_new_picker(self.brain.scalar_range[1], self.brain.scalar_range[0], 5.0,
-                                                         sum(self.brain.scalar_range) / 2, self.brain_threshold_vc)
+                                                         self.brain.labels[0].value, self.brain_threshold_vc)
+        self.brain_auto_threshold_bt = QtWidgets.QPushButton("Auto")
+        self.brain_auto_threshold_bt.clicked.connect(self.brain_auto_threshold_clicked)
+        self.brain_histogram = HistogramWidget()
+        self.brain_histogram.value_selected.connect(self.brain_threshold_sp.setValue)
+        self.show_brain_histogram()
         self.brain_opacity_sp = self.create_new_picker(1.0, 0.0, 0.1, BRAIN_OPACITY, self.brain_opacity_vc)
-        self.brain_smoothness_sp = self.create_new_picker(1000, 100, 100, BRAIN_SMOOTHNESS, self.brain_smoothness_vc)
-        self.brain_lut_sp = self.create_new_picker(3.0, 0.0, 0.1, 2.0, self.lut_value_changed)
+        self.brain_smoothness_sp = self.create_new_picker(SMOOTHNESS_RANGE[1], SMOOTHNESS_RANGE[0], SMOOTHNESS_RANGE[2],
+                                                          BRAIN_SMOOTHNESS, self.brain_smoothness_vc)
+        self.brain_lut_sp = self.create_new_picker(3.0, 0.0, 0.1, BRAIN_IMAGE_INTENSITY, self.lut_value_changed)
         self.brain_projection_cb = self.add_brain_projection()
         self.brain_slicer_cb = self.add_brain_slicer()
+        self.brain_volume_cb = self.add_volume_rendering(self.brain_volume_vc)
+        self.brain_modality_cb = QtWidgets.QComboBox()
+        self.fill_modality_list()
+        self.brain_modality_cb.currentIndexChanged.connect(self.brain_modality_vc)
 
         # mask pickers
         self.mask_opacity_sp = self.create_new_picker(1.0, 0.0, 0.1, MASK_OPACITY, self.mask_opacity_vc)
-        self.mask_smoothness_sp = self.create_new_picker(1000, 100, 100, MASK_SMOOTHNESS, self.mask_smoothness_vc)
-        self.mask_label_cbs = []
+        self.mask_smoothness_sp = self.create_new_picker(SMOOTHNESS_RANGE[1], SMOOTHNESS_RANGE[0], SMOOTHNESS_RANGE[2],
+                                                         MASK_SMOOTHNESS, self.mask_smoothness_vc)
+        self.mask_label_list = None
+        self.mask_volume_cb = self.add_volume_rendering(self.mask_volume_vc)
 
         # create grid for all widgets
         self.grid = QtWidgets.QGridLayout()
@@ -46,30 +89,41 @@ class MainWindow(QtWidgets.QMainWindow, QtWidgets.QApplication):
         self.add_brain_settings_widget()
         self.add_mask_settings_widget()
         self.add_views_widget()
+        if len(self.cases) > 1:
+            self.add_cases_widget()
+        self.stats_table = self.add_stats_widget()
+        self.refresh_stats()
+        self.label_overlap = None  # (reference mask file, overlap_metrics of the mask against it)
+        self.label_stats_table, self.label_reference_label = self.add_label_stats_widget()
+        self.refresh_label_stats()
+        self.show_triangle_report()
+        if VOLUME_RENDERING:
+            self.brain_volume_cb.setChecked(True)
+            self.mask_volume_cb.setChecked(True)
+            self.brain_volume_vc()
+            self.mask_volume_vc()
 
         #  set layout and show
-        self.render_window.Render()
+        self.render()
         self.setWindowTitle(APPLICATION_TITLE)
         self.frame.setLayout(self.grid)
         self.setCentralWidget(self.frame)
         self.set_axial_view()
         self.interactor.Initialize()
         self.show()
+        self.prefetch_cases()
 
     @staticmethod
     def setup():
         """
-        Create and setup the base vtk and Qt objects for the application
+        Create and setup the base vtk and Qt objects for the application, the renderer comes with the case (set_case)
         """
-        renderer = vtk.vtkRenderer()
         frame = QtWidgets.QFrame()
         vtk_widget = QVTKRenderWindowInteractor()
         interactor = vtk_widget.GetRenderWindow().GetInteractor()
         render_window = vtk_widget.GetRenderWindow()
 
         frame.setAutoFillBackground(True)
-        vtk_widget.GetRenderWindow().AddRenderer(renderer)
-        render_window.AddRenderer(renderer)
         interactor.SetRenderWindow(render_window)
         interactor.SetInteractorStyle(vtk.vtkInteractorStyleTrackballCamera())
 
@@ -80,58 +134,206 @@ class MainWindow(QtWidgets.QMainWindow, QtWidgets.QApplication):
         # renderer.UseDepthPeelingOn()
         # renderer.SetMaximumNumberOfPeels(2)
 
-        return renderer, frame, vtk_widget, interactor, render_window
+        return frame, vtk_widget, interactor, render_window
+
+    def get_case(self, case_idx):
+        """
+        :return: the NiiCase of a case of the session, taken from the case cache or the prefetcher, or loaded now
+        :raise IOError, ValueError: if the case cannot be loaded, see load_case
+        """
+        case = self.cases[case_idx]
+        return self.case_cache.get(case) or self.prefetcher.take(case) or load_case(case)
+
+    def set_case(self, case_idx, nii_case):
+        """
+        Makes a case of the session the current one.
+        :param nii_case: the case loaded by get_case
+        """
+        for evicted in self.case_cache.put(self.cases[case_idx], nii_case):
+            self.pipeline_worker.discard([key for key in self.pipeline_worker.keys() if key[0] == evicted.id])
+            release_case(evicted)
+
+        if self.renderer is not None:
+            self.render_window.RemoveRenderer(self.renderer)
+        self.render_window.AddRenderer(nii_case.renderer)
+        self.nii_case = nii_case
+        self.renderer, self.brain, self.mask = nii_case.renderer, nii_case.brain, nii_case.mask
+        self.brain_image_prop, self.brain_slicer_props = nii_case.brain_image_prop, nii_case.brain_slicer_props
+
+    def show_case(self, case_idx):
+        """
+        Switches the window to another case. Pipeline settings (threshold, smoothness) are taken from the case, as
+        they would cost a pipeline run, display settings (opacity, intensity, projection, slicer, volume rendering and
+        label colors) are applied to it.
+        """
+        if case_idx < 0:
+            return
+        try:
+            nii_case = self.get_case(case_idx)
+        except (IOError, ValueError) as e:  # keep reviewing the current case
+            QtWidgets.QMessageBox.warning(self, "Case", str(e))
+            self.case_list.blockSignals(True)
+            self.case_list.setCurrentRow(self.case_idx)
+            self.case_list.blockSignals(False)
+            return
+        self.settle_brain_preview()
+        self.end_interaction()
+        self.pending_modality = None  # a modality still being read belongs to the previous case
+        self.case_step = 1 if case_idx >= self.case_idx else -1
+        self.case_idx = case_idx
+        self.set_case(case_idx, nii_case)
+        self.render_suspended = True  # the handlers below would each render the new case
+
+        surface_label = (surface_labels(self.mask) or [None])[0]
+        pickers = [(self.brain_threshold_sp, self.brain.labels[0].value),
+                   (self.brain_smoothness_sp, self.brain.labels[0].smoother.GetNumberOfIterations()),
+                   (self.mask_smoothness_sp, surface_label.smoother.GetNumberOfIterations() if surface_label
+                    else self.mask_smoothness_sp.value())]
+        self.brain_threshold_sp.blockSignals(True)
+        self.brain_threshold_sp.setRange(self.brain.scalar_range[0], self.brain.scalar_range[1])
+        for picker, value in pickers:
+            picker.blockSignals(True)
+            picker.setValue(value)
+            picker.blockSignals(False)
+        self.show_brain_histogram()
+
+        # data extent is array [xmin, xmax, ymin, ymax, zmin, zmax), sliders are ordered axial, coronal, sagittal
+        for slice_widget, extent_index in zip(self.slicer_widgets, [5, 3, 1]):
+            slice_widget.blockSignals(True)
+            slice_widget.setRange(self.brain.extent[extent_index - 1], self.brain.extent[extent_index])
+            slice_widget.blockSignals(False)
+        self.axial_slice_changed()
+        self.coronal_slice_changed()
+        self.sagittal_slice_changed()
+
+        self.object_group_box.setTitle(self.case_title())
+        self.fill_modality_list()
+        self.fill_mask_label_list()
+        if self.brain.labels[0].property:
+            self.brain.labels[0].property.SetOpacity(round(self.brain_opacity_sp.value(), 2))
+        self.lut_value_changed()
+        self.brain_projection_vc()
+        self.brain_slicer_vc()
+        self.brain_volume_vc()
+        self.mask_volume_vc()
+        self.update_mask_appearance()
+        self.refresh_stats()
+        self.label_overlap = None
+        self.refresh_label_stats()
+        self.show_triangle_report()
+        self.render_suspended = False
+        self.render()
+        self.prefetch_cases()
+
+    def prefetch_cases(self):
+        """Prefetches the next PREFETCH_CASES cases in the review direction which are not loaded yet."""
+        upcoming = [self.case_idx + self.case_step * i for i in range(1, PREFETCH_CASES + 1)]
+        self.prefetcher.prefetch([self.cases[i] for i in upcoming
+                                  if 0 <= i < len(self.cases) and self.cases[i] not in self.case_cache])
+
+    def render(self):
+        if not self.render_suspended:
+            self.render_scheduler.request()
+
+    def setup_interaction(self):
+        """
+        Routes the renders of the interactor through the render scheduler and switches to interactive detail while the
+        camera moves. The interactor no longer renders on its own, its render requests arrive as RenderEvent.
+        """
+        self.interactor.EnableRenderOff()
+        self.interactor.AddObserver('RenderEvent', lambda obj, event: self.render())
+        if INTERACTIVE_FRAME_RATE:
+            self.interactor.SetDesiredUpdateRate(INTERACTIVE_FRAME_RATE)  # volume ray casting adapts its sampling
+        style = self.interactor.GetInteractorStyle()
+        style.AddObserver('StartInteractionEvent', self.start_interaction)
+        style.AddObserver('EndInteractionEvent', self.end_interaction)
+
+    def start_interaction(self, *args):
+        """
+        Draws the large surfaces at reduced detail during an interaction if the last full detail frame was slower than
+        INTERACTIVE_FRAME_RATE allows.
+        """
+        if self.interactive_detail or not INTERACTIVE_FRAME_RATE:
+            return
+        if self.renderer.GetLastRenderTimeInSeconds() > 1.0 / INTERACTIVE_FRAME_RATE:
+            self.interactive_detail = set_interactive_detail([self.brain, self.mask], True) > 0
+            self.render()
+
+    def end_interaction(self, *args):
+        if self.interactive_detail:
+            set_interactive_detail([self.brain, self.mask], False)
+            self.interactive_detail = False
+            self.render()
+
+    def show_next_case(self):
+        self.case_list.setCurrentRow(min(self.case_list.currentRow() + 1, len(self.cases) - 1))
+
+    def show_previous_case(self):
+        self.case_list.setCurrentRow(max(self.case_list.currentRow() - 1, 0))
 
     def lut_value_changed(self):
-        lut = self.brain.image_mapper.GetLookupTable()
-        new_lut_value = self.brain_lut_sp.value()
-        lut.SetValueRange(0.0, new_lut_value)
-        lut.Build()
-        self.brain.image_mapper.SetLookupTable(lut)
-        self.brain.image_mapper.Update()
-        self.render_window.Render()
+        image_properties = [self.brain_image_prop] + [prop.GetProperty() for prop in self.brain_slicer_props]
+        set_image_intensity(image_properties, self.brain.scalar_range, self.brain_lut_sp.value())
+        self.update_brain_volume()
+        self.render()
 
     def add_brain_slicer(self):
         slicer_cb = QtWidgets.QCheckBox("Slicer")
         slicer_cb.clicked.connect(self.brain_slicer_vc)
         return slicer_cb
 
+    @staticmethod
+    def add_volume_rendering(value_changed_func):
+        volume_cb = QtWidgets.QCheckBox("Volume Rendering")
+        volume_cb.clicked.connect(value_changed_func)
+        return volume_cb
+
+    def case_title(self):
+        base_brain_file = os.path.basename(self.brain.file)
+        base_mask_file = os.path.basename(self.mask.file)
+        return "Brain: {0} (min: {1:.2f}, max: {2:.2f}, loaded in {3:.2f}s)        " \
+               "Mask: {4} (loaded in {5:.2f}s)".format(base_brain_file,
+                                                      self.brain.scalar_range[0],
+                                                      self.brain.scalar_range[1],
+                                                      self.brain.load_time,
+                                                      base_mask_file,
+                                                      self.mask.load_time)
+
     def add_vtk_window_widget(self):
-        base_brain_file = os.path.basename(self.app.BRAIN_FILE)
-        base_mask_file = os.path.basename(self.app.MASK_FILE)
-        object_title = "Brain: {0} (min: {1:.2f}, max: {2:.2f})        Mask: {3}".format(base_brain_file,
-                                                                                         self.brain.scalar_range[0],
-                                                                                         self.brain.scalar_range[1],
-                                                                                         base_mask_file)
-        object_group_box = QtWidgets.QGroupBox(object_title)
+        self.object_group_box = QtWidgets.QGroupBox(self.case_title())
         object_layout = QtWidgets.QVBoxLayout()
         object_layout.addWidget(self.vtk_widget)
-        object_group_box.setLayout(object_layout)
-        self.grid.addWidget(object_group_box, 0, 2, 5, 5)
+        self.object_group_box.setLayout(object_layout)
+        self.grid.addWidget(self.object_group_box, 0, 2, 5, 5)
         # must manually set column width for vtk_widget to maintain height:width ratio
         self.grid.setColumnMinimumWidth(2, 700)
 
     def add_brain_settings_widget(self):
         brain_group_box = QtWidgets.QGroupBox("Brain Settings")
         brain_group_layout = QtWidgets.QGridLayout()
-        brain_group_layout.addWidget(QtWidgets.QLabel("Brain Threshold"), 0, 0)
-        brain_group_layout.addWidget(QtWidgets.QLabel("Brain Opacity"), 1, 0)
-        brain_group_layout.addWidget(QtWidgets.QLabel("Brain Smoothness"), 2, 0)
-        brain_group_layout.addWidget(QtWidgets.QLabel("Image Intensity"), 3, 0)
-        brain_group_layout.addWidget(self.brain_threshold_sp, 0, 1, 1, 2)
-        brain_group_layout.addWidget(self.brain_opacity_sp, 1, 1, 1, 2)
-        brain_group_layout.addWidget(self.brain_smoothness_sp, 2, 1, 1, 2)
-        brain_group_layout.addWidget(self.brain_lut_sp, 3, 1, 1, 2)
-        brain_group_layout.addWidget(self.brain_projection_cb, 4, 0)
-        brain_group_layout.addWidget(self.brain_slicer_cb, 4, 1)
-        brain_group_layout.addWidget(self.create_new_separator(), 5, 0, 1, 3)
-        brain_group_layout.addWidget(QtWidgets.QLabel("Axial Slice"), 6, 0)
-        brain_group_layout.addWidget(QtWidgets.QLabel("Coronal Slice"), 7, 0)
-        brain_group_layout.addWidget(QtWidgets.QLabel("Sagittal Slice"), 8, 0)
+        brain_group_layout.addWidget(QtWidgets.QLabel("Modality"), 0, 0)
+        brain_group_layout.addWidget(QtWidgets.QLabel("Brain Threshold"), 1, 0)
+        brain_group_layout.addWidget(QtWidgets.QLabel("Brain Opacity"), 3, 0)
+        brain_group_layout.addWidget(QtWidgets.QLabel("Brain Smoothness"), 4, 0)
+        brain_group_layout.addWidget(QtWidgets.QLabel("Image Intensity"), 5, 0)
+        brain_group_layout.addWidget(self.brain_modality_cb, 0, 1, 1, 2)
+        brain_group_layout.addWidget(self.brain_threshold_sp, 1, 1)
+        brain_group_layout.addWidget(self.brain_auto_threshold_bt, 1, 2)
+        brain_group_layout.addWidget(self.brain_histogram, 2, 0, 1, 3)
+        brain_group_layout.addWidget(self.brain_opacity_sp, 3, 1, 1, 2)
+        brain_group_layout.addWidget(self.brain_smoothness_sp, 4, 1, 1, 2)
+        brain_group_layout.addWidget(self.brain_lut_sp, 5, 1, 1, 2)
+        brain_group_layout.addWidget(self.brain_projection_cb, 6, 0)
+        brain_group_layout.addWidget(self.brain_slicer_cb, 6, 1)
+        brain_group_layout.addWidget(self.brain_volume_cb, 6, 2)
+        brain_group_layout.addWidget(self.create_new_separator(), 7, 0, 1, 3)
+        brain_group_layout.addWidget(QtWidgets.QLabel("Axial Slice"), 8, 0)
+        brain_group_layout.addWidget(QtWidgets.QLabel("Coronal Slice"), 9, 0)
+        brain_group_layout.addWidget(QtWidgets.QLabel("Sagittal Slice"), 10, 0)
 
         # order is important
         slicer_funcs = [self.axial_slice_changed, self.coronal_slice_changed, self.sagittal_slice_changed]
-        current_label_row = 6
+        current_label_row = 8
         # data extent is array [xmin, xmax, ymin, ymax, zmin, zmax)
         # we want all the max values for the range
         extent_index = 5
@@ -141,8 +343,10 @@ class MainWindow(QtWidgets.QMainWindow, QtWidgets.QApplication):
             self.slicer_widgets.append(slice_widget)
             brain_group_layout.addWidget(slice_widget, current_label_row, 1, 1, 2)
             slice_widget.valueChanged.connect(func)
+            slice_widget.sliderPressed.connect(self.start_interaction)
+            slice_widget.sliderReleased.connect(self.end_interaction)
             slice_widget.setRange(self.brain.extent[extent_index - 1], self.brain.extent[extent_index])
-            slice_widget.setValue(self.brain.extent[extent_index] / 2)
+            slice_widget.setValue(int(self.brain.extent[extent_index] / 2))
             current_label_row += 1
             extent_index -= 2
 
@@ -153,19 +357,19 @@ class MainWindow(QtWidgets.QMainWindow, QtWidgets.QApplication):
         pos = self.slicer_widgets[0].value()
         self.brain_slicer_props[0].SetDisplayExtent(self.brain.extent[0], self.brain.extent[1], self.brain.extent[2],
                                                     self.brain.extent[3], pos, pos)
-        self.render_window.Render()
+        self.render()
 
     def coronal_slice_changed(self):
         pos = self.slicer_widgets[1].value()
         self.brain_slicer_props[1].SetDisplayExtent(self.brain.extent[0], self.brain.extent[1], pos, pos,
                                                     self.brain.extent[4], self.brain.extent[5])
-        self.render_window.Render()
+        self.render()
 
     def sagittal_slice_changed(self):
         pos = self.slicer_widgets[2].value()
         self.brain_slicer_props[2].SetDisplayExtent(pos, pos, self.brain.extent[2], self.brain.extent[3],
                                                     self.brain.extent[4], self.brain.extent[5])
-        self.render_window.Render()
+        self.render()
 
     def add_mask_settings_widget(self):
         mask_settings_group_box = QtWidgets.QGroupBox("Mask Settings")
@@ -177,29 +381,36 @@ class MainWindow(QtWidgets.QMainWindow, QtWidgets.QApplication):
         mask_multi_color_radio = QtWidgets.QRadioButton("Multi Color")
         mask_multi_color_radio.setChecked(True)
         mask_multi_color_radio.clicked.connect(self.mask_multi_color_radio_checked)
-        mask_single_color_radio = QtWidgets.QRadioButton("Single Color")
-        mask_single_color_radio.clicked.connect(self.mask_single_color_radio_checked)
+        self.mask_single_color_radio = QtWidgets.QRadioButton("Single Color")
+        self.mask_single_color_radio.clicked.connect(self.mask_single_color_radio_checked)
         mask_settings_layout.addWidget(mask_multi_color_radio, 2, 0)
-        mask_settings_layout.addWidget(mask_single_color_radio, 2, 1)
-        mask_settings_layout.addWidget(self.create_new_separator(), 3, 0, 1, 2)
+        mask_settings_layout.addWidget(self.mask_single_color_radio, 2, 1)
+        mask_settings_layout.addWidget(self.mask_volume_cb, 3, 0)
+        mask_settings_layout.addWidget(self.create_new_separator(), 4, 0, 1, 2)
 
-        self.mask_label_cbs = []
-        c_col, c_row = 0, 4  # c_row must always be (+1) of last row
-        for i in range(1, 11):
-            self.mask_label_cbs.append(QtWidgets.QCheckBox("Label {}".format(i)))
-            mask_settings_layout.addWidget(self.mask_label_cbs[i - 1], c_row, c_col)
-            c_row = c_row + 1 if c_col == 1 else c_row
-            c_col = 0 if c_col == 1 else 1
+        # one checkable row per label present in the mask, scrolls for parcellations with hundreds of labels
+        self.mask_label_list = QtWidgets.QListWidget()
+        self.mask_label_list.setUniformItemSizes(True)
+        self.fill_mask_label_list()
+        self.mask_label_list.itemChanged.connect(self.mask_label_checked)
+        mask_settings_layout.addWidget(self.mask_label_list, 5, 0, 1, 2)
 
         mask_settings_group_box.setLayout(mask_settings_layout)
         self.grid.addWidget(mask_settings_group_box, 1, 0, 2, 2)
 
-        for i, cb in enumerate(self.mask_label_cbs):
-            if i < len(self.mask.labels) and self.mask.labels[i].actor:
-                cb.setChecked(True)
-                cb.clicked.connect(self.mask_label_checked)
+    def fill_mask_label_list(self):
+        self.mask_label_list.blockSignals(True)
+        self.mask_label_list.clear()
+        for label in self.mask.labels:
+            item = QtWidgets.QListWidgetItem(self.create_color_icon(label.color), "Label {}".format(label.value))
+            if self.mask.compact_label is not None or label.actor:
+                item.setFlags(Qt.Qt.ItemIsEnabled | Qt.Qt.ItemIsUserCheckable)
+                item.setCheckState(Qt.Qt.Checked)
             else:
-                cb.setDisabled(True)
+                item.setFlags(Qt.Qt.ItemIsUserCheckable)  # labels without data are disabled
+                item.setCheckState(Qt.Qt.Unchecked)
+            self.mask_label_list.addItem(item)
+        self.mask_label_list.blockSignals(False)
 
     def add_views_widget(self):
         axial_view = QtWidgets.QPushButton("Axial")
@@ -216,6 +427,119 @@ class MainWindow(QtWidgets.QMainWindow, QtWidgets.QApplication):
         coronal_view.clicked.connect(self.set_coronal_view)
         sagittal_view.clicked.connect(self.set_sagittal_view)
 
+    def add_cases_widget(self):
+        cases_box = QtWidgets.QGroupBox("Cases")
+        cases_layout = QtWidgets.QGridLayout()
+        self.case_list = QtWidgets.QListWidget()
+        self.case_list.addItems([name for name, _, _ in self.cases])
+        self.case_list.setCurrentRow(0)
+        self.case_list.currentRowChanged.connect(self.show_case)
+        previous_case = QtWidgets.QPushButton("Previous")
+        previous_case.clicked.connect(self.show_previous_case)
+        next_case = QtWidgets.QPushButton("Next")
+        next_case.clicked.connect(self.show_next_case)
+        cases_layout.addWidget(self.case_list, 0, 0, 1, 2)
+        cases_layout.addWidget(previous_case, 1, 0)
+        cases_layout.addWidget(next_case, 1, 1)
+        cases_box.setLayout(cases_layout)
+        self.grid.addWidget(cases_box, 0, 7, 5, 1)
+
+    def add_stats_widget(self):
+        stats_box = QtWidgets.QGroupBox("Pipeline Stats")
+        stats_layout = QtWidgets.QVBoxLayout()
+        stats_table = QtWidgets.QTableWidget(0, 8)
+        stats_table.setHorizontalHeaderLabels(["Label", "Stage", "Runs", "Last (s)", "Total (s)", "Cells",
+                                               "Output (MB)", "Resident (MB)"])
+        stats_table.verticalHeader().setVisible(False)
+        stats_table.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        stats_table.horizontalHeader().setSectionResizeMode(QtWidgets.QHeaderView.Stretch)
+        stats_table.setMaximumHeight(150)
+        stats_layout.addWidget(stats_table)
+        stats_box.setLayout(stats_layout)
+        self.grid.addWidget(stats_box, 5, 0, 1, 8)
+        return stats_table
+
+    def refresh_stats(self):
+        summary = pipeline_stats.summary()
+        self.stats_table.setRowCount(len(summary))
+        for row, entry in enumerate(summary):
+            memory_mb = entry['memory_kb'] / 1024.0 if entry['memory_kb'] is not None else None
+            values = [entry['label'], entry['stage'], entry['runs'], entry['last_seconds'], entry['total_seconds'],
+                      entry['cells'], memory_mb, entry['rss_mb']]
+            for column, value in enumerate(values):
+                text = '{:.3f}'.format(value) if isinstance(value, float) else '' if value is None else str(value)
+                self.stats_table.setItem(row, column, QtWidgets.QTableWidgetItem(text))
+
+    def add_label_stats_widget(self):
+        label_stats_box = QtWidgets.QGroupBox("Label Statistics")
+        label_stats_layout = QtWidgets.QGridLayout()
+        label_stats_table = QtWidgets.QTableWidget(0, 7)
+        label_stats_table.setHorizontalHeaderLabels(["Label", "Voxels", "Volume (mL)", "Centroid (mm)", "Dice",
+                                                     "Jaccard", "Hausdorff (mm)"])
+        label_stats_table.verticalHeader().setVisible(False)
+        label_stats_table.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        label_stats_table.horizontalHeader().setSectionResizeMode(QtWidgets.QHeaderView.Stretch)
+        label_stats_table.setMaximumHeight(150)
+        compare_bt = QtWidgets.QPushButton("Compare...")
+        compare_bt.setToolTip("Compare the mask with a reference mask of the same case")
+        compare_bt.clicked.connect(self.compare_mask_clicked)
+        reference_label = QtWidgets.QLabel()
+        label_stats_layout.addWidget(label_stats_table, 0, 0, 1, 2)
+        label_stats_layout.addWidget(compare_bt, 1, 0)
+        label_stats_layout.addWidget(reference_label, 1, 1)
+        label_stats_layout.setColumnStretch(1, 1)
+        label_stats_box.setLayout(label_stats_layout)
+        self.grid.addWidget(label_stats_box, 6, 0, 1, 8)
+        return label_stats_table, reference_label
+
+    def refresh_label_stats(self):
+        """
+        Lists the voxels, volume and centroid of every label of the mask (from its label index, no pass over the
+        voxels), and the overlap metrics of each label against the reference mask if one was chosen.
+        """
+        statistics = label_statistics(self.mask.reader.GetOutput(), self.mask.label_index)
+        reference_file, metrics = self.label_overlap or (None, {})
+        labels = sorted(set(statistics) | set(metrics))
+        self.label_stats_table.setRowCount(len(labels))
+        for row, label in enumerate(labels):
+            entry, overlap = statistics.get(label), metrics.get(label, {})
+            values = [label, entry['count'] if entry else 0, entry['volume'] / 1000.0 if entry else 0.0,
+                      '({:.1f}, {:.1f}, {:.1f})'.format(*entry['centroid']) if entry else None,
+                      overlap.get('dice'), overlap.get('jaccard'), overlap.get('hausdorff')]
+            for column, value in enumerate(values):
+                text = '{:.3f}'.format(value) if isinstance(value, float) else '' if value is None else str(value)
+                self.label_stats_table.setItem(row, column, QtWidgets.QTableWidgetItem(text))
+        self.label_reference_label.setText("Reference: " + os.path.basename(reference_file) if reference_file else "")
+
+    def compare_mask_clicked(self):
+        reference_file, _ = QtWidgets.QFileDialog.getOpenFileName(self, "Reference Mask",
+                                                                  os.path.dirname(self.mask.file),
+                                                                  "NIfTI (*.nii.gz *.nii)")
+        if not reference_file:
+            return
+        try:
+            reference = read_volume(reference_file)
+            metrics = overlap_metrics(reference.GetOutput(), self.mask.reader.GetOutput(),
+                                      prediction_index=self.mask.label_index)
+        except (IOError, ValueError) as e:
+            QtWidgets.QMessageBox.warning(self, "Reference Mask", str(e))
+            return
+        self.label_overlap = (reference_file, metrics)
+        self.refresh_label_stats()
+
+    def show_triangle_report(self):
+        """
+        Shows the number of rendered triangles (and the triangle budget) in the status bar, per surface in its tooltip.
+        """
+        report = triangle_report([self.brain, self.mask])
+        message = "Triangles: {:,}".format(sum(entry['triangles'] for entry in report))
+        if TRIANGLE_BUDGET is not None:
+            message += " (budget {:,})".format(TRIANGLE_BUDGET)
+        self.statusBar().showMessage(message)
+        self.statusBar().setToolTip("\n".join("{}: {:,}".format(entry['label'], entry['triangles']) +
+                                              (" of {:,}".format(entry['target']) if entry['target'] is not None
+                                               else "") for entry in report))
+
     @staticmethod
     def create_new_picker(max_value, min_value, step, picker_value, value_changed_func):
         if isinstance(max_value, int):
@@ -235,31 +559,79 @@ class MainWindow(QtWidgets.QMainWindow, QtWidgets.QApplication):
         projection_cb.clicked.connect(self.brain_projection_vc)
         return projection_cb
 
+    @staticmethod
+    def create_color_icon(color):
+        pixmap = QtGui.QPixmap(12, 12)
+        pixmap.fill(QtGui.QColor.fromRgbF(color[0], color[1], color[2]))
+        return QtGui.QIcon(pixmap)
+
+    def update_mask_appearance(self):
+        """
+        Applies the label list, color mode and opacity picker to every mask label.
+        """
+        opacity = round(self.mask_opacity_sp.value(), 2)
+        single_color = self.mask_single_color_radio.isChecked()
+        appearance = []
+        for i, label in enumerate(self.mask.labels):
+            checked = self.mask_label_list.item(i).checkState() == Qt.Qt.Checked
+            appearance.append((label.value, MASK_COLORS[0] if single_color else label.color, opacity if checked else 0))
+            set_label_appearance(self.mask, label, *appearance[-1][1:])
+        set_mask_transfer_functions(self.mask, appearance)
+        if self.mask.compact_label is not None:
+            self.mask.compact_label.mapper.GetLookupTable().Modified()
+        self.render()
+
     def mask_label_checked(self):
-        for i, cb in enumerate(self.mask_label_cbs):
-            if cb.isChecked():
-                self.mask.labels[i].property.SetOpacity(self.mask_opacity_sp.value())
-            elif cb.isEnabled():  # labels without data are disabled
-                self.mask.labels[i].property.SetOpacity(0)
-        self.render_window.Render()
+        self.update_mask_appearance()
 
     def mask_single_color_radio_checked(self):
-        for label in self.mask.labels:
-            if label.property:
-                label.property.SetColor(MASK_COLORS[0])
-        self.render_window.Render()
+        self.update_mask_appearance()
 
     def mask_multi_color_radio_checked(self):
-        for label in self.mask.labels:
-            if label.property:
-                label.property.SetColor(label.color)
-        self.render_window.Render()
+        self.update_mask_appearance()
+
+    def fill_modality_list(self):
+        self.brain_modality_cb.blockSignals(True)
+        self.brain_modality_cb.clear()
+        self.brain_modality_cb.addItems(list(self.nii_case.modalities))
+        self.brain_modality_cb.setCurrentText(self.nii_case.modality)
+        self.brain_modality_cb.setEnabled(len(self.nii_case.modalities) > 1)
+        self.brain_modality_cb.blockSignals(False)
+
+    def brain_modality_vc(self):
+        """
+        Shows another modality of the current case. The mask surfaces are kept, a modality shown for the first time
+        is read and its brain surface computed on the pipeline worker, the current brain stays on screen until
+        surfaces_ready shows the new one.
+        """
+        self.settle_brain_preview()
+        modality = self.brain_modality_cb.currentText()
+        self.pending_modality = None
+        if modality in self.nii_case.brains:
+            self.show_modality(modality)
+            return
+
+        brain = NiiObject()
+        brain.file = self.nii_case.modalities[modality]
+        self.pending_modality = modality, brain
+
+        def job():
+            load_brain(brain, compute_surfaces=False)
+            label = brain.labels[0]
+            return [(label, load_surface(brain, label) if label.actor else None)]
+
+        self.pipeline_worker.submit(self.job_key('modality'), job)
+
+    def show_modality(self, modality, brain=None):
+        """:param brain: the brain of a modality read on the pipeline worker, see set_modality"""
+        set_modality(self.nii_case, modality, brain=brain)
+        self.show_case(self.case_idx)  # syncs the pickers with the new brain and applies the display settings
 
     def brain_projection_vc(self):
         projection_checked = self.brain_projection_cb.isChecked()
         self.brain_slicer_cb.setDisabled(projection_checked)  # disable slicer checkbox, cant use both at same time
         self.brain_image_prop.SetOpacity(projection_checked)
-        self.render_window.Render()
+        self.render()
 
     def brain_slicer_vc(self):
         slicer_checked = self.brain_slicer_cb.isChecked()
@@ -270,69 +642,173 @@ class MainWindow(QtWidgets.QMainWindow, QtWidgets.QApplication):
         self.brain_projection_cb.setDisabled(slicer_checked)  # disable projection checkbox, cant use both at same time
         for prop in self.brain_slicer_props:
             prop.GetProperty().SetOpacity(slicer_checked)
-        self.render_window.Render()
+        self.render()
+
+    def brain_volume_vc(self):
+        volume_checked = self.brain_volume_cb.isChecked()
+        self.brain.volume.SetVisibility(volume_checked)
+        if self.brain.labels[0].actor:
+            self.brain.labels[0].actor.SetVisibility(not volume_checked)
+        if volume_checked:
+            self.settle_brain_preview()
+            self.update_brain_volume()
+        elif self.brain.labels[0].value != self.brain_threshold_sp.value() or self.brain.labels[0].preview_showing:
+            self.update_brain_surface()  # the threshold changed while the volume was shown, or a preview landed
+        self.render()
+
+    def mask_volume_vc(self):
+        volume_checked = self.mask_volume_cb.isChecked()
+        self.mask.volume.SetVisibility(volume_checked)
+        for label in surface_labels(self.mask):
+            label.actor.SetVisibility(not volume_checked)
+        self.render()
+
+    def update_brain_volume(self):
+        opacity = round(self.brain_opacity_sp.value(), 2)
+        set_brain_transfer_functions(self.brain, self.brain_threshold_sp.value(), opacity, self.brain_lut_sp.value())
 
     def brain_opacity_vc(self):
         opacity = round(self.brain_opacity_sp.value(), 2)
         self.brain.labels[0].property.SetOpacity(opacity)
-        self.render_window.Render()
+        self.update_brain_volume()
+        self.render()
+
+    def show_brain_histogram(self):
+        self.brain_histogram.set_histogram(self.brain.histogram, initial_threshold(self.brain))
+        self.brain_histogram.set_value(self.brain_threshold_sp.value())
+
+    def brain_auto_threshold_clicked(self):
+        self.brain_threshold_sp.setValue(initial_threshold(self.brain))
 
     def brain_threshold_vc(self):
-        self.process_changes()
-        threshold = self.brain_threshold_sp.value()
-        self.brain.labels[0].extractor.SetValue(0, threshold)
-        self.render_window.Render()
+        self.brain_histogram.set_value(self.brain_threshold_sp.value())
+        if self.brain_volume_cb.isChecked():  # only the transfer functions change
+            self.update_brain_volume()
+            self.render()
+        elif PROGRESSIVE_PREVIEW:
+            self.update_brain_preview()
+            self.preview_timer.start()  # restarts the settle delay on every change
+        else:
+            self.update_brain_surface()
+
+    def settle_brain_preview(self):
+        """Computes the full resolution brain surface right away if the settle delay of a preview is still running."""
+        if self.preview_timer.isActive():
+            self.preview_timer.stop()
+            self.update_brain_surface()
 
     def brain_smoothness_vc(self):
-        self.process_changes()
-        smoothness = self.brain_smoothness_sp.value()
-        self.brain.labels[0].smoother.SetNumberOfIterations(smoothness)
-        self.render_window.Render()
+        self.preview_timer.stop()
+        self.update_brain_surface()
 
     def mask_opacity_vc(self):
-        opacity = round(self.mask_opacity_sp.value(), 2)
-        for i, label in enumerate(self.mask.labels):
-            if label.property and self.mask_label_cbs[i].isChecked():
-                label.property.SetOpacity(opacity)
-        self.render_window.Render()
+        self.update_mask_appearance()
 
     def mask_smoothness_vc(self):
-        self.process_changes()
+        self.update_mask_surfaces()
+
+    def update_brain_surface(self):
+        """
+        Recomputes the brain surface on the pipeline worker. The job carries every brain pipeline parameter, since it
+        cancels any brain job which has not finished yet.
+        """
+        brain, label = self.brain, self.brain.labels[0]
+        threshold = self.brain_threshold_sp.value()
+        smoothness = self.brain_smoothness_sp.value()
+
+        label.value = threshold  # the threshold of the full resolution surface, also while its job is pending
+
+        def job():
+            label.extractor.SetValue(0, threshold)
+            label.smoother.SetNumberOfIterations(smoothness)
+            return [(label, load_surface(brain, label))]
+
+        self.pipeline_worker.submit(self.job_key('brain', self.nii_case.modality), job, surface_filters(label))
+
+    def update_brain_preview(self):
+        """
+        Shows the brain isosurface of the downsampled volume at the current threshold. Submitted with the same key as
+        update_brain_surface, so it cancels a running full resolution job and is replaced by the next one.
+        """
+        label = self.brain.labels[0]
+        threshold = self.brain_threshold_sp.value()
+
+        def job():
+            return [(label, load_preview_surface(label, threshold))]
+
+        self.pipeline_worker.submit(self.job_key('brain', self.nii_case.modality), job, preview_filters(label))
+
+    def update_mask_surfaces(self):
+        mask = self.mask
         smoothness = self.mask_smoothness_sp.value()
-        for label in self.mask.labels:
-            if label.smoother:
+        labels = surface_labels(mask)
+
+        def job():
+            surfaces = []
+            for label in labels:
                 label.smoother.SetNumberOfIterations(smoothness)
-        self.render_window.Render()
+                surfaces.append((label, load_surface(mask, label)))
+            return surfaces
+
+        filters = [f for label in labels for f in surface_filters(label)]
+        self.pipeline_worker.submit(self.job_key('mask'), job, filters)
+
+    def job_key(self, *role):
+        """
+        :param role: what the job computes, e.g. 'mask' or 'brain', modality
+        :return: the pipeline worker key of a job of the current case, it identifies the case by id so the worker never
+                 keeps an evicted case alive
+        """
+        return (self.nii_case.id,) + role
+
+    def surfaces_ready(self, key, surfaces):
+        """
+        Called on the GUI thread with the finished surfaces of the latest pipeline job.
+        :param key: the key the job was submitted with, see job_key
+        :param surfaces: list of (NiiLabel, vtkPolyData)
+        """
+        if key == self.job_key('modality'):
+            if self.pending_modality:
+                (modality, brain), self.pending_modality = self.pending_modality, None
+                for label, polydata in surfaces:
+                    label.mapper.SetInputData(polydata)
+                self.show_modality(modality, brain)
+            return
+        for label, polydata in surfaces:
+            if polydata is not None:
+                label.mapper.SetInputData(polydata)
+                label.preview_showing = polydata is label.preview_surface
+        self.refresh_stats()
+        self.show_triangle_report()
+        self.render()
+
+    def job_failed(self, key, error):
+        """
+        Called on the GUI thread when the latest pipeline job of key raised, e.g. the IOError of a corrupt modality file.
+        A modality which failed to load is deselected again.
+        """
+        if key == self.job_key('modality'):
+            self.pending_modality = None
+            self.fill_modality_list()
+        QtWidgets.QMessageBox.warning(self, "Pipeline", '{}: {}'.format(type(error).__name__, error))
+
+    def closeEvent(self, event):
+        self.render_scheduler.cancel()
+        self.pipeline_worker.shutdown()
+        self.prefetcher.shutdown()
+        QtWidgets.QMainWindow.closeEvent(self, event)
 
     def set_axial_view(self):
-        self.renderer.ResetCamera()
-        fp = self.renderer.GetActiveCamera().GetFocalPoint()
-        p = self.renderer.GetActiveCamera().GetPosition()
-        dist = math.sqrt((p[0] - fp[0]) ** 2 + (p[1] - fp[1]) ** 2 + (p[2] - fp[2]) ** 2)
-        self.renderer.GetActiveCamera().SetPosition(fp[0], fp[1], fp[2] + dist)
-        self.renderer.GetActiveCamera().SetViewUp(0.0, 1.0, 0.0)
-        self.renderer.GetActiveCamera().Zoom(1.8)
-        self.render_window.Render()
+        set_axial_view(self.renderer)
+        self.render()
 
     def set_coronal_view(self):
-        self.renderer.ResetCamera()
-        fp = self.renderer.GetActiveCamera().GetFocalPoint()
-        p = self.renderer.GetActiveCamera().GetPosition()
-        dist = math.sqrt((p[0] - fp[0]) ** 2 + (p[1] - fp[1]) ** 2 + (p[2] - fp[2]) ** 2)
-        self.renderer.GetActiveCamera().SetPosition(fp[0], fp[2] - dist, fp[1])
-        self.renderer.GetActiveCamera().SetViewUp(0.0, 0.5, 0.5)
-        self.renderer.GetActiveCamera().Zoom(1.8)
-        self.render_window.Render()
+        set_coronal_view(self.renderer)
+        self.render()
 
     def set_sagittal_view(self):
-        self.renderer.ResetCamera()
-        fp = self.renderer.GetActiveCamera().GetFocalPoint()
-        p = self.renderer.GetActiveCamera().GetPosition()
-        dist = math.sqrt((p[0] - fp[0]) ** 2 + (p[1] - fp[1]) ** 2 + (p[2] - fp[2]) ** 2)
-        self.renderer.GetActiveCamera().SetPosition(fp[2] + dist, fp[0], fp[1])
-        self.renderer.GetActiveCamera().SetViewUp(0.0, 0.0, 1.0)
-        self.renderer.GetActiveCamera().Zoom(1.6)
-        self.render_window.Render()
+        set_sagittal_view(self.renderer)
+        self.render()
 
     @staticmethod
     def create_new_separator():
@@ -341,8 +817,3 @@ class MainWindow(QtWidgets.QMainWindow, QtWidgets.QApplication):
         horizontal_line.setSizePolicy(QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Fixed)
         horizontal_line.setStyleSheet("background-color: #c8c8c8;")
         return horizontal_line
-
-    def process_changes(self):
-        for _ in range(10):
-            self.app.processEvents()
-            time.sleep(0.1)
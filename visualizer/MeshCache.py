@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+import tempfile
+
+import vtk
+
+
+class MeshCache:
+    """
+    Content-addressed on-disk cache for the final surface polydata of a label. Entries are keyed by the hash of the
+    volume file plus the pipeline parameters used to produce the surface, stored as zlib compressed binary VTP files
+    and evicted least recently used first once the cache grows past max_size bytes.
+    """
+    EXTENSION = '.vtp'
+
+    def __init__(self, directory, max_size):
+        self.directory = directory
+        self.max_size = max_size
+        self.__file_hashes = {}
+
+    def enabled(self):
+        return bool(self.directory) and self.max_size > 0
+
+    def file_hash(self, file_name):
+        """
+        :param file_name: the volume file
+        :return: the sha1 hex digest of the file contents, memoized on (path, size, modification time)
+        """
+        stat = os.stat(file_name)
+        memo_key = (os.path.abspath(file_name), stat.st_size, stat.st_mtime)
+        if memo_key not in self.__file_hashes:
+            sha1 = hashlib.sha1()
+            with open(file_name, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    sha1.update(chunk)
+            self.__file_hashes[memo_key] = sha1.hexdigest()
+        return self.__file_hashes[memo_key]
+
+    def key(self, file_name, **params):
+        """
+        :param file_name: the volume file the surface is extracted from
+        :param params: every pipeline parameter that changes the resulting surface
+        :return: the cache key, or None if the cache is disabled
+        """
+        if not self.enabled():
+            return None
+        payload = self.file_hash(file_name) + json.dumps(params, sort_keys=True)
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + self.EXTENSION)
+
+    def get(self, key):
+        """
+        :param key: a key from MeshCache.key
+        :return: the cached vtkPolyData or None on a miss
+        """
+        if key is None or not os.path.isfile(self.path(key)):
+            return None
+
+        reader = vtk.vtkXMLPolyDataReader()
+        reader.SetFileName(self.path(key))
+        reader.Update()
+        if reader.GetErrorCode():
+            return None
+
+        os.utime(self.path(key))  # mark as recently used
+        polydata = vtk.vtkPolyData()
+        polydata.ShallowCopy(reader.GetOutput())
+        return polydata
+
+    def put(self, key, polydata):
+        if key is None:
+            return
+
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp('.tmp', dir=self.directory)
+        os.close(fd)
+
+        writer = vtk.vtkXMLPolyDataWriter()
+        writer.SetFileName(tmp_path)
+        writer.SetInputData(polydata)
+        writer.SetDataModeToAppended()
+        writer.EncodeAppendedDataOff()
+        writer.SetCompressorTypeToZLib()
+        if writer.Write():
+            os.replace(tmp_path, self.path(key))  # atomic, readers never see a partial file
+            self.evict()
+        else:
+            os.remove(tmp_path)
+
+    def evict(self):
+        """Removes the least recently used entries until the cache fits in max_size bytes."""
+        evict_lru(self.directory, self.max_size, self.EXTENSION)
+
+
+def evict_lru(directory, max_size, extension, keep=None):
+    """
+    Removes the least recently modified files with the given extension from directory until their total size fits in
+    max_size bytes. Recency is tracked through the modification time, which cache hits refresh with os.utime.
+    :param keep: a path which is never removed, e.g. the entry which was just added
+    """
+    entries = []
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if name.endswith(extension) and path != keep:
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:  # evicted by another process
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+    total_size = sum(size for _, size, _ in entries)
+    if keep is not None and os.path.isfile(keep):
+        total_size += os.path.getsize(keep)
+
+    for _, size, path in sorted(entries):
+        if total_size <= max_size:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total_size -= size
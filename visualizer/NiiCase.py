@@ -0,0 +1,19 @@
+import itertools
+import threading
+
+
+class NiiCase:
+    ids = itertools.count()
+
+    def __init__(self):
+        self.id = next(NiiCase.ids)  # unique in the session, keys the pipeline jobs of the case without referencing it
+        self.name = None
+        self.brain = None  # the brain of the displayed modality
+        self.modalities = {}  # modality name -> image file, in the order given
+        self.modality = None
+        self.brains = {}  # modality name -> brain NiiObject, modalities are read on first use
+        self.mask = None
+        self.renderer = None
+        self.brain_image_prop = None
+        self.brain_slicer_props = []
+        self.lock = threading.RLock()  # held while the modalities are swapped or the memory of the case is measured
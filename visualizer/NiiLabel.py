@@ -1,8 +1,21 @@
 class NiiLabel:
     def __init__(self, color, opacity, smoothness):
+        self.name = None
         self.actor = None
         self.property = None
+        self.mapper = None
+        self.extractor = None
+        self.reducer = None
         self.smoother = None
+        self.normals = None
+        self.reduced = None
+        self.reduced_params = None
+        self.preview_extractor = None
+        self.preview_surface = None  # the latest coarse preview, see load_preview_surface
+        self.preview_showing = False  # the mapper shows a preview instead of the full resolution surface
+        self.interactive_surface = None  # (full detail vtkPolyData, its reduced copy), see set_interactive_detail
+        self.value = None
+        self.triangle_target = None
         self.color = color
         self.opacity = opacity
         self.smoothness = smoothness
\ No newline at end of file
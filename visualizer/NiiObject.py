@@ -4,5 +4,10 @@ class NiiObject:
         self.reader = None
         self.extent = ()
         self.labels = []
-        self.image_mapper = None
+        self.label_index = {}
+        self.compact_label = None
+        self.extractor = None  # shared by the labels of a mask extracted in a single pass, see create_label_extractors
+        self.volume = None
         self.scalar_range = None
+        self.histogram = None  # (counts, edges), see volume_histogram
+        self.load_time = None
@@ -0,0 +1,116 @@
+import collections
+import json
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def resident_memory_mb():
+    """:return: the current resident memory of the process in MB (the peak without /proc), or None if unknown"""
+    if resource is None:
+        return None
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * resource.getpagesize() / 1024.0 ** 2
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024.0 ** 2 if sys.platform == 'darwin' else peak / 1024.0  # bytes on mac, KB elsewhere
+
+
+def output_size(algorithm):
+    """:return: (number of cells, or points for images, and the memory in KB) of the first output of algorithm"""
+    output = algorithm.GetOutputDataObject(0)
+    if output is None:
+        return 0, 0
+    cells = output.GetNumberOfCells() if output.IsA('vtkPolyData') or output.IsA('vtkUnstructuredGrid') \
+        else output.GetNumberOfPoints()
+    return cells, output.GetActualMemorySize()
+
+
+class PipelineStats:
+    """
+    Collects how long every observed VTK filter takes, how large its output is and the resident memory of the process
+    after it ran, per label and pipeline stage. Filters are observed through their StartEvent, ProgressEvent and
+    EndEvent, so the stats also cover filters executing on the pipeline worker thread. Every finished stage can also be
+    appended as a JSON line to log_file. Only the latest max_records measurements are kept, the summary per (label,
+    stage) is updated as they arrive, so a long session neither grows the memory nor the stats table.
+    """
+
+    def __init__(self, log_file=None, max_records=1000):
+        self.log_file = log_file
+        self.__records = collections.deque(maxlen=max_records)
+        self.__summary = {}
+        self.__progress = {}
+        self.__lock = threading.Lock()
+
+    def observe(self, algorithm, label, stage):
+        """
+        :param algorithm: a vtkAlgorithm created by vtkUtils
+        :param label: the surface the algorithm belongs to, e.g. 'brain' or 'label 3'
+        :param stage: the pipeline stage, e.g. 'extractor' or 'smoother'
+        """
+        start = []
+
+        def started(obj, event):
+            start[:] = [time.perf_counter()]
+            with self.__lock:
+                self.__progress[(label, stage)] = 0.0
+
+        def progressed(obj, event):
+            with self.__lock:
+                self.__progress[(label, stage)] = obj.GetProgress()
+
+        def ended(obj, event):
+            if start:
+                cells, memory_kb = output_size(obj)
+                self.record(label, stage, time.perf_counter() - start[0], cells, memory_kb)
+            with self.__lock:
+                self.__progress.pop((label, stage), None)
+
+        algorithm.AddObserver('StartEvent', started)
+        algorithm.AddObserver('ProgressEvent', progressed)
+        algorithm.AddObserver('EndEvent', ended)
+
+    def record(self, label, stage, seconds, cells=None, memory_kb=None):
+        """Adds a measurement for work which is not done by an observed filter, e.g. reading a volume."""
+        record = {'label': label, 'stage': stage, 'seconds': seconds, 'cells': cells, 'memory_kb': memory_kb,
+                  'rss_mb': resident_memory_mb(), 'time': time.time()}
+        with self.__lock:
+            self.__records.append(record)
+            entry = self.__summary.setdefault((label, stage), {'label': label, 'stage': stage, 'runs': 0,
+                                                               'total_seconds': 0.0})
+            entry['runs'] += 1
+            entry['total_seconds'] += seconds
+            entry.update(last_seconds=seconds, cells=cells, memory_kb=memory_kb, rss_mb=record['rss_mb'])
+            if self.log_file:
+                with open(self.log_file, 'a') as f:
+                    f.write(json.dumps(record) + '\n')
+
+    def records(self, label=None):
+        """:return: the latest measurements (optionally of a single label) in the order they finished"""
+        with self.__lock:
+            return [dict(r) for r in self.__records if label is None or r['label'] == label]
+
+    def running(self):
+        """:return: dict of (label, stage) -> progress of the filters executing right now"""
+        with self.__lock:
+            return dict(self.__progress)
+
+    def summary(self):
+        """
+        :return: list of dicts per (label, stage) in first-run order with the number of runs, their total and last
+                 duration and the output size and resident memory of the last run, covering every run since the last
+                 clear, not only the kept records
+        """
+        with self.__lock:
+            return [dict(entry) for entry in self.__summary.values()]
+
+    def clear(self):
+        with self.__lock:
+            self.__records.clear()
+            self.__summary = {}
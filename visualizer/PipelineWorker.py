@@ -0,0 +1,88 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import PyQt5.QtCore as Qt
+
+logger = logging.getLogger(__name__)
+
+
+class PipelineWorker(Qt.QObject):
+    """
+    Runs VTK pipeline jobs on a single background thread so the GUI stays responsive while the filters execute.
+    Jobs are identified by a key (e.g. 'brain' or 'mask'); submitting a job for a key makes any queued or running job
+    with the same key stale. Keys are kept until discarded, so they should not reference large objects. Stale jobs are skipped or aborted through the ProgressEvent of their filters and their
+    results are dropped, only the result of the latest job is delivered (on the GUI thread) through `finished`. If
+    the latest job raises, the exception is logged and delivered through `failed` instead.
+    """
+    finished = Qt.pyqtSignal(object, object)  # job key, job result
+    failed = Qt.pyqtSignal(object, object)  # job key, exception raised by the job
+
+    def __init__(self):
+        Qt.QObject.__init__(self)
+        self.__executor = ThreadPoolExecutor(max_workers=1)  # jobs share filters, so they must run one at a time
+        self.__generations = {}
+        self.__lock = threading.Lock()
+
+    def submit(self, key, job, filters=()):
+        """
+        :param key: identifies which surfaces the job updates, newer jobs with the same key cancel older ones
+        :param job: a callable run on the worker thread, its return value is passed to `finished`
+        :param filters: the vtkAlgorithms executed by the job which should be aborted once the job is stale
+        """
+        with self.__lock:
+            generation = self.__generations.get(key, 0) + 1
+            self.__generations[key] = generation
+        self.__executor.submit(self.__run, key, generation, job, filters)
+
+    def is_stale(self, key, generation):
+        with self.__lock:
+            return self.__generations.get(key) != generation
+
+    def keys(self):
+        with self.__lock:
+            return list(self.__generations)
+
+    def discard(self, keys):
+        """Forgets the keys, e.g. of an evicted case, their queued or running jobs become stale."""
+        with self.__lock:
+            for key in keys:
+                self.__generations.pop(key, None)
+
+    def shutdown(self):
+        with self.__lock:
+            for key in self.__generations:
+                self.__generations[key] += 1  # makes every pending job stale
+        self.__executor.shutdown(wait=True)
+
+    def __run(self, key, generation, job, filters):
+        if self.is_stale(key, generation):
+            return
+
+        aborted = []
+
+        def abort_if_stale(obj, event):
+            if self.is_stale(key, generation):
+                obj.SetAbortExecute(1)
+                aborted.append(obj)
+
+        observers = [(f, f.AddObserver('ProgressEvent', abort_if_stale)) for f in filters]
+        result, error = None, None
+        try:
+            result = job()
+        except Exception as e:
+            logger.exception('pipeline job %r failed', key)
+            error = e
+        finally:
+            for f, observer in observers:
+                f.RemoveObserver(observer)
+            for f in aborted:
+                f.SetAbortExecute(0)
+                f.Modified()  # the output of an aborted filter is incomplete, force it to execute next time
+
+        if self.is_stale(key, generation):
+            return
+        if error is not None:
+            self.failed.emit(key, error)
+        else:
+            self.finished.emit(key, result)
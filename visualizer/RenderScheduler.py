@@ -0,0 +1,48 @@
+import math
+import time
+
+import PyQt5.QtCore as Qt
+
+
+class RenderScheduler(Qt.QObject):
+    """
+    Coalesces render requests into at most one frame per display interval. The first request after a frame starts a
+    timer for the rest of the interval, every request arriving before it fires is served by that one frame, so a
+    slider drag which changes the scene a hundred times a second renders at the display rate instead of queueing a
+    full render per change. Requests made while handling an event are rendered once the event loop is idle again.
+    """
+
+    def __init__(self, render, frame_rate):
+        """
+        :param render: renders a frame, e.g. vtkRenderWindow.Render
+        :param frame_rate: maximum frames per second
+        """
+        Qt.QObject.__init__(self)
+        self.render = render
+        self.interval = 1.0 / frame_rate
+        self.last_frame = -math.inf
+        self.frames, self.requests = 0, 0
+        self.timer = Qt.QTimer()
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.render_frame)
+
+    def request(self, *args):
+        """Schedules a frame, accepts and ignores the arguments of VTK observers and Qt signals."""
+        self.requests += 1
+        if not self.timer.isActive():
+            delay = max(self.interval - (time.perf_counter() - self.last_frame), 0.0)
+            self.timer.start(int(math.ceil(delay * 1000)))
+
+    def flush(self):
+        """Renders a scheduled frame right away."""
+        if self.timer.isActive():
+            self.timer.stop()
+            self.render_frame()
+
+    def cancel(self):
+        self.timer.stop()
+
+    def render_frame(self):
+        self.last_frame = time.perf_counter()
+        self.frames += 1
+        self.render()
@@ -0,0 +1,159 @@
+import csv
+import fnmatch
+import multiprocessing
+import os
+import time
+
+import vtkUtils
+from vtkUtils import *
+from meshUtils import *
+
+VIEWS = [('axial', set_axial_view), ('coronal', set_coronal_view), ('sagittal', set_sagittal_view)]
+
+
+def match_file(directory, patterns):
+    """
+    :return: the path of the first file in directory matching one of the (case insensitive) patterns, or None
+    """
+    names = sorted(os.listdir(directory))
+    for pattern in patterns:
+        for name in names:
+            if fnmatch.fnmatch(name.lower(), pattern.lower()):
+                return os.path.join(directory, name)
+    return None
+
+
+def read_manifest(file_name):
+    """
+    Reads a CSV manifest with one `image,mask[,name]` row per case. A header row starting with `image` is skipped and
+    relative paths are resolved against the directory of the manifest.
+    :return: list of (name, image file, mask file)
+    """
+    base_dir = os.path.dirname(os.path.abspath(file_name))
+    cases = []
+    with open(file_name, newline='') as f:
+        for row in csv.reader(f):
+            if not row or row[0].strip().lower() == 'image':
+                continue
+            image, mask = [os.path.join(base_dir, path.strip()) for path in row[:2]]
+            name = row[2].strip() if len(row) > 2 else os.path.basename(os.path.dirname(image))
+            cases.append((name, image, mask))
+    return cases
+
+
+def find_cases(path, image_patterns=BATCH_IMAGE_PATTERNS, mask_patterns=BATCH_MASK_PATTERNS):
+    """
+    :param path: a CSV manifest (see read_manifest) or a directory containing one sub directory per case
+    :param image_patterns: file name patterns of the image within a case directory
+    :param mask_patterns: file name patterns of the mask within a case directory
+    :return: list of (name, image file, mask file), case directories without an image or mask are skipped
+    """
+    if os.path.isfile(path):
+        return read_manifest(path)
+
+    cases = []
+    for name in sorted(os.listdir(path)):
+        case_dir = os.path.join(path, name)
+        if not os.path.isdir(case_dir):
+            continue
+        image, mask = match_file(case_dir, image_patterns), match_file(case_dir, mask_patterns)
+        if image and mask:
+            cases.append((name, image, mask))
+    return cases
+
+
+def create_offscreen_window(size):
+    renderer = vtk.vtkRenderer()
+    render_window = vtk.vtkRenderWindow()
+    render_window.SetOffScreenRendering(1)
+    render_window.SetSize(size, size)
+    render_window.AddRenderer(renderer)
+    return renderer, render_window
+
+
+def write_screenshot(render_window, file_name):
+    render_window.Render()
+    window_to_image = vtk.vtkWindowToImageFilter()
+    window_to_image.SetInput(render_window)
+    window_to_image.SetInputBufferTypeToRGB()
+    window_to_image.ReadFrontBufferOff()
+    writer = vtk.vtkPNGWriter()
+    writer.SetFileName(file_name)
+    writer.SetInputConnection(window_to_image.GetOutputPort())
+    writer.Write()
+
+
+def render_case(case, output_dir, size=BATCH_SCREENSHOT_SIZE, mesh_format=BATCH_MESH_FORMAT):
+    """
+    Loads a case off-screen, writes a screenshot per view and the surface of the brain and every mask label.
+    Output goes to `output_dir/<case name>/{axial,coronal,sagittal}.png` and `.../meshes/`, see export_surfaces.
+    :param case: (name, image file, mask file)
+    :param mesh_format: one of MESH_FORMATS
+    :return: (case name, error message or None, seconds spent)
+    """
+    name, image, mask_file = case
+    start = time.time()
+    try:
+        case_dir = os.path.join(output_dir, name)
+        mesh_dir = os.path.join(case_dir, 'meshes')
+        os.makedirs(case_dir, exist_ok=True)
+
+        renderer, render_window = create_offscreen_window(size)
+        brain, mask = setup_case(renderer, image, mask_file)
+
+        for view, set_view in VIEWS:
+            set_view(renderer)
+            write_screenshot(render_window, os.path.join(case_dir, view + '.png'))
+
+        export_surfaces([brain, mask], mesh_dir, mesh_format)
+        render_window.Finalize()
+    except Exception as e:
+        return name, '{}: {}'.format(type(e).__name__, e), time.time() - start
+    return name, None, time.time() - start
+
+
+def render_meshes(path, output_dir, size=BATCH_SCREENSHOT_SIZE):
+    """
+    Writes a screenshot per view of exported meshes, read by load_surfaces without the NIfTI volumes.
+    :param path: a meshes.glb file or a directory exported by render_case or export_surfaces
+    :return: list of the written screenshots
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    renderer, render_window = create_offscreen_window(size)
+    load_surfaces(path, renderer)
+    files = []
+    for view, set_view in VIEWS:
+        set_view(renderer)
+        files.append(os.path.join(output_dir, view + '.png'))
+        write_screenshot(render_window, files[-1])
+    render_window.Finalize()
+    return files
+
+
+def init_worker(use_cache):
+    vtkUtils.NIFTI_SIDECAR = False  # every volume is read once, sidecar copies would only churn the disk
+    if not use_cache:
+        mesh_cache.max_size = 0
+
+
+def run_batch(cases, output_dir, workers=None, size=BATCH_SCREENSHOT_SIZE, use_cache=True,
+              mesh_format=BATCH_MESH_FORMAT):
+    """
+    Renders every case on a process pool, printing one line per finished case.
+    :param cases: list of (name, image file, mask file), see find_cases
+    :param workers: number of worker processes, defaults to the number of CPUs
+    :return: list of (case name, error message) of the failed cases
+    """
+    failures = []
+    with multiprocessing.Pool(workers, initializer=init_worker, initargs=(use_cache,)) as pool:
+        jobs = [(case, output_dir, size, mesh_format) for case in cases]
+        for i, (name, error, seconds) in enumerate(pool.imap_unordered(render_case_job, jobs), 1):
+            status = 'failed: ' + error if error else 'ok'
+            print('[{}/{}] {}: {} ({:.1f}s)'.format(i, len(cases), name, status, seconds), flush=True)
+            if error:
+                failures.append((name, error))
+    return failures
+
+
+def render_case_job(args):
+    return render_case(*args)
@@ -0,0 +1,179 @@
+"""
+Benchmarks every stage of the vtkUtils pipeline on the bundled sample_data cases and compares the results against a
+stored baseline. Exits with status 1 if a stage got slower, produces more output data or a different number of
+triangles than the baseline allows.
+
+    python visualizer/benchmark.py                    # run and compare against benchmark_baseline.json
+    python visualizer/benchmark.py --update-baseline  # run and store the results as the new baseline
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import vtkUtils
+from vtkUtils import *
+
+SAMPLE_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'sample_data')
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+CASES = {
+    'flair': ('flair.nii.gz', 'truth.nii.gz'),
+    '10labels_example': ('10labels_example/T1CE.nii.gz', '10labels_example/mask.nii.gz'),
+    'zScoredExample': ('zScoredExample/Brats17_CBICA_ARF_1_t1ce.nii.gz',
+                       'zScoredExample/Brats17_CBICA_ARF_1_seg_4c.nii.gz'),
+}
+
+
+def output_mb(algorithm):
+    """
+    :return: the size of the output data of algorithm in MB, or None for algorithms without output (mappers). Unlike
+             the resident memory of the process this is the memory of one stage, independent of the stages before it.
+    """
+    if not isinstance(algorithm, vtk.vtkAlgorithm) or not algorithm.GetNumberOfOutputPorts():
+        return None
+    output = algorithm.GetOutputDataObject(0)
+    return output.GetActualMemorySize() / 1024.0 if output is not None else None
+
+
+def triangles(algorithm):
+    output = algorithm.GetOutput() if hasattr(algorithm, 'GetOutput') else None  # mappers have no output
+    return output.GetNumberOfCells() if isinstance(output, vtk.vtkPolyData) else None
+
+
+class StageTimer:
+    """Accumulates wall time and output triangles per stage name, and keeps the largest output data size."""
+
+    def __init__(self):
+        self.stages = {}
+
+    def measure(self, stage, func, algorithm=None):
+        """
+        Calls func and accumulates its time under stage, counting the output triangles and data size of algorithm, or
+        of the return value of func if that is a vtkAlgorithm (e.g. the reader of read_volume).
+        :return: the return value of func
+        """
+        start = time.perf_counter()
+        value = func()
+        seconds = time.perf_counter() - start
+
+        result = self.stages.setdefault(stage, {'seconds': 0.0, 'output_mb': None, 'triangles': None})
+        result['seconds'] += seconds
+        algorithm = algorithm if algorithm is not None else value
+        size = output_mb(algorithm)
+        if size is not None:
+            result['output_mb'] = max(result['output_mb'] or 0.0, size)
+        if algorithm is not None and triangles(algorithm) is not None:
+            result['triangles'] = (result['triangles'] or 0) + triangles(algorithm)
+        return value
+
+    def run(self, stage, algorithm):
+        self.measure(stage, algorithm.Update, algorithm)
+        return algorithm
+
+
+def run_surface_stages(timer, prefix, extractor, smoothness):
+    """Runs reducer -> smoother -> normals -> mapper on an updated extractor, like add_surface_rendering."""
+    reducer = timer.run(prefix + '.create_polygon_reducer', create_polygon_reducer(extractor))
+    smoother = timer.run(prefix + '.create_smoother', create_smoother(reducer, smoothness))
+    normals = timer.run(prefix + '.create_normals', create_normals(smoother))
+    mapper = create_mapper()
+    mapper.SetInputData(normals.GetOutput())
+    timer.run(prefix + '.create_mapper', mapper)
+
+
+def benchmark_case(image_file, mask_file):
+    """
+    :return: dict of stage name -> {'seconds', 'output_mb', 'triangles'}
+    """
+    timer = StageTimer()
+    brain, mask = NiiObject(), NiiObject()
+
+    brain.reader = timer.measure('brain.read_volume', lambda: read_volume(image_file))
+    brain.scalar_range = brain.reader.GetOutput().GetScalarRange()
+    brain_extractor = create_brain_extractor(brain)
+    brain_extractor.SetValue(0, sum(brain.scalar_range) / 2)
+    timer.run('brain.create_brain_extractor', brain_extractor)
+    if brain_extractor.GetOutput().GetNumberOfCells():
+        run_surface_stages(timer, 'brain', brain_extractor, BRAIN_SMOOTHNESS)
+
+    mask.reader = timer.measure('mask.read_volume', lambda: read_volume(mask_file))
+    mask.extent = mask.reader.GetDataExtent()
+    mask.label_index = timer.measure('mask.build_label_index', lambda: build_label_index(mask.reader.GetOutput()))
+    for mask_extractor in create_label_extractors(mask).values():
+        timer.run('mask.create_mask_extractor', mask_extractor)
+        run_surface_stages(timer, 'mask', mask_extractor, MASK_SMOOTHNESS)
+
+    return timer.stages
+
+
+def compare(results, baseline, tolerance, min_seconds=0.05):
+    """
+    :param results: {case: {stage: {'seconds', 'output_mb', 'triangles'}}}
+    :param baseline: results of an earlier run in the same format
+    :param tolerance: allowed relative increase of time and output size, and relative change of the triangle count
+    :param min_seconds: time increases below this many seconds are ignored as noise
+    :return: list of regression messages, empty if every stage is within the tolerance
+    """
+    regressions = []
+    for case, stages in sorted(results.items()):
+        for stage, result in sorted(stages.items()):
+            expected = baseline.get(case, {}).get(stage)
+            if expected is None:
+                continue
+            name = '{} {}'.format(case, stage)
+
+            allowed = expected['seconds'] * (1 + tolerance)
+            if result['seconds'] > allowed and result['seconds'] - expected['seconds'] > min_seconds:
+                regressions.append('{}: {:.3f}s, baseline {:.3f}s'.format(name, result['seconds'],
+                                                                          expected['seconds']))
+            if result.get('output_mb') and expected.get('output_mb') and \
+                    result['output_mb'] > expected['output_mb'] * (1 + tolerance):
+                regressions.append('{}: output {:.1f}MB, baseline {:.1f}MB'.format(name, result['output_mb'],
+                                                                                  expected['output_mb']))
+            if result['triangles'] is not None and expected['triangles'] is not None and \
+                    abs(result['triangles'] - expected['triangles']) > expected['triangles'] * tolerance:
+                regressions.append('{}: {} triangles, baseline {}'.format(name, result['triangles'],
+                                                                         expected['triangles']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks the vtkUtils pipeline stages on the sample data.')
+    parser.add_argument('--cases', nargs='+', choices=sorted(CASES), default=sorted(CASES))
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', default=BASELINE_FILE, help='baseline JSON file')
+    parser.add_argument('--update-baseline', action='store_true', help='store the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.5, help='allowed relative regression (default 0.5)')
+    args = parser.parse_args()
+
+    # measure the pipeline itself, not the caches
+    vtkUtils.mesh_cache.max_size = 0
+    vtkUtils.NIFTI_SIDECAR = False
+
+    results = {}
+    for case in args.cases:
+        image_file, mask_file = [os.path.join(SAMPLE_DATA, f) for f in CASES[case]]
+        results[case] = benchmark_case(image_file, mask_file)
+        for stage, result in sorted(results[case].items()):
+            print('{:<18} {:<38} {:>8.3f}s {:>10} triangles {:>9} MB'.format(
+                case, stage, result['seconds'], result['triangles'] or '-',
+                '-' if result['output_mb'] is None else '{:.1f}'.format(result['output_mb'])))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        return 0
+
+    with open(args.baseline) as f:
+        regressions = compare(results, json.load(f), args.tolerance)
+    for regression in regressions:
+        print('REGRESSION ' + regression)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
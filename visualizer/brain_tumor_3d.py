@@ -2,7 +2,8 @@ import argparse
 import sys
 import os
 
-from MainWindow import *
+import vtk
+from config import *
 
 
 def redirect_vtk_messages():
@@ -18,18 +19,77 @@ def redirect_vtk_messages():
 
 def verify_type(file):
     ext = os.path.basename(file).split(os.extsep, 1)
-    if ext[1] != 'nii.gz':
-        parser.error("File doesn't end with 'nii.gz'. Found: {}".format(ext[1]))
+    if len(ext) < 2 or ext[1] not in ('nii.gz', 'nii'):
+        parser.error("File doesn't end with 'nii.gz' or 'nii'. Found: {}".format(ext[-1]))
     return file
 
 
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description='Reads Nii.gz Files and renders them in 3D.')
-    parser.add_argument('-i', type=lambda fn: verify_type(fn), help='an mri scan (nii.gz)')
-    parser.add_argument('-m', type=lambda fn: verify_type(fn), help='the segmentation mask (nii.gz)')
-    args = parser.parse_args()
+def run_batch(args):
+    """ Render screenshots and export meshes of many cases without opening a window."""
+    from batch import find_cases, run_batch
+
+    cases = find_cases(args.cases, args.image_pattern or BATCH_IMAGE_PATTERNS, args.mask_pattern or BATCH_MASK_PATTERNS)
+    if not cases:
+        parser.error("No cases found in '{}'".format(args.cases))
+    failures = run_batch(cases, args.output, args.workers, args.size, not args.no_cache, args.mesh_format)
+    print('{} of {} cases rendered'.format(len(cases) - len(failures), len(cases)))
+    return 1 if failures else 0
+
+
+def run_evaluation(args):
+    """ Compute Dice, Jaccard and Hausdorff distance between the paired masks of two directories."""
+    from evaluation import pair_masks, run_evaluation
+
+    pairs = pair_masks(args.reference, args.prediction, args.mask_pattern or BATCH_MASK_PATTERNS)
+    if not pairs:
+        parser.error("No masks found in '{}'".format(args.reference))
+    failures = run_evaluation(pairs, args.output, args.workers)
+    print('{} of {} cases evaluated, metrics written to {}'.format(len(pairs) - len(failures), len(pairs), args.output))
+    return 1 if failures else 0
+
+
+def run_service(args):
+    """ Serve PNG frames of the cases over HTTP from off-screen render windows."""
+    from batch import find_cases
+    from render_service import serve
+
+    cases = find_cases(args.cases)
+    if not cases:
+        parser.error("No cases found in '{}'".format(args.cases))
+    serve(cases, args.host, args.port, args.workers)
+    return 0
+
+
+def run_meshes(args):
+    """ Show exported meshes without their NIfTI volumes, in a window or as screenshots."""
+    if args.output:
+        from batch import render_meshes
+
+        for file_name in render_meshes(args.path, args.output, args.size):
+            print(file_name)
+        return 0
+
+    from meshUtils import load_surfaces
+    from vtkUtils import set_axial_view
+
+    renderer = vtk.vtkRenderer()
+    load_surfaces(args.path, renderer)
+    set_axial_view(renderer)
+    render_window = vtk.vtkRenderWindow()
+    render_window.AddRenderer(renderer)
+    render_window.SetSize(800, 800)
+    interactor = vtk.vtkRenderWindowInteractor()
+    interactor.SetRenderWindow(render_window)
+    interactor.SetInteractorStyle(vtk.vtkInteractorStyleTrackballCamera())
+    render_window.Render()
+    interactor.Start()
+    return 0
+
+
+def run_window(args):
+    import PyQt5.QtWidgets as QtWidgets
+    from MainWindow import MainWindow
 
-    redirect_vtk_messages()
     app = QtWidgets.QApplication(sys.argv)
 
     # with open("./visualizer/captk.qss") as css:
@@ -38,5 +98,69 @@ if __name__ == "__main__":
 
     app.BRAIN_FILE = args.i
     app.MASK_FILE = args.m
+    if args.cases:
+        from batch import find_cases
+
+        app.CASES = find_cases(args.cases)
+        if not app.CASES:
+            parser.error("No cases found in '{}'".format(args.cases))
     window = MainWindow(app)
-    sys.exit(app.exec_())
+    return app.exec_()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Reads Nii.gz and Nii Files and renders them in 3D.')
+    parser.add_argument('-i', nargs='+', type=lambda fn: verify_type(fn),
+                        help='an mri scan (nii.gz or nii), or several modalities of it (e.g. T1 T1CE T2 FLAIR) which '
+                             'can be switched in the window, the first one is shown')
+    parser.add_argument('-m', type=lambda fn: verify_type(fn), help='the segmentation mask (nii.gz or nii)')
+    parser.add_argument('-c', '--cases', help='review several cases in one window: a directory with one sub directory '
+                                              'per case, or a CSV manifest with image,mask[,name] rows')
+    subparsers = parser.add_subparsers(dest='command')
+
+    batch_parser = subparsers.add_parser('batch', help='render screenshots and export meshes of many cases headless')
+    batch_parser.add_argument('cases', help='a directory with one sub directory per case, '
+                                            'or a CSV manifest with image,mask[,name] rows')
+    batch_parser.add_argument('-o', '--output', required=True, help='output directory, one sub directory per case')
+    batch_parser.add_argument('-j', '--workers', type=int, default=None, help='worker processes (default: all CPUs)')
+    batch_parser.add_argument('--size', type=int, default=BATCH_SCREENSHOT_SIZE, help='screenshot size in pixels')
+    batch_parser.add_argument('--image-pattern', action='append', help='image file pattern in a case directory')
+    batch_parser.add_argument('--mask-pattern', action='append', help='mask file pattern in a case directory')
+    batch_parser.add_argument('--no-cache', action='store_true', help='do not read or write the mesh cache')
+    batch_parser.add_argument('--mesh-format', choices=['vtp', 'ply', 'glb'], default=BATCH_MESH_FORMAT,
+                              help='format of the exported meshes: vtp (quantized, dequantize with the '
+                                   'QuantizationOrigin/Scale field data), ply (float32) or glb (quantized glTF) '
+                                   '(default: {})'.format(BATCH_MESH_FORMAT))
+
+    meshes_parser = subparsers.add_parser('meshes', help='show exported meshes without their volumes')
+    meshes_parser.add_argument('path', help='a meshes directory written by batch, or a meshes.glb file')
+    meshes_parser.add_argument('-o', '--output', help='write axial, coronal and sagittal screenshots to this '
+                                                      'directory instead of opening a window')
+    meshes_parser.add_argument('--size', type=int, default=BATCH_SCREENSHOT_SIZE, help='screenshot size in pixels')
+
+    evaluate_parser = subparsers.add_parser('evaluate', help='compare the segmentation masks of two directories')
+    evaluate_parser.add_argument('reference', help='directory of the reference masks, or of one sub directory per case')
+    evaluate_parser.add_argument('prediction', help='directory of the masks to evaluate, paired by case name')
+    evaluate_parser.add_argument('-o', '--output', required=True, help='CSV file, one row per case and label')
+    evaluate_parser.add_argument('-j', '--workers', type=int, default=None, help='worker processes (default: all CPUs)')
+    evaluate_parser.add_argument('--mask-pattern', action='append', help='mask file pattern in a case directory')
+
+    service_parser = subparsers.add_parser('serve', help='serve PNG frames of many cases over HTTP')
+    service_parser.add_argument('cases', help='a directory with one sub directory per case, '
+                                              'or a CSV manifest with image,mask[,name] rows')
+    service_parser.add_argument('--host', default=SERVICE_HOST, help='address to listen on')
+    service_parser.add_argument('--port', type=int, default=SERVICE_PORT, help='port to listen on')
+    service_parser.add_argument('-j', '--workers', type=int, default=SERVICE_WORKERS,
+                                help='off-screen render windows (default: {})'.format(SERVICE_WORKERS))
+    args = parser.parse_args()
+
+    redirect_vtk_messages()
+    if args.command == 'batch':
+        sys.exit(run_batch(args))
+    if args.command == 'evaluate':
+        sys.exit(run_evaluation(args))
+    if args.command == 'serve':
+        sys.exit(run_service(args))
+    if args.command == 'meshes':
+        sys.exit(run_meshes(args))
+    sys.exit(run_window(args))
@@ -1,11 +1,22 @@
+import os
+
+# surface smoothing, "windowed_sinc" (vtkWindowedSincPolyDataFilter) converges in a few dozen iterations and does not
+# shrink the surface, "laplacian" (vtkSmoothPolyDataFilter) needs hundreds
+SMOOTHING_METHOD = "windowed_sinc"
+SMOOTHING_PASS_BAND = 0.1  # windowed sinc only, lower is smoother
+SMOOTHNESS_RANGE = (5, 100, 5) if SMOOTHING_METHOD == "windowed_sinc" else (100, 1000, 100)  # picker min, max, step
+
 # default brain settings
 APPLICATION_TITLE = "Theia – NIfTI (nii.gz) 3D Visualizer"
-BRAIN_SMOOTHNESS = 500
+BRAIN_SMOOTHNESS = 20 if SMOOTHING_METHOD == "windowed_sinc" else 500  # smoother iterations
 BRAIN_OPACITY = 0.2
+BRAIN_IMAGE_INTENSITY = 2.0  # brightness of the slicer and projection images, see set_image_intensity
+BRAIN_THRESHOLD = "otsu"  # initial isosurface threshold, "otsu" (see otsu_threshold) or "midpoint" of the range
+HISTOGRAM_BINS = 256  # intensity bins of the volume histogram
 BRAIN_COLORS = [(1.0, 0.9, 0.9)]  # RGB percentages
 
 # default mask settings
-MASK_SMOOTHNESS = 500
+MASK_SMOOTHNESS = 20 if SMOOTHING_METHOD == "windowed_sinc" else 500
 MASK_COLORS = [(1, 0, 0),
                 (0, 1, 0),
                 (1, 1, 0),
@@ -16,3 +27,69 @@ MASK_COLORS = [(1, 0, 0),
                 (0.5, 1, 0.5),
                 (0.5, 0.5, 1)]  # RGB percentages
 MASK_OPACITY = 1.0
+MASK_COMPACT_LABELS = 32  # masks with more labels share one surface pipeline and actor, colored per label
+MASK_COMPACT_CLUSTERING = 0.5  # quadric clustering bins per voxel and axis of the shared surface
+# labels are extracted from their own padded bounding boxes while the boxes add up to at most this fraction of the
+# mask volume, above it a single pass over the whole mask is faster (LOW_MEMORY always crops)
+MASK_CROP_MAX_VOLUME = 0.5
+
+# total number of triangles of the brain and mask surfaces, split between them by size (see allocate_triangles)
+# None keeps the fixed 50% reduction of every surface
+TRIANGLE_BUDGET = None
+
+# progressive threshold preview settings
+PROGRESSIVE_PREVIEW = True
+PREVIEW_SETTLE_DELAY = 400  # ms without threshold changes before the full resolution surface is computed
+PREVIEW_LARGE_VOLUME = 256 ** 3  # voxels, larger volumes are downsampled 4x instead of 2x for the preview
+
+# render scheduling: render requests of the window are coalesced into at most one frame per display interval
+RENDER_FRAME_RATE = 60  # frames per second
+
+# interactive level of detail: while the camera moves or a slice is dragged, surfaces with more triangles than
+# INTERACTIVE_MIN_TRIANGLES are drawn from a quadric clustered copy if a full detail frame misses the target frame rate
+INTERACTIVE_FRAME_RATE = 15  # frames per second, also the update rate the volume ray casting adapts to, 0 disables
+INTERACTIVE_MIN_TRIANGLES = 50000
+INTERACTIVE_DIVISIONS = 64  # clustering bins along the longest axis of a reduced surface
+
+# direct volume rendering with multi-threaded CPU ray casting, instead of the brain and mask surfaces
+VOLUME_RENDERING = False  # start in volume rendering mode
+VOLUME_RENDER_THREADS = 0  # 0 uses every core
+
+# memory-lean mode for holding many cases at once: volumes are narrowed to the smallest lossless scalar type and the
+# intermediate outputs of the surface pipelines are freed once a surface is computed, they run again on demand
+LOW_MEMORY = False
+
+# loaded cases kept in memory while switching between the cases of a session
+CASE_CACHE_SIZE = 2 * 1024 ** 3  # bytes, the shown case is always kept
+
+# cases ahead in the review direction loaded in the background while the current case is viewed
+PREFETCH_CASES = 1  # 0 disables prefetching
+PREFETCH_WORKERS = 1  # cases loaded at the same time
+PREFETCH_MAX_MEMORY = 4 * 1024 ** 3  # bytes, no prefetch starts while the process uses more resident memory
+
+# mesh cache settings
+MESH_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".theia", "mesh_cache")
+MESH_CACHE_SIZE = 1024 ** 3  # bytes, 0 disables the cache
+
+# uncompressed copies of nii.gz volumes, memory mapped on later loads, worth it for volumes which are opened again and
+# again in the window, never used by the batch and evaluation workers which read every volume once
+NIFTI_SIDECAR = False
+NIFTI_SIDECAR_DIR = os.path.join(os.path.expanduser("~"), ".theia", "nifti_cache")
+NIFTI_SIDECAR_SIZE = 4 * 1024 ** 3  # bytes, 0 disables the sidecar cache
+
+# pipeline instrumentation, every finished stage is appended as a JSON line to this file (None disables the log)
+PIPELINE_STATS_LOG = None
+PIPELINE_STATS_RECORDS = 1000  # latest measurements kept in memory, the summary counts every run
+
+# headless batch settings
+BATCH_IMAGE_PATTERNS = ["*t1ce*.nii.gz", "*t1ce*.nii"]  # case insensitive, first match in a case directory is used
+BATCH_MASK_PATTERNS = ["*mask*.nii.gz", "*mask*.nii", "*seg*.nii.gz", "*seg*.nii", "*truth*.nii.gz", "*truth*.nii"]
+BATCH_SCREENSHOT_SIZE = 512  # pixels, screenshots are square
+BATCH_MESH_FORMAT = "vtp"  # "vtp", "ply" or "glb", see meshUtils
+
+# local render service, see render_service.py
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8080
+SERVICE_WORKERS = 2  # off-screen render windows, each keeps the cases it loaded
+SERVICE_CASE_CACHE_SIZE = 1 * 1024 ** 3  # bytes of loaded cases per worker
+SERVICE_FRAME_SIZE = 512  # default frame size in pixels
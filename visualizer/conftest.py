@@ -0,0 +1,10 @@
+import pytest
+
+import vtkUtils
+
+
+@pytest.fixture(autouse=True)
+def disable_caches(monkeypatch):
+    """Keep tests from reading or writing the mesh and sidecar caches in the home directory."""
+    monkeypatch.setattr(vtkUtils.mesh_cache, 'max_size', 0)
+    monkeypatch.setattr(vtkUtils, 'NIFTI_SIDECAR', False)
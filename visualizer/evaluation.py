@@ -0,0 +1,101 @@
+"""
+Batch evaluation of segmentations: Dice, Jaccard and Hausdorff distance of every label between paired masks, computed
+on a process pool and written as CSV with one row per case and label.
+
+    python visualizer/brain_tumor_3d.py evaluate ./ground_truth ./predictions -o metrics.csv -j 8
+
+A mask directory holds either one sub directory per case (the mask is found by file name pattern, see
+BATCH_MASK_PATTERNS) or the masks themselves, named after their case (`<case>.nii.gz`).
+"""
+import csv
+import multiprocessing
+import os
+import time
+
+from batch import init_worker, match_file
+from vtkUtils import *
+
+CSV_COLUMNS = ['case', 'label', 'reference_voxels', 'prediction_voxels', 'reference_volume_mm3',
+               'prediction_volume_mm3', 'dice', 'jaccard', 'hausdorff_mm']
+
+
+def find_masks(path, mask_patterns=BATCH_MASK_PATTERNS):
+    """
+    :param path: a directory of masks or of case sub directories
+    :return: dict of case name -> mask file
+    """
+    masks = {}
+    for name in sorted(os.listdir(path)):
+        entry = os.path.join(path, name)
+        if os.path.isdir(entry):
+            mask = match_file(entry, mask_patterns)
+            if mask:
+                masks[name] = mask
+        elif name.lower().endswith(('.nii', '.nii.gz')):
+            masks[modality_name(entry)] = entry
+    return masks
+
+
+def pair_masks(reference_path, prediction_path, mask_patterns=BATCH_MASK_PATTERNS):
+    """
+    Pairs the masks of two directories by case name, see find_masks.
+    :return: list of (case name, reference mask file, prediction mask file or None if the case has no prediction)
+    """
+    references = find_masks(reference_path, mask_patterns)
+    predictions = find_masks(prediction_path, mask_patterns)
+    return [(name, references[name], predictions.get(name)) for name in sorted(references)]
+
+
+def evaluate_pair(pair):
+    """
+    :param pair: (case name, reference mask file, prediction mask file)
+    :return: (case name, list of CSV rows as dicts, error message or None, seconds spent)
+    """
+    name, reference_file, prediction_file = pair
+    start = time.time()
+    rows = []
+    try:
+        if prediction_file is None:
+            raise IOError('no prediction for this case')
+        reference, prediction = read_volume(reference_file), read_volume(prediction_file)
+        reference_index = build_label_index(reference.GetOutput())
+        prediction_index = build_label_index(prediction.GetOutput())
+        metrics = overlap_metrics(reference.GetOutput(), prediction.GetOutput(), reference_index, prediction_index)
+        spacing = reference.GetOutput().GetSpacing()
+        voxel_volume = spacing[0] * spacing[1] * spacing[2]
+        for label, values in metrics.items():
+            rows.append({'case': name, 'label': label,
+                         'reference_voxels': values['reference'], 'prediction_voxels': values['prediction'],
+                         'reference_volume_mm3': values['reference'] * voxel_volume,
+                         'prediction_volume_mm3': values['prediction'] * voxel_volume,
+                         'dice': values['dice'], 'jaccard': values['jaccard'], 'hausdorff_mm': values['hausdorff']})
+    except Exception as e:
+        return name, [], '{}: {}'.format(type(e).__name__, e), time.time() - start
+    return name, rows, None, time.time() - start
+
+
+def write_metrics(rows, output_file):
+    with open(output_file, 'w', newline='') as f:
+        writer = csv.DictWriter(f, CSV_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def run_evaluation(pairs, output_file, workers=None):
+    """
+    Evaluates every pair of masks on a process pool, printing one line per finished case, and writes the rows of all
+    cases to output_file in the order of pairs.
+    :param pairs: list of (case name, reference mask file, prediction mask file), see pair_masks
+    :param workers: number of worker processes, defaults to the number of CPUs
+    :return: list of (case name, error message) of the failed cases
+    """
+    failures, results = [], {}
+    with multiprocessing.Pool(workers, initializer=init_worker, initargs=(False,)) as pool:
+        for i, (name, rows, error, seconds) in enumerate(pool.imap_unordered(evaluate_pair, pairs), 1):
+            status = 'failed: ' + error if error else 'ok'
+            print('[{}/{}] {}: {} ({:.1f}s)'.format(i, len(pairs), name, status, seconds), flush=True)
+            results[name] = rows
+            if error:
+                failures.append((name, error))
+    write_metrics([row for name, _, _ in pairs for row in results[name]], output_file)
+    return failures
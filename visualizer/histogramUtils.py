@@ -0,0 +1,37 @@
+import numpy as np
+from vtk.util import numpy_support
+
+
+def volume_histogram(image, bins):
+    """
+    Counts the voxels of a volume per intensity bin with a single vectorized pass.
+    :param image: the vtkImageData of the volume, only the first component is counted
+    :param bins: number of equally wide bins between the minimum and maximum of the volume
+    :return: (counts, edges) numpy arrays as returned by numpy.histogram, edges has bins + 1 entries
+    """
+    voxels = numpy_support.vtk_to_numpy(image.GetPointData().GetScalars())
+    if voxels.ndim > 1:
+        voxels = voxels[:, 0]
+    low, high = image.GetScalarRange()
+    if high <= low:
+        high = low + 1
+    return np.histogram(voxels, bins=bins, range=(low, high))
+
+
+def otsu_threshold(counts, edges):
+    """
+    Otsu's method: the threshold which maximizes the variance between the voxels below and above it. On a scan this
+    separates the background (air) from the tissue.
+    :param counts: voxels per bin, see volume_histogram
+    :param edges: the bin edges
+    :return: the threshold, an edge between two bins
+    """
+    counts = np.asarray(counts, dtype=np.float64)
+    centers = (edges[:-1] + edges[1:]) / 2
+    below = np.cumsum(counts)[:-1]
+    above = counts.sum() - below
+    below_sum = np.cumsum(counts * centers)[:-1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        variance = below * above * (below_sum / below - (np.dot(counts, centers) - below_sum) / above) ** 2
+    variance[~np.isfinite(variance)] = 0
+    return float(edges[int(np.argmax(variance)) + 1])
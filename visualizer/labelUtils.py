@@ -0,0 +1,224 @@
+import colorsys
+import math
+
+import numpy as np
+import vtk
+from vtk.util import numpy_support
+
+
+def label_value(value):
+    """:return: the label as int if it is integral (labels stored as floats), otherwise as float"""
+    return int(value) if float(value).is_integer() else float(value)
+
+
+def build_label_index(image):
+    """
+    Finds every label present in a mask with a single vectorized pass over its voxels.
+    :param image: the vtkImageData of the mask, 0 is background
+    :return: dict of label value -> {'count': number of voxels, 'extent': (xmin, xmax, ymin, ymax, zmin, zmax),
+             'centroid': (x, y, z)}, the extent (bounding box) and centroid (mean voxel position) of the label are in
+             the structured coordinates of the image, sorted by label value
+    """
+    voxels = numpy_support.vtk_to_numpy(image.GetPointData().GetScalars())
+    if voxels.ndim > 1:
+        voxels = voxels[:, 0]
+
+    indices = np.flatnonzero(voxels)
+    values = voxels[indices]
+    order = np.argsort(values, kind='stable')  # radix sort for small integer types
+    indices, values = indices[order], values[order]
+    labels, starts, counts = np.unique(values, return_index=True, return_counts=True)
+    if not len(labels):
+        return {}
+
+    extent = image.GetExtent()
+    nx, ny = image.GetDimensions()[:2]
+    coordinates = [indices % nx, (indices // nx) % ny, indices // (nx * ny)]  # x varies fastest
+    bounds, centroids = [], []
+    for axis, coordinate in enumerate(coordinates):
+        bounds.append(np.minimum.reduceat(coordinate, starts) + extent[2 * axis])
+        bounds.append(np.maximum.reduceat(coordinate, starts) + extent[2 * axis])
+        centroids.append(np.add.reduceat(coordinate, starts) / counts + extent[2 * axis])
+
+    index = {}
+    for i, value in enumerate(labels):
+        index[label_value(value)] = {'count': int(counts[i]), 'extent': tuple(int(b[i]) for b in bounds),
+                                     'centroid': tuple(float(c[i]) for c in centroids)}
+    return index
+
+
+def label_statistics(image, label_index=None):
+    """
+    Physical size and position of every label of a mask.
+    :param image: the vtkImageData of the mask
+    :param label_index: the build_label_index of image if it is already known, saves the pass over the voxels
+    :return: dict of label value -> {'count': voxels, 'volume': mm^3, 'centroid': (x, y, z) mm,
+             'bounds': (xmin, xmax, ymin, ymax, zmin, zmax) mm of the voxel centers}, sorted by label value
+    """
+    if label_index is None:
+        label_index = build_label_index(image)
+    spacing, origin = image.GetSpacing(), image.GetOrigin()
+    voxel_volume = spacing[0] * spacing[1] * spacing[2]
+    statistics = {}
+    for value, info in label_index.items():
+        statistics[value] = {'count': info['count'],
+                             'volume': info['count'] * voxel_volume,
+                             'centroid': tuple(origin[i] + spacing[i] * info['centroid'][i] for i in range(3)),
+                             'bounds': tuple(origin[i // 2] + spacing[i // 2] * info['extent'][i] for i in range(6))}
+    return statistics
+
+
+def confusion_counts(reference, prediction):
+    """
+    Counts the voxels of every pair of (reference, prediction) values with a single vectorized pass.
+    :param reference: flat numpy array of labels
+    :param prediction: flat numpy array of labels, as long as reference
+    :return: (values, counts), counts[i, j] is the number of voxels with values[i] in reference and values[j] in
+             prediction
+    """
+    if reference.dtype.kind in 'ui' and prediction.dtype.kind in 'ui' and \
+            min(reference.min(), prediction.min()) >= 0 and max(reference.max(), prediction.max()) < 1024:
+        n = int(max(reference.max(), prediction.max())) + 1
+        counts = np.bincount(reference.astype(np.int64) * n + prediction, minlength=n * n).reshape(n, n)
+        present = np.flatnonzero(counts.sum(axis=0) + counts.sum(axis=1))
+        return present, counts[np.ix_(present, present)]
+
+    values, inverse = np.unique(np.concatenate([reference, prediction]), return_inverse=True)
+    n = len(values)
+    inverse = inverse.ravel()
+    counts = np.bincount(inverse[:len(reference)] * n + inverse[len(reference):], minlength=n * n).reshape(n, n)
+    return values, counts
+
+
+def boundary_points(voxels, extent, spacing, origin):
+    """
+    :param voxels: boolean numpy array [z, y, x] of a label within extent of an image
+    :return: vtkPoints at the centers of the voxels of the label with a 6-neighbour outside of it, in mm
+    """
+    padded = np.pad(voxels, 1)
+    interior = padded[:-2, 1:-1, 1:-1] & padded[2:, 1:-1, 1:-1] & padded[1:-1, :-2, 1:-1] & \
+        padded[1:-1, 2:, 1:-1] & padded[1:-1, 1:-1, :-2] & padded[1:-1, 1:-1, 2:]
+    z, y, x = np.nonzero(voxels & ~interior)
+    coordinates = np.column_stack([origin[i] + spacing[i] * (c + extent[2 * i]) for i, c in enumerate((x, y, z))])
+    points = vtk.vtkPoints()
+    points.SetData(numpy_support.numpy_to_vtk(np.ascontiguousarray(coordinates, dtype=np.float64), deep=True))
+    return points
+
+
+def hausdorff_distance(points_a, points_b):
+    """:return: the symmetric Hausdorff distance between two vtkPoints, the largest distance to the nearest point"""
+    point_sets = []
+    for points in (points_a, points_b):
+        point_set = vtk.vtkPolyData()
+        point_set.SetPoints(points)
+        point_sets.append(point_set)
+    hausdorff = vtk.vtkHausdorffDistancePointSetFilter()
+    hausdorff.SetInputData(0, point_sets[0])
+    hausdorff.SetInputData(1, point_sets[1])
+    hausdorff.SetTargetDistanceMethodToPointToPoint()
+    hausdorff.Update()
+    return hausdorff.GetHausdorffDistance()
+
+
+def overlap_metrics(reference, prediction, reference_index=None, prediction_index=None):
+    """
+    Compares two masks label by label. Dice and Jaccard come from one pass over both masks counting the voxel pairs
+    (see confusion_counts), the Hausdorff distance is computed between the boundary voxels of a label in both masks,
+    cropped to the bounding boxes of the label.
+    :param reference: the vtkImageData of the reference (ground truth) mask
+    :param prediction: the vtkImageData of the mask to evaluate, on the same voxel grid as reference
+    :param reference_index: the build_label_index of reference if it is already known, likewise prediction_index
+    :return: dict of label value -> {'reference': voxels, 'prediction': voxels, 'dice', 'jaccard',
+             'hausdorff': mm, nan if the label is missing from one of the masks}, for every label of either mask
+    :raise ValueError: if the masks are not on the same voxel grid
+    """
+    if reference.GetDimensions() != prediction.GetDimensions():
+        raise ValueError('the masks have different dimensions: {} and {}'.format(reference.GetDimensions(),
+                                                                                prediction.GetDimensions()))
+    if not np.allclose(reference.GetSpacing(), prediction.GetSpacing(), rtol=1e-4):
+        raise ValueError('the masks have different spacings: {} and {}'.format(reference.GetSpacing(),
+                                                                              prediction.GetSpacing()))
+    arrays = []
+    for image in (reference, prediction):
+        voxels = numpy_support.vtk_to_numpy(image.GetPointData().GetScalars())
+        arrays.append(voxels[:, 0] if voxels.ndim > 1 else voxels)
+    values, counts = confusion_counts(*arrays)
+    reference_index = build_label_index(reference) if reference_index is None else reference_index
+    prediction_index = build_label_index(prediction) if prediction_index is None else prediction_index
+
+    nx, ny, nz = reference.GetDimensions()
+    x0, _, y0, _, z0, _ = reference.GetExtent()
+    volumes = [arrays[0].reshape(nz, ny, nx), arrays[1].reshape(nz, ny, nx)]
+    metrics = {}
+    for i, value in enumerate(values):
+        value = label_value(value)
+        if value == 0:
+            continue
+        in_reference, in_prediction, both = int(counts[i].sum()), int(counts[:, i].sum()), int(counts[i, i])
+        metrics[value] = {'reference': in_reference, 'prediction': in_prediction,
+                          'dice': 2.0 * both / (in_reference + in_prediction),
+                          'jaccard': float(both) / (in_reference + in_prediction - both),
+                          'hausdorff': float('nan')}
+        if value not in reference_index or value not in prediction_index:
+            continue
+
+        extent = union_extent([reference_index[value]['extent'], prediction_index[value]['extent']])
+        box = (slice(extent[4] - z0, extent[5] - z0 + 1), slice(extent[2] - y0, extent[3] - y0 + 1),
+               slice(extent[0] - x0, extent[1] - x0 + 1))
+        points = [boundary_points(volume[box] == value, extent, reference.GetSpacing(), reference.GetOrigin())
+                  for volume in volumes]
+        metrics[value]['hausdorff'] = hausdorff_distance(*points)
+    return metrics
+
+
+def pad_extent(extent, whole_extent, padding=1):
+    """:return: extent grown by padding voxels on every side, clamped to whole_extent"""
+    return tuple(max(extent[i] - padding, whole_extent[i]) if i % 2 == 0 else
+                 min(extent[i] + padding, whole_extent[i]) for i in range(6))
+
+
+def union_extent(extents):
+    """:return: the smallest extent containing every extent in extents"""
+    extents = list(extents)
+    return tuple(min(e[i] for e in extents) if i % 2 == 0 else max(e[i] for e in extents) for i in range(6))
+
+
+def extent_volume(extent):
+    """:return: the number of voxels in extent"""
+    return (extent[1] - extent[0] + 1) * (extent[3] - extent[2] + 1) * (extent[5] - extent[4] + 1)
+
+
+def generate_palette(n_colors, base_colors=()):
+    """
+    :param n_colors: number of colors needed
+    :param base_colors: colors used first, e.g. MASK_COLORS
+    :return: list of n_colors RGB tuples, the colors after base_colors step around the hue circle by the golden angle
+             so neighbouring labels stay distinguishable however many there are
+    """
+    colors = [tuple(c) for c in base_colors[:n_colors]]
+    hue = 0.0
+    while len(colors) < n_colors:
+        hue = (hue + 0.618033988749895) % 1.0
+        saturation, value = (0.75, 0.95) if len(colors) % 2 else (0.55, 0.8)
+        colors.append(colorsys.hsv_to_rgb(hue, saturation, value))
+    return colors
+
+
+def allocate_triangles(counts, budget):
+    """
+    Splits a triangle budget across surfaces by size. Shares grow with the square root of the extracted triangle
+    count, so large surfaces get more triangles but small ones (e.g. tumor labels) are never decimated to nothing.
+    Surfaces smaller than their share keep every triangle and the rest goes to the larger surfaces (water filling).
+    :param counts: number of extracted (undecimated) triangles per surface
+    :param budget: total number of triangles
+    :return: list of triangle targets, in the order of counts
+    """
+    targets = [0] * len(counts)
+    remaining = budget
+    weight = sum(math.sqrt(c) for c in counts)
+    for i in sorted(range(len(counts)), key=lambda i: counts[i]):  # the smallest surfaces saturate first
+        share = remaining * math.sqrt(counts[i]) / weight if weight else 0
+        targets[i] = min(counts[i], int(share))
+        remaining -= targets[i]
+        weight -= math.sqrt(counts[i])
+    return targets
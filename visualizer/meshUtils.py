@@ -0,0 +1,362 @@
+import json
+import os
+import struct
+
+import numpy as np
+import vtk
+from vtk.util import numpy_support
+
+from vtkUtils import *
+
+MESH_FORMATS = ('vtp', 'ply', 'glb')
+MANIFEST_FILE = 'meshes.json'
+POSITION_LEVELS = 2 ** 16 - 1  # positions are quantized to 16 bits over the largest extent of the surface
+NORMAL_LEVELS = 127  # normals are quantized to signed 8 bits per component
+
+'''
+Surfaces are exported in compact binary formats:
+    vtp     one zlib compressed VTP per label with uint16 points and int8 normals. The dequantization is stored in
+            the file: point = point * QuantizationScale + QuantizationOrigin (field data arrays), normal =
+            QuantizedNormals / 127 (point data array). Other tools need that transform applied, load_surfaces does it.
+    ply     one binary PLY per label with float32 points and normals, not quantized, for tools like MeshLab
+    glb     a single binary glTF with a node per label, uint16 positions and int8 normals (KHR_mesh_quantization),
+            which glTF viewers dequantize through the node transform
+The positions are quantized with the same step on every axis, so the scale of a glTF node is uniform and does not
+distort the normals it is applied to. Next to the vtp and ply files a meshes.json manifest stores the name, value,
+color and opacity of every label.
+'''
+
+
+def surface_arrays(polydata):
+    """
+    :return: (points float32 (n, 3), normals float32 (n, 3) or None, triangles int64 (m, 3), cell scalars or None)
+    """
+    polys = polydata.GetPolys()
+    if polys.GetNumberOfCells() != polydata.GetNumberOfCells() or polys.GetMaxCellSize() > 3:
+        triangulate = vtk.vtkTriangleFilter()
+        triangulate.SetInputData(polydata)
+        triangulate.Update()
+        polydata = triangulate.GetOutput()
+
+    points = numpy_support.vtk_to_numpy(polydata.GetPoints().GetData()).astype(np.float32) \
+        if polydata.GetNumberOfPoints() else np.zeros((0, 3), np.float32)
+    normals = polydata.GetPointData().GetNormals()
+    normals = numpy_support.vtk_to_numpy(normals).astype(np.float32) if normals is not None else None
+    connectivity = numpy_support.vtk_to_numpy(polydata.GetPolys().GetConnectivityArray())
+    triangles = connectivity.reshape(-1, 3).astype(np.int64)
+    scalars = polydata.GetCellData().GetScalars()
+    scalars = numpy_support.vtk_to_numpy(scalars) if scalars is not None else None
+    return points, normals, triangles, scalars
+
+
+def split_surface(points, normals, triangles, cell_values, value):
+    """:return: (points, normals, triangles) of the triangles with the given cell value, points re-indexed"""
+    triangles = triangles[cell_values == value]
+    used, triangles = np.unique(triangles, return_inverse=True)
+    return points[used], normals[used] if normals is not None else None, triangles.reshape(-1, 3)
+
+
+def quantize_positions(points):
+    """
+    :return: (uint16 grid coordinates, origin, scale), points ~= grid * scale + origin, the scale is the same on every
+             axis
+    """
+    origin = points.min(axis=0) if len(points) else np.zeros(3, np.float32)
+    extent = float((points.max(axis=0) - origin).max()) if len(points) else 0.0
+    scale = np.full(3, extent / POSITION_LEVELS if extent > 0 else 1.0)
+    grid = np.round((points - origin) / scale).astype(np.uint16)
+    return grid, origin.astype(np.float64), scale
+
+
+def quantize_normals(normals):
+    return np.round(np.clip(normals, -1, 1) * NORMAL_LEVELS).astype(np.int8)
+
+
+def dequantize_normals(normals, scale=None):
+    """
+    :param scale: optional per axis scale of the glTF node, the normals are transformed like a viewer does
+    """
+    normals = normals.astype(np.float32) / NORMAL_LEVELS
+    if scale is not None:
+        normals = normals / np.asarray(scale, np.float32)  # inverse transpose of a scale matrix
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    return normals / np.where(lengths > 0, lengths, 1)
+
+
+def create_polydata(points, normals, triangles):
+    polydata = vtk.vtkPolyData()
+    vtk_points = vtk.vtkPoints()
+    vtk_points.SetData(numpy_support.numpy_to_vtk(np.ascontiguousarray(points, np.float32), deep=True))
+    polydata.SetPoints(vtk_points)
+    polys = vtk.vtkCellArray()
+    offsets = np.arange(0, 3 * len(triangles) + 1, 3, dtype=np.int64)
+    polys.SetData(numpy_support.numpy_to_vtkIdTypeArray(offsets, deep=True),
+                  numpy_support.numpy_to_vtkIdTypeArray(np.ascontiguousarray(triangles.ravel(), np.int64), deep=True))
+    polydata.SetPolys(polys)
+    if normals is not None:
+        vtk_normals = numpy_support.numpy_to_vtk(np.ascontiguousarray(normals, np.float32), deep=True)
+        vtk_normals.SetName('Normals')
+        polydata.GetPointData().SetNormals(vtk_normals)
+    return polydata
+
+
+def write_vtp(points, normals, triangles, file_name):
+    grid, origin, scale = quantize_positions(points)
+    polydata = vtk.vtkPolyData()
+    vtk_points = vtk.vtkPoints()
+    vtk_points.SetData(numpy_support.numpy_to_vtk(grid, deep=True))
+    polydata.SetPoints(vtk_points)
+    polydata.SetPolys(create_polydata(points, None, triangles).GetPolys())
+    if normals is not None:
+        vtk_normals = numpy_support.numpy_to_vtk(quantize_normals(normals), deep=True)
+        vtk_normals.SetName('QuantizedNormals')
+        polydata.GetPointData().AddArray(vtk_normals)
+    for name, values in (('QuantizationOrigin', origin), ('QuantizationScale', scale)):
+        array = numpy_support.numpy_to_vtk(values, deep=True)
+        array.SetName(name)
+        polydata.GetFieldData().AddArray(array)
+
+    writer = vtk.vtkXMLPolyDataWriter()
+    writer.SetFileName(file_name)
+    writer.SetInputData(polydata)
+    writer.SetDataModeToAppended()
+    writer.EncodeAppendedDataOff()
+    writer.SetCompressorTypeToZLib()
+    writer.Write()
+
+
+def read_vtp(file_name):
+    reader = vtk.vtkXMLPolyDataReader()
+    reader.SetFileName(file_name)
+    reader.Update()
+    polydata = reader.GetOutput()
+    field_data = polydata.GetFieldData()
+    origin = numpy_support.vtk_to_numpy(field_data.GetArray('QuantizationOrigin'))
+    scale = numpy_support.vtk_to_numpy(field_data.GetArray('QuantizationScale'))
+    points = numpy_support.vtk_to_numpy(polydata.GetPoints().GetData()) * scale + origin
+    normals = polydata.GetPointData().GetArray('QuantizedNormals')
+    normals = dequantize_normals(numpy_support.vtk_to_numpy(normals)) if normals is not None else None
+    triangles = numpy_support.vtk_to_numpy(polydata.GetPolys().GetConnectivityArray()).reshape(-1, 3)
+    return create_polydata(points, normals, triangles)
+
+
+def write_ply(points, normals, triangles, file_name):
+    vertex_fields = [('x', '<f4'), ('y', '<f4'), ('z', '<f4')]
+    if normals is not None:
+        vertex_fields += [('nx', '<f4'), ('ny', '<f4'), ('nz', '<f4')]
+    vertices = np.empty(len(points), dtype=vertex_fields)
+    vertices['x'], vertices['y'], vertices['z'] = points.T
+    if normals is not None:
+        vertices['nx'], vertices['ny'], vertices['nz'] = normals.T
+    faces = np.empty(len(triangles), dtype=[('n', 'u1'), ('indices', '<i4', (3,))])
+    faces['n'] = 3
+    faces['indices'] = triangles
+
+    header = ['ply', 'format binary_little_endian 1.0', 'element vertex {}'.format(len(points)),
+              'property float x', 'property float y', 'property float z']
+    if normals is not None:
+        header += ['property float nx', 'property float ny', 'property float nz']
+    header += ['element face {}'.format(len(triangles)), 'property list uchar int vertex_indices', 'end_header']
+    with open(file_name, 'wb') as f:
+        f.write(('\n'.join(header) + '\n').encode('ascii'))
+        f.write(vertices.tobytes())
+        f.write(faces.tobytes())
+
+
+def read_ply(file_name):
+    reader = vtk.vtkPLYReader()
+    reader.SetFileName(file_name)
+    reader.Update()
+    points, normals, triangles, _ = surface_arrays(reader.GetOutput())
+    return create_polydata(points, normals, triangles)
+
+
+def write_glb(surfaces, file_name):
+    """
+    :param surfaces: list of dicts with name, value, color, opacity and the points, normals and triangles of a label
+    """
+    gltf = {'asset': {'version': '2.0', 'generator': APPLICATION_TITLE},
+            'extensionsUsed': ['KHR_mesh_quantization'], 'extensionsRequired': ['KHR_mesh_quantization'],
+            'scene': 0, 'scenes': [{'nodes': list(range(len(surfaces)))}],
+            'nodes': [], 'meshes': [], 'materials': [], 'accessors': [], 'bufferViews': []}
+    chunks = []
+    offset = 0
+
+    def add_view(data, target, stride=None):
+        nonlocal offset
+        view = {'buffer': 0, 'byteOffset': offset, 'byteLength': len(data), 'target': target}
+        if stride:
+            view['byteStride'] = stride
+        gltf['bufferViews'].append(view)
+        padding = (4 - len(data) % 4) % 4  # every view starts 4 byte aligned
+        chunks.append(data + b'\0' * padding)
+        offset += len(data) + padding
+        return len(gltf['bufferViews']) - 1
+
+    def add_accessor(view, component_type, count, accessor_type, **extra):
+        gltf['accessors'].append(dict(bufferView=view, componentType=component_type, count=count, type=accessor_type,
+                                      **extra))
+        return len(gltf['accessors']) - 1
+
+    for i, surface in enumerate(surfaces):
+        grid, origin, scale = quantize_positions(surface['points'])
+        # vertex attributes have to be 4 byte aligned, so every position and normal is padded to 4 components
+        padded = np.zeros((len(grid), 4), np.uint16)
+        padded[:, :3] = grid
+        attributes = {'POSITION': add_accessor(add_view(padded.tobytes(), 34962, 8), 5123, len(grid), 'VEC3',
+                                               min=grid.min(axis=0).tolist() if len(grid) else [0, 0, 0],
+                                               max=grid.max(axis=0).tolist() if len(grid) else [0, 0, 0])}
+        if surface['normals'] is not None:
+            padded = np.zeros((len(grid), 4), np.int8)
+            padded[:, :3] = quantize_normals(surface['normals'])
+            attributes['NORMAL'] = add_accessor(add_view(padded.tobytes(), 34962, 4), 5120, len(grid), 'VEC3',
+                                                normalized=True)
+        indices = add_accessor(add_view(surface['triangles'].astype(np.uint32).tobytes(), 34963), 5125,
+                               surface['triangles'].size, 'SCALAR')
+
+        color = list(surface['color']) + [surface['opacity']]
+        gltf['materials'].append({'name': surface['name'], 'doubleSided': True,
+                                  'alphaMode': 'BLEND' if surface['opacity'] < 1 else 'OPAQUE',
+                                  'pbrMetallicRoughness': {'baseColorFactor': color, 'metallicFactor': 0.0,
+                                                           'roughnessFactor': 1.0}})
+        gltf['meshes'].append({'name': surface['name'],
+                               'primitives': [{'attributes': attributes, 'indices': indices, 'material': i}]})
+        gltf['nodes'].append({'name': surface['name'], 'mesh': i, 'translation': origin.tolist(),
+                              'scale': scale.tolist(), 'extras': {'value': surface['value']}})
+
+    binary = b''.join(chunks)
+    gltf['buffers'] = [{'byteLength': len(binary)}]
+    content = json.dumps(gltf, separators=(',', ':')).encode('utf-8')
+    content += b' ' * ((4 - len(content) % 4) % 4)
+    with open(file_name, 'wb') as f:
+        f.write(struct.pack('<4sII', b'glTF', 2, 12 + 8 + len(content) + 8 + len(binary)))
+        f.write(struct.pack('<I4s', len(content), b'JSON') + content)
+        f.write(struct.pack('<I4s', len(binary), b'BIN\0') + binary)
+
+
+def read_glb(file_name):
+    """
+    Reads a GLB written by write_glb, the node transform is applied to the positions and normals.
+    :return: list of dicts with name, value, color, opacity and polydata of every node
+    """
+    with open(file_name, 'rb') as f:
+        data = f.read()
+    magic, version, _ = struct.unpack_from('<4sII', data, 0)
+    if magic != b'glTF' or version != 2:
+        raise IOError("'{}' is not a binary glTF 2.0 file".format(file_name))
+    json_length, _ = struct.unpack_from('<I4s', data, 12)
+    gltf = json.loads(data[20:20 + json_length].decode('utf-8'))
+    binary = data[20 + json_length + 8:]
+
+    component_types = {5120: np.int8, 5121: np.uint8, 5122: np.int16, 5123: np.uint16, 5125: np.uint32,
+                       5126: np.float32}
+    component_counts = {'SCALAR': 1, 'VEC3': 3, 'VEC4': 4}
+
+    def read_accessor(index):
+        accessor = gltf['accessors'][index]
+        view = gltf['bufferViews'][accessor['bufferView']]
+        dtype = np.dtype(component_types[accessor['componentType']])
+        n_components = component_counts[accessor['type']]
+        stride = view.get('byteStride', dtype.itemsize * n_components) // dtype.itemsize
+        start = view['byteOffset'] + accessor.get('byteOffset', 0)
+        values = np.frombuffer(binary, dtype, accessor['count'] * stride, start).reshape(-1, stride)
+        return values[:, :n_components]
+
+    surfaces = []
+    for node in gltf['nodes']:
+        primitive = gltf['meshes'][node['mesh']]['primitives'][0]
+        scale = np.array(node.get('scale', [1, 1, 1]))
+        translation = np.array(node.get('translation', [0, 0, 0]))
+        points = read_accessor(primitive['attributes']['POSITION']) * scale + translation
+        normals = dequantize_normals(read_accessor(primitive['attributes']['NORMAL']), scale) \
+            if 'NORMAL' in primitive['attributes'] else None
+        triangles = read_accessor(primitive['indices']).reshape(-1, 3).astype(np.int64)
+        color = gltf['materials'][primitive['material']]['pbrMetallicRoughness']['baseColorFactor']
+        surfaces.append({'name': node['name'], 'value': node.get('extras', {}).get('value'), 'color': color[:3],
+                         'opacity': color[3], 'polydata': create_polydata(points, normals, triangles)})
+    return surfaces
+
+
+def label_surfaces(nii_objects):
+    """
+    :return: list of dicts with name, value, color, opacity, points, normals and triangles of every rendered surface,
+             the compact surface of a mask is split into one surface per label
+    """
+    surfaces = []
+    for nii_object in nii_objects:
+        for label in surface_labels(nii_object):
+            points, normals, triangles, scalars = surface_arrays(label.mapper.GetInput())
+            if label is not nii_object.compact_label:
+                surfaces.append({'name': label.name, 'value': label.value, 'color': list(label.color),
+                                 'opacity': label.property.GetOpacity(), 'points': points, 'normals': normals,
+                                 'triangles': triangles})
+                continue
+            for mask_label in nii_object.labels:
+                label_points, label_normals, label_triangles = split_surface(points, normals, triangles, scalars,
+                                                                             mask_label.value)
+                if len(label_triangles):
+                    surfaces.append({'name': mask_label.name, 'value': mask_label.value,
+                                     'color': list(mask_label.color), 'opacity': mask_label.opacity,
+                                     'points': label_points, 'normals': label_normals,
+                                     'triangles': label_triangles})
+    return surfaces
+
+
+def export_surfaces(nii_objects, directory, mesh_format='glb'):
+    """
+    Writes the rendered surfaces of nii_objects (e.g. brain and mask) to directory, see the formats above.
+    :return: list of the written files
+    """
+    if mesh_format not in MESH_FORMATS:
+        raise ValueError("Unknown mesh format '{}', expected one of {}".format(mesh_format, ', '.join(MESH_FORMATS)))
+    os.makedirs(directory, exist_ok=True)
+    surfaces = label_surfaces(nii_objects)
+    if mesh_format == 'glb':
+        file_name = os.path.join(directory, 'meshes.glb')
+        write_glb(surfaces, file_name)
+        return [file_name]
+
+    write = write_vtp if mesh_format == 'vtp' else write_ply
+    manifest, files = [], []
+    for surface in surfaces:
+        file_name = surface['name'].replace(' ', '_') + '.' + mesh_format
+        write(surface['points'], surface['normals'], surface['triangles'], os.path.join(directory, file_name))
+        manifest.append({'name': surface['name'], 'value': surface['value'], 'color': surface['color'],
+                         'opacity': surface['opacity'], 'file': file_name})
+        files.append(os.path.join(directory, file_name))
+    with open(os.path.join(directory, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return files + [os.path.join(directory, MANIFEST_FILE)]
+
+
+def load_surfaces(path, renderer=None):
+    """
+    Rebuilds the labels of exported surfaces without reading any volume.
+    :param path: a meshes.glb file or a directory exported as vtp or ply
+    :param renderer: optional vtkRenderer the actors are added to
+    :return: a NiiObject whose labels have a mapper, property and actor (no pipeline)
+    """
+    if os.path.isdir(path) and not os.path.isfile(os.path.join(path, MANIFEST_FILE)):
+        path = os.path.join(path, 'meshes.glb')
+    if os.path.isdir(path):
+        with open(os.path.join(path, MANIFEST_FILE)) as f:
+            surfaces = json.load(f)
+        for surface in surfaces:
+            file_name = os.path.join(path, surface['file'])
+            surface['polydata'] = read_vtp(file_name) if file_name.endswith('.vtp') else read_ply(file_name)
+    else:
+        surfaces = read_glb(path)
+
+    nii_object = NiiObject()
+    nii_object.file = path
+    for surface in surfaces:
+        label = NiiLabel(tuple(surface['color']), surface['opacity'], None)
+        label.name, label.value = surface['name'], surface['value']
+        label.mapper = create_mapper()
+        label.mapper.SetInputData(surface['polydata'])
+        label.property = create_property(label.opacity, label.color)
+        label.actor = create_actor(label.mapper, label.property)
+        nii_object.labels.append(label)
+        if renderer is not None:
+            renderer.AddActor(label.actor)
+    return nii_object
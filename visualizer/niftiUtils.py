@@ -0,0 +1,158 @@
+import gzip
+import hashlib
+import os
+import shutil
+import struct
+import sys
+import tempfile
+
+import numpy as np
+import vtk
+from vtk.util import numpy_support
+
+from MeshCache import evict_lru
+
+# NIfTI-1 datatype codes of the scalar types that can be mapped directly into a vtkImageData
+NIFTI_DTYPES = {2: np.uint8, 4: np.int16, 8: np.int32, 16: np.float32, 64: np.float64, 256: np.int8,
+                512: np.uint16, 768: np.uint32, 1024: np.int64, 1280: np.uint64}
+
+
+def read_header(file_name):
+    """
+    Reads the fields of an uncompressed NIfTI-1 header needed to map the voxels directly.
+    :param file_name: a '.nii' file
+    :return: dict with dims, spacing, dtype and offset of the voxel data, or None if the volume can not be memory
+             mapped (not a single file NIfTI-1 volume, not 3D scalar, non native byte order, flipped slice order, or
+             shorter than its header claims)
+    """
+    with open(file_name, 'rb') as f:
+        header = f.read(348)
+    if len(header) < 348:
+        return None
+
+    byte_order = '<' if sys.byteorder == 'little' else '>'
+    if struct.unpack(byte_order + 'i', header[:4])[0] != 348:
+        return None  # not a NIfTI-1 header, or not in native byte order
+    if header[344:348] != b'n+1\0':
+        return None  # not a single file NIfTI-1 volume ('ni1' keeps the voxels in a separate .img file)
+
+    dim = struct.unpack(byte_order + '8h', header[40:56])
+    datatype = struct.unpack(byte_order + 'h', header[70:72])[0]
+    pixdim = struct.unpack(byte_order + '8f', header[76:108])
+    vox_offset = int(struct.unpack(byte_order + 'f', header[108:112])[0])
+
+    # vtkNIFTIImageReader reverses the slice order for a negative qfac (pixdim[0]), leave those volumes to it
+    if dim[0] < 3 or any(d > 1 for d in dim[4:dim[0] + 1]) or datatype not in NIFTI_DTYPES or pixdim[0] < 0:
+        return None
+    dtype = np.dtype(NIFTI_DTYPES[datatype])
+    if min(dim[1:4]) < 1 or vox_offset < 348 or \
+            os.path.getsize(file_name) < vox_offset + dim[1] * dim[2] * dim[3] * dtype.itemsize:
+        return None
+
+    return {'dims': dim[1:4], 'spacing': pixdim[1:4], 'dtype': dtype,
+            'offset': vox_offset}
+
+
+def memory_map_volume(file_name):
+    """
+    Memory maps the voxels of an uncompressed NIfTI-1 file into a vtkImageImport without copying them. The mapping is
+    copy-on-write, so the file is never modified.
+    :param file_name: a '.nii' file
+    :return: vtkImageImport (https://www.vtk.org/doc/nightly/html/classvtkImageImport.html) or None if the volume can
+             not be memory mapped, see read_header
+    """
+    header = read_header(file_name)
+    if header is None:
+        return None
+
+    nx, ny, nz = header['dims']
+    voxels = np.memmap(file_name, dtype=header['dtype'], mode='c', offset=header['offset'], shape=(nx * ny * nz,))
+    return import_voxels(voxels, (0, nx - 1, 0, ny - 1, 0, nz - 1), header['spacing'], (0, 0, 0))
+
+
+def import_voxels(voxels, extent, spacing, origin):
+    """
+    Wraps a flat numpy array of voxels (x varies fastest) in a vtkImageImport without copying it.
+    :return: the updated vtkImageImport, it keeps voxels alive
+    """
+    importer = vtk.vtkImageImport()
+    importer.SetDataScalarType(numpy_support.get_vtk_array_type(voxels.dtype))
+    importer.SetNumberOfScalarComponents(1)
+    importer.SetDataExtent(*extent)
+    importer.SetWholeExtent(*extent)
+    importer.SetDataSpacing(*spacing)
+    importer.SetDataOrigin(*origin)
+    importer.SetImportVoidPointer(voxels, 1)  # 1: vtk never frees the memory
+    importer.voxels = voxels  # keeps the array (or mapping) alive as long as the importer
+    importer.Update()
+    return importer
+
+
+def narrowest_dtype(voxels):
+    """
+    :return: the smallest numpy dtype which holds every value of voxels exactly, e.g. uint8 for a label mask stored as
+             float32, or the dtype of voxels if there is none smaller
+    """
+    if not voxels.size:
+        return voxels.dtype
+    low, high = voxels.min(), voxels.max()
+    if voxels.dtype.kind == 'f':
+        if not np.isfinite(low) or not np.isfinite(high):
+            return voxels.dtype
+        if np.array_equal(voxels, np.floor(voxels)):
+            candidates = [np.uint8, np.int8, np.uint16, np.int16, np.uint32, np.int32]
+        elif voxels.dtype == np.float64 and np.array_equal(voxels, voxels.astype(np.float32)):
+            candidates = [np.float32]
+        else:
+            candidates = []
+    else:
+        candidates = [np.uint8, np.int8, np.uint16, np.int16, np.uint32, np.int32]
+
+    for dtype in map(np.dtype, candidates):
+        if dtype.itemsize >= voxels.dtype.itemsize:
+            break
+        if dtype.kind == 'f' or np.iinfo(dtype).min <= low and high <= np.iinfo(dtype).max:
+            return dtype
+    return voxels.dtype
+
+
+def narrow_volume(reader):
+    """
+    Converts a volume to the smallest scalar type holding its voxels without loss, see narrowest_dtype.
+    :param reader: a vtkImageImport or vtkNIFTIImageReader with a single component volume
+    :return: a vtkImageImport with the narrowed copy, or reader if the volume can not be narrowed
+    """
+    image = reader.GetOutput()
+    scalars = image.GetPointData().GetScalars()
+    if scalars is None or scalars.GetNumberOfComponents() != 1:
+        return reader
+    voxels = numpy_support.vtk_to_numpy(scalars)
+    dtype = narrowest_dtype(voxels)
+    if dtype == voxels.dtype:
+        return reader
+    return import_voxels(voxels.astype(dtype), image.GetExtent(), image.GetSpacing(), image.GetOrigin())
+
+
+def sidecar_file(file_name, directory, max_size):
+    """
+    Returns an uncompressed copy of a '.nii.gz' file, decompressing it once into the sidecar cache directory. Copies
+    are keyed by path, size and modification time of the original and evicted least recently used first once the
+    directory grows past max_size bytes.
+    :param file_name: a '.nii.gz' file
+    :return: the path of the uncompressed '.nii' copy
+    """
+    stat = os.stat(file_name)
+    key = '{}:{}:{}'.format(os.path.abspath(file_name), stat.st_size, stat.st_mtime)
+    sidecar = os.path.join(directory, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.nii')
+
+    if os.path.isfile(sidecar):
+        os.utime(sidecar)  # mark as recently used
+        return sidecar
+
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp('.tmp', dir=directory)
+    with os.fdopen(fd, 'wb') as out, gzip.open(file_name, 'rb') as f:
+        shutil.copyfileobj(f, out, 1 << 24)
+    os.replace(tmp_path, sidecar)
+    evict_lru(directory, max_size, '.nii', keep=sidecar)
+    return sidecar
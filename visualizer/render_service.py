@@ -0,0 +1,206 @@
+"""
+A local HTTP render service for the web viewer. Every worker thread owns an off-screen render window and keeps the
+cases it loaded in its own CaseCache, requests are queued on the worker pool and rendered concurrently.
+
+    python visualizer/brain_tumor_3d.py serve ./sample_data --port 8080 -j 2
+
+GET /cases                   JSON list of the case names
+GET /render?case=<name>&...  PNG frame of a case, optional parameters:
+    view                           camera preset, axial (default), coronal or sagittal
+    azimuth, elevation, roll       camera rotations in degrees, applied after the preset
+    zoom                           camera zoom factor, applied after the preset
+    threshold                      brain isosurface threshold, defaults to initial_threshold
+    brain                          0 hides the brain surface
+    labels                         comma separated mask labels to show, defaults to every label, 'none' hides the mask
+    size                           frame size in pixels, frames are square
+"""
+import json
+import threading
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from vtk.util import numpy_support
+
+from batch import VIEWS, create_offscreen_window
+from vtkUtils import *
+from CaseCache import *
+
+MAX_FRAME_SIZE = 4096
+
+
+def parse_render_query(query):
+    """
+    :param query: the query string of a /render request
+    :return: dict of the render parameters, see the module docstring, absent parameters are None
+    :raise ValueError: if a parameter is malformed
+    """
+    params = {k: v[-1] for k, v in urllib.parse.parse_qs(query).items()}
+    if not params.get('case'):
+        raise ValueError("missing parameter 'case'")
+    view = params.get('view', 'axial')
+    if view not in dict(VIEWS):
+        raise ValueError("unknown view '{}', expected one of {}".format(view, ', '.join(name for name, _ in VIEWS)))
+
+    request = {'case': params['case'], 'view': view}
+    try:
+        for name in ('azimuth', 'elevation', 'roll', 'zoom', 'threshold'):
+            request[name] = float(params[name]) if name in params else None
+        request['brain'] = params.get('brain', '1') not in ('0', 'false')
+        labels = params.get('labels')
+        request['labels'] = None if labels is None else \
+            set() if labels in ('', 'none') else {label_value(float(v)) for v in labels.split(',')}
+        request['size'] = int(params.get('size', SERVICE_FRAME_SIZE))
+    except ValueError as e:
+        raise ValueError('malformed parameter: {}'.format(e))
+    if not 16 <= request['size'] <= MAX_FRAME_SIZE:
+        raise ValueError('size must be between 16 and {}'.format(MAX_FRAME_SIZE))
+    if request['zoom'] is not None and request['zoom'] <= 0:
+        raise ValueError('zoom must be positive')
+    return request
+
+
+def apply_render_request(nii_case, request):
+    """Sets the brain threshold, label visibility and camera of a loaded case as requested."""
+    brain, mask, renderer = nii_case.brain, nii_case.mask, nii_case.renderer
+    label = brain.labels[0]
+    if label.actor is not None:
+        threshold = initial_threshold(brain) if request['threshold'] is None else request['threshold']
+        if threshold != label.value:
+            label.value = threshold
+            label.extractor.SetValue(0, threshold)
+            label.mapper.SetInputData(load_surface(brain, label))
+        label.actor.SetVisibility(request['brain'])
+
+    for label in mask.labels:
+        visible = request['labels'] is None or label.value in request['labels']
+        set_label_appearance(mask, label, label.color, label.opacity if visible else 0)
+    if mask.compact_label is not None:
+        mask.compact_label.mapper.GetLookupTable().Modified()
+
+    dict(VIEWS)[request['view']](renderer)
+    camera = renderer.GetActiveCamera()
+    for name, rotate in (('azimuth', camera.Azimuth), ('elevation', camera.Elevation), ('roll', camera.Roll)):
+        if request[name]:
+            rotate(request[name])
+    if request['elevation']:
+        camera.OrthogonalizeViewUp()
+    if request['zoom'] is not None:
+        camera.Zoom(request['zoom'])
+    renderer.ResetCameraClippingRange()
+
+
+def render_png(render_window, size):
+    """:return: the PNG encoded bytes of a frame of render_window"""
+    render_window.SetSize(size, size)
+    render_window.Render()
+    window_to_image = vtk.vtkWindowToImageFilter()
+    window_to_image.SetInput(render_window)
+    window_to_image.SetInputBufferTypeToRGB()
+    window_to_image.ReadFrontBufferOff()
+    writer = vtk.vtkPNGWriter()
+    writer.WriteToMemoryOn()
+    writer.SetInputConnection(window_to_image.GetOutputPort())
+    writer.Write()
+    return numpy_support.vtk_to_numpy(writer.GetResult()).tobytes()
+
+
+class RenderService:
+    """
+    Renders frames of the cases on a pool of worker threads. Each worker creates its own off-screen render window on
+    first use and keeps the cases it loaded in a CaseCache of cache_size bytes, so the VTK pipelines of a case are
+    only ever touched by one thread.
+    """
+
+    def __init__(self, cases, workers=SERVICE_WORKERS, cache_size=SERVICE_CASE_CACHE_SIZE):
+        """
+        :param cases: list of (name, image file(s), mask file), see batch.find_cases
+        """
+        self.cases = {case[0]: case for case in cases}
+        self.cache_size = cache_size
+        self.__local = threading.local()
+        self.__executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='render')
+
+    def render(self, request):
+        """
+        Queues a request on the worker pool and waits for its frame.
+        :param request: render parameters, see parse_render_query
+        :return: the PNG encoded frame
+        :raise KeyError: if the case is unknown
+        """
+        if request['case'] not in self.cases:
+            raise KeyError(request['case'])
+        return self.__executor.submit(self.render_frame, request).result()
+
+    def render_frame(self, request):
+        """Runs on a worker thread, loads the case into the render window of the thread and renders it."""
+        worker = self.__local
+        if not hasattr(worker, 'render_window'):
+            worker.renderer, worker.render_window = create_offscreen_window(SERVICE_FRAME_SIZE)
+            worker.case_cache = CaseCache(self.cache_size, case_memory_size)
+
+        case = self.cases[request['case']]
+        nii_case = worker.case_cache.get(case) or load_case(case)
+        for evicted in worker.case_cache.put(case, nii_case):
+            release_case(evicted)
+        if nii_case.renderer is not worker.renderer:
+            worker.render_window.RemoveRenderer(worker.renderer)
+            worker.render_window.AddRenderer(nii_case.renderer)
+            worker.renderer = nii_case.renderer
+
+        apply_render_request(nii_case, request)
+        return render_png(worker.render_window, request['size'])
+
+    def shutdown(self):
+        self.__executor.shutdown(wait=True)
+
+
+class RenderRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+        service = self.server.service
+        if url.path == '/cases':
+            self.send_body(200, 'application/json', json.dumps(sorted(service.cases)).encode('utf-8'))
+        elif url.path == '/render':
+            try:
+                frame = service.render(parse_render_query(url.query))
+            except ValueError as e:
+                self.send_body(400, 'text/plain', str(e).encode('utf-8'))
+            except KeyError as e:
+                self.send_body(404, 'text/plain', 'unknown case {}'.format(e).encode('utf-8'))
+            except Exception as e:
+                self.send_body(500, 'text/plain', '{}: {}'.format(type(e).__name__, e).encode('utf-8'))
+            else:
+                self.send_body(200, 'image/png', frame)
+        else:
+            self.send_body(404, 'text/plain', b'not found')
+
+    def send_body(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def create_server(cases, host=SERVICE_HOST, port=SERVICE_PORT, workers=SERVICE_WORKERS):
+    """
+    :return: a ThreadingHTTPServer serving frames of the cases, its RenderService is server.service
+    """
+    server = ThreadingHTTPServer((host, port), RenderRequestHandler)
+    server.daemon_threads = True
+    server.service = RenderService(cases, workers)
+    return server
+
+
+def serve(cases, host=SERVICE_HOST, port=SERVICE_PORT, workers=SERVICE_WORKERS):
+    """Serves frames of the cases until interrupted."""
+    server = create_server(cases, host, port, workers)
+    print('Serving {} cases on http://{}:{}'.format(len(cases), *server.server_address[:2]), flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.service.shutdown()
@@ -0,0 +1,44 @@
+import threading
+import time
+
+from CaseCache import *
+
+
+def test_least_recently_used_cases_are_evicted():
+    sizes = {'a': 40, 'b': 40, 'c': 40}
+    cache = CaseCache(100, lambda case: sizes[case])
+    assert cache.put('a', 'a') == [] and cache.put('b', 'b') == []
+    assert cache.get('a') == 'a'  # b is now the least recently used
+    assert cache.put('c', 'c') == ['b']
+    assert cache.keys() == ['a', 'c'] and 'b' not in cache and cache.get('b') is None
+
+
+def test_latest_case_is_kept_even_if_too_large():
+    cache = CaseCache(100, lambda case: 150)
+    cache.put('a', 'a')
+    assert cache.put('b', 'b') == ['a']
+    assert cache.keys() == ['b']
+
+
+def test_concurrent_puts():
+    def slow_size(case):
+        time.sleep(0.0001)  # lets the other threads run while the sizes are measured
+        return 10
+
+    cache = CaseCache(100, slow_size)
+    errors = []
+
+    def put_cases(prefix):
+        try:
+            for i in range(50):
+                cache.put('{}{}'.format(prefix, i), i)
+                cache.get('{}{}'.format(prefix, i // 2))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=put_cases, args=(prefix,)) for prefix in 'abcd']
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == [] and len(cache) == 10
@@ -0,0 +1,37 @@
+import threading
+
+from CasePrefetcher import *
+
+
+def test_prefetched_cases_are_taken_and_dropped():
+    release = threading.Event()
+    loaded = []
+
+    def load(case):
+        release.wait()
+        loaded.append(case)
+        return case.upper()
+
+    prefetcher = CasePrefetcher(load, 1, 2, float('inf'))
+    prefetcher.prefetch(['a', 'b', 'c'])  # only the first two are prefetched
+    prefetcher.prefetch(['b'])  # a is no longer expected
+    release.set()
+
+    assert prefetcher.take('b') == 'B'  # waits for the load
+    assert prefetcher.take('b') is None and prefetcher.take('a') is None and prefetcher.take('c') is None
+    prefetcher.shutdown()
+    assert 'c' not in loaded
+
+
+def test_failed_and_memory_capped_prefetch():
+    def load(case):
+        raise IOError(case)
+
+    prefetcher = CasePrefetcher(load, 1, 1, float('inf'))
+    prefetcher.prefetch(['a'])
+    assert prefetcher.take('a') is None
+
+    prefetcher = CasePrefetcher(load, 1, 1, 0)  # any resident memory is over the cap
+    prefetcher.prefetch(['a'])
+    assert prefetcher.take('a') is None
+    prefetcher.shutdown()
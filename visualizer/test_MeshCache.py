@@ -0,0 +1,50 @@
+import os
+
+import vtk
+
+from MeshCache import *
+
+
+def create_sphere(resolution):
+    sphere = vtk.vtkSphereSource()
+    sphere.SetThetaResolution(resolution)
+    sphere.SetPhiResolution(resolution)
+    sphere.Update()
+    return sphere.GetOutput()
+
+
+def test_round_trip_and_key(tmp_path):
+    volume = tmp_path / 'volume.nii.gz'
+    volume.write_bytes(b'volume')
+    cache = MeshCache(str(tmp_path / 'cache'), 1024 ** 2)
+
+    key = cache.key(str(volume), value=1, smoothness=500)
+    assert key == cache.key(str(volume), smoothness=500, value=1)
+    assert key != cache.key(str(volume), value=2, smoothness=500)
+    assert cache.get(key) is None
+
+    sphere = create_sphere(16)
+    cache.put(key, sphere)
+    cached = cache.get(key)
+    assert cached.GetNumberOfCells() == sphere.GetNumberOfCells()
+    assert cached.GetNumberOfPoints() == sphere.GetNumberOfPoints()
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = MeshCache(str(tmp_path), 1024 ** 2)
+    cache.put('old', create_sphere(64))
+    cache.put('new', create_sphere(64))
+    os.utime(cache.path('old'), (0, 0))
+    os.utime(cache.path('new'), (1, 1))
+
+    cache.max_size = os.path.getsize(cache.path('new'))
+    cache.evict()
+    assert not os.path.exists(cache.path('old'))
+    assert os.path.exists(cache.path('new'))
+
+
+def test_disabled_cache(tmp_path):
+    volume = tmp_path / 'volume.nii.gz'
+    volume.write_bytes(b'volume')
+    assert MeshCache(str(tmp_path), 0).key(str(volume), value=1) is None
+    assert MeshCache(None, 1024).key(str(volume), value=1) is None
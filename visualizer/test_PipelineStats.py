@@ -0,0 +1,45 @@
+import json
+
+import vtk
+
+from PipelineStats import *
+
+
+def test_observed_filters_are_recorded(tmp_path):
+    log_file = tmp_path / 'stats.log'
+    stats = PipelineStats(str(log_file))
+
+    sphere = vtk.vtkSphereSource()
+    smoother = vtk.vtkSmoothPolyDataFilter()
+    smoother.SetInputConnection(sphere.GetOutputPort())
+    stats.observe(sphere, 'label 1', 'extractor')
+    stats.observe(smoother, 'label 1', 'smoother')
+    smoother.Update()
+    smoother.SetNumberOfIterations(10)
+    smoother.Update()
+    stats.record('mask', 'read_volume', 0.5, 100, 1)
+
+    records = stats.records()
+    assert [(r['label'], r['stage']) for r in records] == [('label 1', 'extractor'), ('label 1', 'smoother'),
+                                                           ('label 1', 'smoother'), ('mask', 'read_volume')]
+    assert records[1]['cells'] == sphere.GetOutput().GetNumberOfCells()
+    assert records[1]['memory_kb'] == smoother.GetOutput().GetActualMemorySize()
+    assert [json.loads(line)['stage'] for line in log_file.read_text().splitlines()] == [r['stage'] for r in records]
+
+    summary = stats.summary()
+    assert [(s['label'], s['stage'], s['runs']) for s in summary] == [('label 1', 'extractor', 1),
+                                                                      ('label 1', 'smoother', 2),
+                                                                      ('mask', 'read_volume', 1)]
+    assert summary[1]['total_seconds'] >= summary[1]['last_seconds']
+    assert stats.running() == {}
+
+
+def test_records_are_bounded():
+    stats = PipelineStats(max_records=3)
+    for i in range(10):
+        stats.record('brain', 'extractor', 1.0, i)
+    assert [r['cells'] for r in stats.records()] == [7, 8, 9]
+    summary = stats.summary()
+    assert summary[0]['runs'] == 10 and summary[0]['total_seconds'] == 10.0 and summary[0]['cells'] == 9
+    stats.clear()
+    assert stats.records() == [] and stats.summary() == []
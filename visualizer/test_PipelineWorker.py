@@ -0,0 +1,135 @@
+import gc
+import os
+import threading
+import time
+import weakref
+
+import vtk
+import PyQt5.QtCore as Qt
+
+from PipelineWorker import *
+from vtkUtils import load_case, load_preview_surface, preview_filters, release_case, surface_filters
+
+SAMPLE_DATA = os.path.join(os.path.dirname(__file__), os.pardir, 'sample_data')
+
+app = Qt.QCoreApplication.instance() or Qt.QCoreApplication([])
+
+
+def wait_for(condition, timeout=30):
+    end = time.time() + timeout
+    while not condition() and time.time() < end:
+        app.processEvents()
+        time.sleep(0.01)
+    app.processEvents()
+
+
+def test_only_latest_job_is_delivered():
+    worker = PipelineWorker()
+    results = []
+    worker.finished.connect(lambda key, result: results.append((key, result)))
+
+    started = threading.Event()
+    release = threading.Event()
+
+    def blocking_job():
+        started.set()
+        release.wait()
+        return 'blocked'
+
+    worker.submit('brain', blocking_job)
+    started.wait()
+    worker.submit('brain', lambda: 'stale')
+    worker.submit('brain', lambda: 'latest')
+    worker.submit('mask', lambda: 'mask')
+    release.set()
+
+    wait_for(lambda: len(results) == 2)
+    worker.shutdown()
+    assert results == [('brain', 'latest'), ('mask', 'mask')]
+
+
+def test_stale_job_aborts_filters():
+    worker = PipelineWorker()
+    results = []
+    worker.finished.connect(lambda key, result: results.append(result))
+
+    sphere = vtk.vtkSphereSource()
+    sphere.SetThetaResolution(400)
+    sphere.SetPhiResolution(400)
+    smoother = vtk.vtkSmoothPolyDataFilter()
+    smoother.SetInputConnection(sphere.GetOutputPort())
+    smoother.SetNumberOfIterations(100000)
+    progress = threading.Event()
+    smoother.AddObserver('ProgressEvent', lambda obj, event: progress.set())
+
+    def smooth():
+        smoother.Update()
+        return 'smoothed'
+
+    worker.submit('brain', smooth, [smoother])
+    progress.wait()
+    start = time.time()
+    worker.submit('brain', lambda: 'latest')
+
+    wait_for(lambda: results)
+    worker.shutdown()
+    assert results == ['latest']
+    assert time.time() - start < 10
+    assert not smoother.GetAbortExecute()
+
+
+def test_stale_preview_job_aborts_shrink():
+    nii_case = load_case(('case', os.path.join(SAMPLE_DATA, 'flair.nii.gz'), os.path.join(SAMPLE_DATA, 'truth.nii.gz')))
+    label = nii_case.brain.labels[0]
+    shrink = preview_filters(label)[0]
+    aborted = []
+    shrink.AddObserver('EndEvent', lambda obj, event: aborted.append(obj.GetAbortExecute()))
+    worker = PipelineWorker()
+    results = []
+    worker.finished.connect(lambda key, result: results.append(result))
+
+    def preview():
+        worker.submit('brain', lambda: 'latest')  # the preview is stale before the volume is downsampled
+        return load_preview_surface(label, label.value)
+
+    worker.submit('brain', preview, preview_filters(label))
+    wait_for(lambda: results)
+    worker.shutdown()
+    assert shrink.IsA('vtkImageShrink3D')
+    assert results == ['latest'] and aborted == [1]
+
+
+def test_discarded_case_is_garbage_collected():
+    nii_case = load_case(('case', os.path.join(SAMPLE_DATA, 'flair.nii.gz'), os.path.join(SAMPLE_DATA, 'truth.nii.gz')))
+    worker = PipelineWorker()
+    results = []
+    worker.finished.connect(lambda key, result: results.append(key))
+    label = nii_case.brain.labels[0]
+    worker.submit((nii_case.id, 'brain'), lambda: [(label, label.mapper.GetInput())], surface_filters(label))
+    wait_for(lambda: results)
+    assert worker.keys() == [(nii_case.id, 'brain')]
+
+    brain = weakref.ref(nii_case.brain)
+    worker.discard([key for key in worker.keys() if key[0] == nii_case.id])  # as on eviction from the case cache
+    release_case(nii_case)
+    del nii_case, label
+    gc.collect()
+    worker.shutdown()
+    assert worker.keys() == [] and brain() is None
+
+
+def test_failed_job_is_reported():
+    worker = PipelineWorker()
+    results, failures = [], []
+    worker.finished.connect(lambda key, result: results.append((key, result)))
+    worker.failed.connect(lambda key, error: failures.append((key, error)))
+
+    def corrupt():
+        raise IOError('corrupt volume')
+
+    worker.submit('brain', corrupt)
+    worker.submit('mask', lambda: 'mask')  # the worker keeps running jobs after a failure
+    wait_for(lambda: failures and results)
+    worker.shutdown()
+    assert [(key, str(error)) for key, error in failures] == [('brain', 'corrupt volume')]
+    assert results == [('mask', 'mask')]
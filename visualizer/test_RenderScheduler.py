@@ -0,0 +1,43 @@
+import time
+
+import PyQt5.QtCore as Qt
+
+from RenderScheduler import *
+
+app = Qt.QCoreApplication.instance() or Qt.QCoreApplication([])
+
+
+def process_events(seconds):
+    end = time.time() + seconds
+    while time.time() < end:
+        app.processEvents()
+        time.sleep(0.001)
+
+
+def test_requests_are_coalesced():
+    frames = []
+    scheduler = RenderScheduler(lambda: frames.append(time.perf_counter()), frame_rate=20)
+    for _ in range(100):
+        scheduler.request()
+    assert frames == []  # rendered once the event loop runs
+    process_events(0.05)
+    assert len(frames) == 1 and scheduler.requests == 100
+
+    scheduler.request()
+    scheduler.request()
+    process_events(0.2)
+    assert len(frames) == 2 and frames[1] - frames[0] >= 0.049  # at most one frame per interval
+
+
+def test_flush_renders_immediately():
+    frames = []
+    scheduler = RenderScheduler(lambda: frames.append(1), frame_rate=60)
+    scheduler.flush()
+    assert frames == []
+    scheduler.request()
+    scheduler.flush()
+    assert frames == [1]
+    scheduler.request()
+    scheduler.cancel()
+    process_events(0.05)
+    assert frames == [1]
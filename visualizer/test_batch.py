@@ -0,0 +1,45 @@
+import os
+
+from batch import *
+
+SAMPLE_DATA = os.path.join(os.path.dirname(__file__), os.pardir, 'sample_data')
+
+
+def test_find_cases_in_directory():
+    cases = find_cases(SAMPLE_DATA)
+    assert [(name, os.path.basename(image), os.path.basename(mask)) for name, image, mask in cases] == [
+        ('10labels_example', 'T1CE.nii.gz', 'mask.nii.gz'),
+        ('zScoredExample', 'Brats17_CBICA_ARF_1_t1ce.nii.gz', 'Brats17_CBICA_ARF_1_seg_4c.nii.gz')]
+
+
+def test_find_cases_in_manifest(tmp_path):
+    manifest = tmp_path / 'cases.csv'
+    manifest.write_text('image,mask\n'
+                        'a/flair.nii.gz,a/truth.nii.gz\n'
+                        'b/t1.nii.gz, b/seg.nii.gz, named\n')
+    assert find_cases(str(manifest)) == [
+        ('a', str(tmp_path / 'a' / 'flair.nii.gz'), str(tmp_path / 'a' / 'truth.nii.gz')),
+        ('named', str(tmp_path / 'b' / 't1.nii.gz'), str(tmp_path / 'b' / 'seg.nii.gz'))]
+
+
+def test_render_case(tmp_path):
+    case = [case for case in find_cases(SAMPLE_DATA) if case[0] == 'zScoredExample'][0]
+
+    name, error, _ = render_case(case, str(tmp_path), size=64)
+    assert (name, error) == ('zScoredExample', None)
+    assert sorted(os.listdir(str(tmp_path / name))) == ['axial.png', 'coronal.png', 'meshes', 'sagittal.png']
+    assert sorted(os.listdir(str(tmp_path / name / 'meshes'))) == ['brain.vtp', 'label_1.vtp', 'label_2.vtp',
+                                                                   'label_3.vtp', 'meshes.json']
+
+
+def test_render_meshes(tmp_path):
+    case = [case for case in find_cases(SAMPLE_DATA) if case[0] == 'zScoredExample'][0]
+    render_case(case, str(tmp_path), size=64, mesh_format='glb')
+    files = render_meshes(str(tmp_path / 'zScoredExample' / 'meshes'), str(tmp_path / 'views'), size=64)
+    assert sorted(os.listdir(str(tmp_path / 'views'))) == ['axial.png', 'coronal.png', 'sagittal.png']
+    assert all(os.path.getsize(f) > 0 for f in files)
+
+
+def test_render_case_reports_errors(tmp_path):
+    name, error, _ = render_case(('missing', 'missing.nii.gz', 'missing.nii.gz'), str(tmp_path))
+    assert name == 'missing' and error
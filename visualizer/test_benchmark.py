@@ -0,0 +1,30 @@
+from benchmark import *
+
+
+def stage(seconds, output_mb=100.0, triangles=None):
+    return {'seconds': seconds, 'output_mb': output_mb, 'triangles': triangles}
+
+
+def test_compare_within_tolerance():
+    baseline = {'case': {'smoother': stage(1.0, triangles=1000), 'mapper': stage(0.001)}}
+    results = {'case': {'smoother': stage(1.4, 140.0, 1100), 'mapper': stage(0.03), 'new_stage': stage(9.0)}}
+    assert compare(results, baseline, 0.5) == []
+
+
+def test_compare_reports_regressions():
+    baseline = {'case': {'smoother': stage(1.0, triangles=1000)}}
+    results = {'case': {'smoother': stage(2.0, 200.0, 400)}}
+    assert compare(results, baseline, 0.5) == ['case smoother: 2.000s, baseline 1.000s',
+                                               'case smoother: output 200.0MB, baseline 100.0MB',
+                                               'case smoother: 400 triangles, baseline 1000']
+
+
+def test_stage_timer_measures_output_size():
+    source = vtk.vtkSphereSource()
+    timer = StageTimer()
+    timer.run('sphere', source)
+    timer.measure('read', lambda: source)
+    timer.measure('index', lambda: {})
+    assert timer.stages['sphere']['output_mb'] == source.GetOutput().GetActualMemorySize() / 1024.0
+    assert timer.stages['sphere']['triangles'] == source.GetOutput().GetNumberOfCells()
+    assert timer.stages['read']['output_mb'] > 0 and timer.stages['index']['output_mb'] is None
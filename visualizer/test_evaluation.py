@@ -0,0 +1,33 @@
+import csv
+import os
+
+from evaluation import *
+
+SAMPLE_DATA = os.path.join(os.path.dirname(__file__), os.pardir, 'sample_data')
+
+
+def test_pair_masks(tmp_path):
+    for path in ('truth/a/a_seg.nii.gz', 'truth/b/b_seg.nii.gz', 'truth/c/c_t1.nii.gz',
+                 'predictions/a.nii.gz', 'predictions/notes.txt'):
+        (tmp_path / path).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / path).write_bytes(b'')
+    pairs = pair_masks(str(tmp_path / 'truth'), str(tmp_path / 'predictions'))
+    assert pairs == [('a', str(tmp_path / 'truth' / 'a' / 'a_seg.nii.gz'), str(tmp_path / 'predictions' / 'a.nii.gz')),
+                     ('b', str(tmp_path / 'truth' / 'b' / 'b_seg.nii.gz'), None)]
+
+
+def test_run_evaluation(tmp_path):
+    truth = os.path.join(SAMPLE_DATA, 'truth.nii.gz')
+    seg = os.path.join(SAMPLE_DATA, 'zScoredExample', 'Brats17_CBICA_ARF_1_seg_4c.nii.gz')
+    pairs = [('same', truth, truth), ('other', truth, seg), ('missing', truth, None)]
+    output = str(tmp_path / 'metrics.csv')
+
+    failures = run_evaluation(pairs, output, workers=1)
+    assert [name for name, _ in failures] == ['missing']
+    with open(output, newline='') as f:
+        rows = list(csv.DictReader(f))
+    assert [(row['case'], row['label']) for row in rows] == [('same', '1'), ('same', '2'), ('same', '4'),
+                                                             ('other', '1'), ('other', '2'), ('other', '3'),
+                                                             ('other', '4')]
+    assert all(float(row['dice']) == 1.0 and float(row['hausdorff_mm']) == 0.0 for row in rows[:3])
+    assert float(rows[3]['dice']) < 1.0 and rows[5]['reference_voxels'] == '0'
@@ -0,0 +1,17 @@
+import numpy as np
+
+from histogramUtils import *
+from test_labelUtils import create_image
+
+
+def test_volume_histogram():
+    voxels = np.array([0, 0, 0, 1, 2, 3, 3, 4], dtype=np.int16).reshape((2, 2, 2))
+    counts, edges = volume_histogram(create_image(voxels), 4)
+    assert counts.tolist() == [3, 1, 1, 3] and edges[0] == 0 and edges[-1] == 4
+
+
+def test_otsu_threshold_splits_background_and_tissue():
+    rng = np.random.RandomState(0)
+    voxels = np.concatenate([rng.normal(10, 3, 6000), rng.normal(100, 10, 2000)]).astype(np.float32)
+    threshold = otsu_threshold(*volume_histogram(create_image(voxels.reshape((20, 20, 20))), 128))
+    assert 10 + 3 * 3 < threshold < 100 - 3 * 10  # beyond three standard deviations of both classes
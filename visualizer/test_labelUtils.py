@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+import vtk
+from vtk.util import numpy_support
+
+from labelUtils import *
+
+
+def create_image(voxels, extent_start=(0, 0, 0)):
+    """:param voxels: numpy array indexed [z, y, x]"""
+    image = vtk.vtkImageData()
+    nz, ny, nx = voxels.shape
+    x0, y0, z0 = extent_start
+    image.SetExtent(x0, x0 + nx - 1, y0, y0 + ny - 1, z0, z0 + nz - 1)
+    image.GetPointData().SetScalars(numpy_support.numpy_to_vtk(voxels.ravel(), deep=True))
+    return image
+
+
+def test_build_label_index():
+    voxels = np.zeros((6, 5, 4), dtype=np.uint16)
+    voxels[1:3, 2, 1:4] = 4
+    voxels[5, 4, 0] = 1
+    voxels[0, 0, 3] = 4
+
+    index = build_label_index(create_image(voxels, (10, 20, 30)))
+    assert index == {1: {'count': 1, 'extent': (10, 10, 24, 24, 35, 35), 'centroid': (10.0, 24.0, 35.0)},
+                     4: {'count': 7, 'extent': (11, 13, 20, 22, 30, 32),
+                         'centroid': pytest.approx((10 + 15 / 7.0, 20 + 12 / 7.0, 30 + 9 / 7.0))}}
+
+
+def test_build_label_index_of_empty_and_float_masks():
+    assert build_label_index(create_image(np.zeros((2, 2, 2), dtype=np.uint8))) == {}
+    voxels = np.zeros((2, 2, 2), dtype=np.float32)
+    voxels[1, 1, 1] = 2.0
+    assert list(build_label_index(create_image(voxels))) == [2]
+
+
+def test_label_statistics():
+    voxels = np.zeros((4, 4, 4), dtype=np.uint8)
+    voxels[1:3, 1:3, 1:3] = 2
+    image = create_image(voxels)
+    image.SetSpacing(0.5, 1.0, 2.0)
+    image.SetOrigin(10, 20, 30)
+
+    statistics = label_statistics(image)
+    assert list(statistics) == [2]
+    assert statistics[2]['count'] == 8 and statistics[2]['volume'] == 8.0
+    assert statistics[2]['centroid'] == (10.75, 21.5, 33.0)
+    assert statistics[2]['bounds'] == (10.5, 11.0, 21.0, 22.0, 32.0, 34.0)
+
+
+def test_overlap_metrics():
+    reference = np.zeros((12, 12, 12), dtype=np.uint8)
+    reference[2:6, 2:6, 2:6] = 1
+    reference[8:10, 8:10, 8:10] = 3
+    prediction = np.zeros((12, 12, 12), dtype=np.int16)
+    prediction[2:6, 2:6, 3:7] = 1  # shifted by one voxel along x
+    prediction[0, 0, 0] = 2
+
+    metrics = overlap_metrics(create_image(reference), create_image(prediction))
+    assert sorted(metrics) == [1, 2, 3]
+    assert metrics[1]['reference'] == metrics[1]['prediction'] == 64
+    assert metrics[1]['dice'] == pytest.approx(48 / 64.0) and metrics[1]['jaccard'] == pytest.approx(48 / 80.0)
+    assert metrics[1]['hausdorff'] == pytest.approx(1.0)
+    assert metrics[2]['dice'] == 0 and np.isnan(metrics[2]['hausdorff'])
+    assert metrics[3]['reference'] == 8 and metrics[3]['prediction'] == 0
+
+    # float masks take the general path of confusion_counts
+    float_metrics = overlap_metrics(create_image(reference.astype(np.float32)), create_image(prediction))
+    assert float_metrics[1]['dice'] == metrics[1]['dice']
+
+    with pytest.raises(ValueError):
+        overlap_metrics(create_image(reference), create_image(prediction[1:]))
+
+
+def test_pad_extent():
+    assert pad_extent((0, 5, 3, 9, 4, 4), (0, 9, 0, 9, 0, 9)) == (0, 6, 2, 9, 3, 5)
+
+
+def test_extent_volume():
+    assert extent_volume((0, 9, 2, 3, 4, 4)) == 20
+
+
+def test_union_extent():
+    assert union_extent([(1, 4, 2, 3, 0, 0), (0, 2, 5, 6, 1, 7)]) == (0, 4, 2, 6, 0, 7)
+
+
+def test_generate_palette():
+    base = [(1, 0, 0), (0, 1, 0)]
+    colors = generate_palette(200, base)
+    assert len(colors) == 200 and colors[:2] == base
+    assert len(set(colors)) == 200
+    assert generate_palette(1, base) == [(1, 0, 0)]
+
+
+def test_allocate_triangles():
+    # the small label keeps every triangle, the rest is split by the square root of the size
+    targets = allocate_triangles([1000, 400000, 1600000], 301000)
+    assert targets == [1000, 100000, 200000]
+    assert allocate_triangles([10, 20], 1000) == [10, 20]
+    assert allocate_triangles([], 1000) == []
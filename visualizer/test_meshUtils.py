@@ -0,0 +1,70 @@
+import os
+
+import numpy as np
+import pytest
+
+from meshUtils import *
+
+SAMPLE_DATA = os.path.join(os.path.dirname(__file__), os.pardir, 'sample_data')
+MASK_FILE = os.path.join(SAMPLE_DATA, 'zScoredExample', 'Brats17_CBICA_ARF_1_seg_4c.nii.gz')
+
+
+@pytest.mark.parametrize('mesh_format', MESH_FORMATS)
+def test_export_and_load_surfaces(tmp_path, mesh_format):
+    mask = setup_mask(vtk.vtkRenderer(), MASK_FILE)
+    files = export_surfaces([mask], str(tmp_path), mesh_format)
+    assert all(os.path.isfile(f) for f in files)
+
+    loaded = load_surfaces(str(tmp_path), vtk.vtkRenderer())
+    assert [(label.name, label.value) for label in loaded.labels] == [('label 1', 1), ('label 2', 2), ('label 3', 3)]
+    for label, original in zip(loaded.labels, mask.labels):
+        surface, expected = label.mapper.GetInput(), original.mapper.GetInput()
+        assert label.actor and label.color == tuple(original.color)
+        assert surface.GetNumberOfCells() == expected.GetNumberOfCells()
+        assert surface.GetNumberOfPoints() == expected.GetNumberOfPoints()
+        points, normals, _, _ = surface_arrays(surface)
+        expected_points, expected_normals, _, _ = surface_arrays(expected)
+        extent = (expected_points.max(axis=0) - expected_points.min(axis=0)).max()
+        assert np.all(np.abs(points - expected_points) <= extent / POSITION_LEVELS + 1e-4)
+        # read_glb applies the node transform to the normals as a glTF viewer does
+        assert np.all(np.sum(normals * expected_normals, axis=1) > 0.99)
+
+
+def test_glb_normals_survive_the_node_transform(tmp_path):
+    points = np.array([[0, 0, 0], [100, 0, 0], [0, 1, 0], [0, 0, 10]], np.float32)
+    normals = np.array([[1, 1, 1], [1, 1, 1], [1, 1, 1], [1, 1, 1]], np.float32) / np.sqrt(3)
+    surface = {'name': 'label 1', 'value': 1, 'color': [1, 0, 0], 'opacity': 1.0, 'points': points,
+               'normals': normals, 'triangles': np.array([[0, 1, 2], [0, 2, 3]])}
+    write_glb([surface], str(tmp_path / 'meshes.glb'))
+    loaded, = read_glb(str(tmp_path / 'meshes.glb'))
+    _, loaded_normals, _, _ = surface_arrays(loaded['polydata'])
+    assert np.all(np.sum(loaded_normals * normals, axis=1) > 0.99)
+
+
+def test_compact_surface_is_split_per_label():
+    points = np.array([[0, 0, 0], [1, 0, 0], [0, 1, 0], [1, 1, 0]], np.float32)
+    triangles = np.array([[0, 1, 2], [1, 3, 2]])
+    label_points, _, label_triangles = split_surface(points, None, triangles, np.array([4, 7]), 7)
+    assert label_points.tolist() == [[1, 0, 0], [0, 1, 0], [1, 1, 0]]
+    assert label_triangles.tolist() == [[0, 2, 1]]
+
+
+def test_vtp_stores_quantized_arrays(tmp_path):
+    mask = setup_mask(vtk.vtkRenderer(), MASK_FILE)
+    points, normals, triangles, _ = surface_arrays(mask.labels[0].mapper.GetInput())
+    write_vtp(points, normals, triangles, str(tmp_path / 'label.vtp'))
+    reader = vtk.vtkXMLPolyDataReader()
+    reader.SetFileName(str(tmp_path / 'label.vtp'))
+    reader.Update()
+    polydata = reader.GetOutput()
+    assert polydata.GetPoints().GetDataType() == vtk.VTK_UNSIGNED_SHORT
+    assert polydata.GetPointData().GetArray('QuantizedNormals').GetDataType() == vtk.VTK_SIGNED_CHAR
+
+    writer = vtk.vtkXMLPolyDataWriter()  # the same surface unquantized
+    writer.SetFileName(str(tmp_path / 'float.vtp'))
+    writer.SetInputData(create_polydata(points, normals, triangles))
+    writer.SetDataModeToAppended()
+    writer.EncodeAppendedDataOff()
+    writer.SetCompressorTypeToZLib()
+    writer.Write()
+    assert os.path.getsize(str(tmp_path / 'label.vtp')) < 0.8 * os.path.getsize(str(tmp_path / 'float.vtp'))
@@ -0,0 +1,85 @@
+import gzip
+import os
+import shutil
+
+import numpy as np
+import vtk
+from vtk.util import numpy_support
+
+from niftiUtils import *
+
+SAMPLE_DATA = os.path.join(os.path.dirname(__file__), os.pardir, 'sample_data')
+MASK_FILE = os.path.join(SAMPLE_DATA, '10labels_example', 'mask.nii.gz')
+
+
+def read_scalars(algorithm):
+    return numpy_support.vtk_to_numpy(algorithm.GetOutput().GetPointData().GetScalars())
+
+
+def test_memory_map_matches_reader(tmp_path):
+    nii_file = str(tmp_path / 'mask.nii')
+    with gzip.open(MASK_FILE, 'rb') as f, open(nii_file, 'wb') as out:
+        shutil.copyfileobj(f, out)
+
+    reader = vtk.vtkNIFTIImageReader()
+    reader.SetFileName(MASK_FILE)
+    reader.Update()
+    importer = memory_map_volume(nii_file)
+
+    assert importer.GetDataExtent() == reader.GetDataExtent()
+    assert importer.GetOutput().GetSpacing() == reader.GetOutput().GetSpacing()
+    assert (read_scalars(importer) == read_scalars(reader)).all()
+    assert np.shares_memory(read_scalars(importer), importer.voxels)
+
+
+def test_memory_map_rejects_unsupported_header(tmp_path):
+    nii_file = tmp_path / 'not_nifti.nii'
+    nii_file.write_bytes(b'\0' * 400)
+    assert memory_map_volume(str(nii_file)) is None
+
+    # a valid header, but without the NIfTI-1 magic, or with fewer voxels than the header claims
+    with gzip.open(MASK_FILE, 'rb') as f:
+        volume = f.read()
+    assert read_header(str(write_file(tmp_path / 'valid.nii', volume))) is not None
+    assert read_header(str(write_file(tmp_path / 'no_magic.nii', volume[:344] + b'xxxx' + volume[348:]))) is None
+    assert read_header(str(write_file(tmp_path / 'truncated.nii', volume[:-1]))) is None
+
+
+def write_file(path, data):
+    path.write_bytes(data)
+    return path
+
+
+def test_sidecar_is_decompressed_once(tmp_path):
+    sidecar = sidecar_file(MASK_FILE, str(tmp_path), 1024 ** 3)
+    with gzip.open(MASK_FILE, 'rb') as f:
+        assert open(sidecar, 'rb').read() == f.read()
+
+    os.utime(sidecar, (0, 0))
+    assert sidecar_file(MASK_FILE, str(tmp_path), 1024 ** 3) == sidecar
+    assert os.path.getmtime(sidecar) > 0
+
+
+def test_narrowest_dtype():
+    assert narrowest_dtype(np.array([0.0, 3.0, 255.0], dtype=np.float32)) == np.uint8
+    assert narrowest_dtype(np.array([-1.0, 300.0], dtype=np.float32)) == np.int16
+    assert narrowest_dtype(np.array([0.5, 1.0], dtype=np.float32)) == np.float32
+    assert narrowest_dtype(np.array([0.5, 1.0], dtype=np.float64)) == np.float32
+    assert narrowest_dtype(np.array([0, 70000], dtype=np.int64)) == np.uint32
+    assert narrowest_dtype(np.array([-5, 100], dtype=np.int16)) == np.int8
+
+
+def test_narrow_volume_is_lossless():
+    reader = vtk.vtkNIFTIImageReader()
+    reader.SetFileName(MASK_FILE)
+    reader.Update()
+    cast = vtk.vtkImageCast()
+    cast.SetInputConnection(reader.GetOutputPort())
+    cast.SetOutputScalarTypeToFloat()
+    cast.Update()
+
+    narrowed = narrow_volume(cast)
+    assert read_scalars(narrowed).dtype == np.uint8 and (read_scalars(narrowed) == read_scalars(cast)).all()
+    assert narrowed.GetOutput().GetExtent() == cast.GetOutput().GetExtent()
+    assert narrowed.GetOutput().GetSpacing() == cast.GetOutput().GetSpacing()
+    assert narrow_volume(narrowed) is narrowed
@@ -0,0 +1,58 @@
+import json
+import os
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+from batch import find_cases
+from render_service import *
+
+SAMPLE_DATA = os.path.join(os.path.dirname(__file__), os.pardir, 'sample_data')
+
+
+def test_parse_render_query():
+    request = parse_render_query('case=a&view=coronal&azimuth=30&labels=1,3&threshold=2.5')
+    assert request['case'] == 'a' and request['view'] == 'coronal' and request['azimuth'] == 30.0
+    assert request['labels'] == {1, 3} and request['threshold'] == 2.5 and request['zoom'] is None
+    assert request['brain'] and request['size'] == SERVICE_FRAME_SIZE
+    assert parse_render_query('case=a&labels=none&brain=0')['labels'] == set()
+
+    for query in ('view=axial', 'case=a&view=top', 'case=a&zoom=x', 'case=a&size=100000'):
+        with pytest.raises(ValueError):
+            parse_render_query(query)
+
+
+def test_render_service():
+    cases = [case for case in find_cases(SAMPLE_DATA) if case[0] == 'zScoredExample']
+    server = create_server(cases, port=0, workers=2)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = 'http://{}:{}'.format(*server.server_address[:2])
+    try:
+        with urllib.request.urlopen(url + '/cases') as response:
+            assert json.loads(response.read().decode('utf-8')) == ['zScoredExample']
+
+        frames = {}
+
+        def get(query):
+            with urllib.request.urlopen(url + '/render?' + query) as response:
+                frames[query] = response.read()
+
+        queries = ['case=zScoredExample&size=64', 'case=zScoredExample&size=64&view=sagittal&labels=2&azimuth=20']
+        threads = [threading.Thread(target=get, args=(query,)) for query in queries]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert all(frame.startswith(b'\x89PNG') for frame in frames.values()) and len(frames) == 2
+
+        for query, status in (('case=missing', 404), ('case=zScoredExample&view=top', 400)):
+            with pytest.raises(urllib.error.HTTPError) as error:
+                urllib.request.urlopen(url + '/render?' + query)
+            assert error.value.code == status
+    finally:
+        server.shutdown()
+        server.server_close()
+        server.service.shutdown()
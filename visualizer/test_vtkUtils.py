@@ -0,0 +1,203 @@
+import os
+
+import numpy as np
+from vtk.util import numpy_support
+
+import vtkUtils
+from vtkUtils import *
+from test_labelUtils import create_image
+
+SAMPLE_DATA = os.path.join(os.path.dirname(__file__), os.pardir, 'sample_data')
+MASK_FILE = os.path.join(SAMPLE_DATA, 'zScoredExample', 'Brats17_CBICA_ARF_1_seg_4c.nii.gz')
+
+
+def test_cropped_extraction_matches_full_volume():
+    mask = NiiObject()
+    mask.reader = read_volume(MASK_FILE)
+    mask.extent = mask.reader.GetDataExtent()
+    label_index = build_label_index(mask.reader.GetOutput())
+    assert sorted(label_index) == [1, 2, 3]
+
+    for label_value, label_info in label_index.items():
+        cropped = create_mask_extractor(mask, pad_extent(label_info['extent'], mask.extent))
+        cropped.SetValue(0, label_value)
+        cropped.Update()
+
+        full = create_mask_extractor(mask)
+        full.SetValue(0, label_value)
+        full.Update()
+        assert cropped.GetOutput().GetNumberOfCells() == full.GetOutput().GetNumberOfCells()
+        assert cropped.GetOutput().GetBounds() == full.GetOutput().GetBounds()
+        assert [f.GetClassName() for f in upstream_filters(cropped)] == ['vtkExtractVOI', 'vtkDiscreteMarchingCubes']
+        assert upstream_filters(full) == [full]
+
+
+def test_dense_labels_are_extracted_in_a_single_pass(monkeypatch):
+    assert setup_mask(vtk.vtkRenderer(), MASK_FILE, compute_surfaces=False).extractor is None  # small tumor labels
+
+    dense_file = os.path.join(SAMPLE_DATA, '10labels_example', 'mask.nii.gz')  # label boxes add up to 1.28 volumes
+    mask = setup_mask(vtk.vtkRenderer(), dense_file, compute_surfaces=False)
+    monkeypatch.setattr(vtkUtils, 'MASK_CROP_MAX_VOLUME', 2.0)
+    cropped = setup_mask(vtk.vtkRenderer(), dense_file, compute_surfaces=False)
+    assert mask.extractor.IsA('vtkDiscreteFlyingEdges3D') and cropped.extractor is None
+
+    for label, cropped_label in zip(mask.labels, cropped.labels):
+        assert surface_filters(label)[0] is mask.extractor  # aborted by the worker like the label filters
+        surface, cropped_surface = label.extractor.GetOutput(), cropped_label.extractor.GetOutput()
+        assert surface.GetNumberOfCells() == cropped_surface.GetNumberOfCells() > 0
+        assert surface.GetBounds() == cropped_surface.GetBounds()
+
+
+def test_sparse_labels_use_compact_surface(tmp_path, monkeypatch):
+    voxels = np.zeros((12, 12, 40), dtype=np.uint16)
+    for i, label_value in enumerate([2, 7, 300]):
+        voxels[3:9, 3:9, 2 + 12 * i:10 + 12 * i] = label_value
+    file_name = str(tmp_path / 'mask.nii')
+    writer = vtk.vtkNIFTIImageWriter()
+    writer.SetInputData(create_image(voxels))
+    writer.SetFileName(file_name)
+    writer.Write()
+
+    mask = setup_mask(vtk.vtkRenderer(), file_name)
+    assert [label.value for label in mask.labels] == [2, 7, 300]
+    assert mask.compact_label is None and len(surface_labels(mask)) == 3
+
+    monkeypatch.setattr(vtkUtils, 'MASK_COMPACT_LABELS', 2)
+    mask = setup_mask(vtk.vtkRenderer(), file_name)
+    assert surface_labels(mask) == [mask.compact_label]
+    surface = mask.compact_label.mapper.GetInput()
+    values = numpy_support.vtk_to_numpy(surface.GetCellData().GetScalars())
+    assert sorted(set(values)) == [2, 7, 300]
+
+    set_label_appearance(mask, mask.labels[1], (0, 0, 1), 0)
+    lut = mask.compact_label.mapper.GetLookupTable()
+    assert lut.GetTableValue(lut.GetAnnotatedValueIndex(vtk.vtkVariant(7))) == (0, 0, 1, 0)
+
+
+def test_fit_triangle_budget():
+    mask = setup_mask(vtk.vtkRenderer(), MASK_FILE, compute_surfaces=False)
+    assert all(label.mapper.GetInput() is None for label in surface_labels(mask))
+
+    report = fit_triangle_budget([mask], 20000)
+    assert [entry['label'] for entry in report] == ['label 1', 'label 2', 'label 3']
+    assert sum(entry['target'] for entry in report) <= 20000
+    for entry in report:
+        assert 0 < entry['triangles'] <= entry['target'] * 1.2
+
+
+def test_smoothness_change_reuses_decimated_surface():
+    mask = setup_mask(vtk.vtkRenderer(), MASK_FILE)
+    label = mask.labels[0]
+    runs = []
+    for f in surface_filters(label):
+        f.AddObserver('EndEvent', lambda obj, event: runs.append(obj.GetClassName()))
+
+    label.smoother.SetNumberOfIterations(label.smoother.GetNumberOfIterations() + 10)
+    assert update_surface(mask, label).GetNumberOfCells()
+    assert runs == ['vtkWindowedSincPolyDataFilter', 'vtkPolyDataNormals']
+
+
+def test_low_memory_releases_stage_outputs(monkeypatch):
+    truth_file = os.path.join(SAMPLE_DATA, 'truth.nii.gz')
+    full = setup_mask(vtk.vtkRenderer(), truth_file)
+    monkeypatch.setattr(vtkUtils, 'LOW_MEMORY', True)
+    mask = setup_mask(vtk.vtkRenderer(), truth_file)
+    assert mask.reader.GetOutput().GetScalarType() == vtk.VTK_UNSIGNED_CHAR  # int16 labels narrowed losslessly
+
+    for label, full_label in zip(mask.labels, full.labels):
+        assert label.reduced is None and label.mapper.GetInput().GetNumberOfCells()
+        assert all(not f.GetOutputDataObject(0).GetNumberOfPoints() for f in surface_filters(label))
+        assert label.mapper.GetInput().GetNumberOfCells() == full_label.mapper.GetInput().GetNumberOfCells()
+
+    label = mask.labels[0]  # released stages run again on demand
+    label.smoother.SetNumberOfIterations(label.smoother.GetNumberOfIterations() + 10)
+    assert update_surface(mask, label).GetNumberOfCells()
+
+
+def test_brain_transfer_functions():
+    brain = NiiObject()
+    brain.reader = read_volume(MASK_FILE)
+    brain.scalar_range = (0.0, 100.0)
+    brain.volume = create_volume(brain)
+
+    set_brain_transfer_functions(brain, 40.0, 0.5, 2.0)
+    scalar_opacity = brain.volume.GetProperty().GetScalarOpacity()
+    color = brain.volume.GetProperty().GetRGBTransferFunction()
+    assert scalar_opacity.GetValue(30.0) == 0 and scalar_opacity.GetValue(100.0) == 0.5
+    assert color.GetColor(25.0) == (0.5, 0.5, 0.5) and color.GetColor(75.0) == (1, 1, 1)
+
+
+def test_image_intensity_window_level():
+    image_property = vtk.vtkImageProperty()
+    set_image_intensity([image_property], (-100.0, 300.0), 2.0)
+    # black at the bottom of the scalar range, white from half of it on
+    assert image_property.GetColorLevel() - image_property.GetColorWindow() / 2 == -100.0
+    assert image_property.GetColorLevel() + image_property.GetColorWindow() / 2 == 100.0
+
+
+def test_slicer_reads_original_scalars():
+    brain = NiiObject()
+    brain.reader = read_volume(MASK_FILE)
+    brain.extent = brain.reader.GetDataExtent()
+    brain.scalar_range = brain.reader.GetOutput().GetScalarRange()
+    renderer = vtk.vtkRenderer()
+
+    images = [actor.GetMapper() for actor in setup_slicer(renderer, brain)]
+    setup_projection(brain, renderer)
+    images.append(renderer.GetViewProps().GetLastProp().GetMapper())
+    for mapper in images:
+        mapper.GetInputAlgorithm().Update()
+        assert mapper.GetInput().GetPointData().GetScalars().GetPointer(0) == \
+            brain.reader.GetOutput().GetPointData().GetScalars().GetPointer(0)
+
+
+def test_set_modality_keeps_mask_surfaces():
+    images = tuple(os.path.join(SAMPLE_DATA, '10labels_example', name) for name in ('T1CE.nii.gz', 'FLAIR.nii.gz'))
+    nii_case = load_case(('case', images, os.path.join(SAMPLE_DATA, '10labels_example', 'mask.nii.gz')))
+    assert list(nii_case.modalities) == ['T1CE', 'FLAIR'] and list(nii_case.brains) == ['T1CE']
+    mask_surfaces = [label.mapper.GetInput() for label in surface_labels(nii_case.mask)]
+    t1ce = nii_case.brain
+
+    flair = NiiObject()
+    flair.file = images[1]
+    load_brain(flair, compute_surfaces=False)  # as on the pipeline worker, nothing is added to the renderer
+    assert not nii_case.renderer.HasViewProp(flair.volume)
+    assert set_modality(nii_case, 'FLAIR', brain=flair) is flair
+    assert nii_case.brain is flair and flair.file == images[1] and list(nii_case.brains) == ['T1CE', 'FLAIR']
+    assert [label.mapper.GetInput() for label in surface_labels(nii_case.mask)] == mask_surfaces
+    assert not nii_case.renderer.HasViewProp(t1ce.volume) and nii_case.renderer.HasViewProp(flair.volume)
+    for image_actor in nii_case.brain_slicer_props:
+        assert image_actor.GetMapper().GetInputAlgorithm() is flair.reader
+
+    assert set_modality(nii_case, 'T1CE') is t1ce and nii_case.renderer.HasViewProp(t1ce.volume)
+
+
+def test_interactive_detail():
+    sphere = vtk.vtkSphereSource()
+    sphere.SetThetaResolution(200)
+    sphere.SetPhiResolution(200)
+    sphere.Update()
+    full = sphere.GetOutput()
+    nii_object = NiiObject()
+    label = NiiLabel((1, 1, 1), 1.0, 0)
+    label.mapper = create_mapper()
+    label.actor = create_actor(label.mapper, create_property(1.0, (1, 1, 1)))
+    label.mapper.SetInputData(full)
+    nii_object.labels.append(label)
+
+    assert set_interactive_detail([nii_object], True, min_triangles=1000) == 1
+    assert label.mapper.GetInput().GetNumberOfPolys() < full.GetNumberOfPolys() / 2
+    set_interactive_detail([nii_object], False)
+    assert label.mapper.GetInput() is full
+
+    # a surface replaced during the interaction (e.g. by the pipeline worker) is kept, small surfaces are never reduced
+    set_interactive_detail([nii_object], True, min_triangles=1000)
+    replacement_sphere = vtk.vtkSphereSource()
+    replacement_sphere.SetThetaResolution(100)
+    replacement_sphere.SetPhiResolution(100)
+    replacement_sphere.Update()
+    replacement = replacement_sphere.GetOutput()
+    label.mapper.SetInputData(replacement)
+    set_interactive_detail([nii_object], False)
+    assert label.mapper.GetInput() is replacement and label.interactive_surface is None
+    assert set_interactive_detail([nii_object], True, min_triangles=replacement.GetNumberOfPolys()) == 0
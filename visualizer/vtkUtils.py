@@ -1,10 +1,22 @@
+import math
+import os
+import time
+
 import vtk
 from ErrorObserver import *
 from NiiObject import *
+from NiiCase import *
 from config import *
 from NiiLabel import *
+from MeshCache import *
+from niftiUtils import *
+from PipelineStats import *
+from labelUtils import *
+from histogramUtils import *
 
 error_observer = ErrorObserver()
+mesh_cache = MeshCache(MESH_CACHE_DIR, MESH_CACHE_SIZE)
+pipeline_stats = PipelineStats(PIPELINE_STATS_LOG, PIPELINE_STATS_RECORDS)
 
 '''
 VTK Pipeline:   reader ->
@@ -18,15 +30,28 @@ VTK Pipeline:   reader ->
 
 def read_volume(file_name):
     """
-    :param file_name: The filename of type 'nii.gz'
-    :return: vtkNIFTIImageReader (https://www.vtk.org/doc/nightly/html/classvtkNIFTIImageReader.html)
+    Uncompressed volumes are memory mapped. With NIFTI_SIDECAR compressed ones are decompressed once into the sidecar
+    cache (NIFTI_SIDECAR_DIR) and memory mapped from there. Volumes which can not be mapped are read by vtkNIFTIImageReader.
+    With LOW_MEMORY the voxels are narrowed to the smallest scalar type holding them without loss, see narrow_volume.
+    :param file_name: The filename of type 'nii.gz' or 'nii'
+    :return: vtkImageImport or vtkNIFTIImageReader (https://www.vtk.org/doc/nightly/html/classvtkNIFTIImageReader.html)
     """
+    if file_name.endswith('.nii.gz') and NIFTI_SIDECAR and NIFTI_SIDECAR_SIZE > 0:
+        file_name = sidecar_file(file_name, NIFTI_SIDECAR_DIR, NIFTI_SIDECAR_SIZE)
+    if file_name.endswith('.nii'):
+        importer = memory_map_volume(file_name)
+        if importer is not None:
+            return narrow_volume(importer) if LOW_MEMORY else importer
+
     reader = vtk.vtkNIFTIImageReader()
     reader.SetFileNameSliceOffset(1)
     reader.SetDataByteOrderToBigEndian()
     reader.SetFileName(file_name)
     reader.Update()
-    return reader
+    if reader.GetErrorCode():
+        raise IOError("Could not read '{}': {}".format(file_name,
+                                                      vtk.vtkErrorCode.GetStringFromErrorCode(reader.GetErrorCode())))
+    return narrow_volume(reader) if LOW_MEMORY else reader
 
 
 def create_brain_extractor(brain):
@@ -42,19 +67,113 @@ def create_brain_extractor(brain):
     return brain_extractor
 
 
-def create_mask_extractor(mask):
+def create_preview_extractor(brain):
+    """
+    Extracts a coarse isosurface from a downsampled copy of the brain volume, used as a fast preview while the
+    threshold changes. The volume is averaged down 2x per axis, or 4x for volumes larger than PREVIEW_LARGE_VOLUME
+    voxels, with vtkImageShrink3D (https://www.vtk.org/doc/nightly/html/classvtkImageShrink3D.html).
+    :param brain: a vtkNIFTIImageReader volume containing the brain
+    :return: the vtkFlyingEdges3D running on the downsampled volume
+    """
+    factor = 4 if extent_volume(brain.reader.GetDataExtent()) > PREVIEW_LARGE_VOLUME else 2
+
+    shrink = vtk.vtkImageShrink3D()
+    shrink.SetInputConnection(brain.reader.GetOutputPort())
+    shrink.SetShrinkFactors(factor, factor, factor)
+    shrink.AveragingOn()
+
+    preview_extractor = vtk.vtkFlyingEdges3D()
+    preview_extractor.SetInputConnection(shrink.GetOutputPort())
+    preview_extractor.ComputeNormalsOn()
+    return preview_extractor
+
+
+def create_mask_extractor(mask, extent=None):
     """
     Given the output from mask (vtkNIFTIImageReader) extract it into 3D using
     vtkDiscreteMarchingCubes algorithm (https://www.vtk.org/doc/release/5.0/html/a01331.html).
     This algorithm is specialized for reading segmented volume labels.
     :param mask: a vtkNIFTIImageReader volume containing the mask
+    :param extent: optional voxel extent (xmin, xmax, ymin, ymax, zmin, zmax), the extraction only runs on this
+                   sub-volume (https://www.vtk.org/doc/nightly/html/classvtkExtractVOI.html)
     :return: the extracted volume from vtkDiscreteMarchingCubes
     """
     mask_extractor = vtk.vtkDiscreteMarchingCubes()
-    mask_extractor.SetInputConnection(mask.reader.GetOutputPort())
+    if extent is None:
+        mask_extractor.SetInputConnection(mask.reader.GetOutputPort())
+    else:
+        cropper = vtk.vtkExtractVOI()
+        cropper.SetInputConnection(mask.reader.GetOutputPort())
+        cropper.SetVOI(*extent)
+        cropper.ReleaseDataFlagOn()  # the crop is only read once per extraction, every label shares the reader
+        mask_extractor.SetInputConnection(cropper.GetOutputPort())
     return mask_extractor
 
 
+def create_label_extractor(mask, label_values):
+    """
+    Extracts the surfaces of every label of the mask in a single pass over the whole volume with
+    vtkDiscreteFlyingEdges3D (https://www.vtk.org/doc/nightly/html/classvtkDiscreteFlyingEdges3D.html). Unlike
+    vtkDiscreteMarchingCubes, whose cost grows with the number of values, it visits every voxel once.
+    :param mask: a NiiObject with its reader
+    :param label_values: the values of the labels to extract
+    :return: the vtkDiscreteFlyingEdges3D, the points of every surface keep their label value, see create_label_selector
+    """
+    label_extractor = vtk.vtkDiscreteFlyingEdges3D()
+    label_extractor.SetInputConnection(mask.reader.GetOutputPort())
+    label_extractor.ComputeNormalsOff()  # computed after smoothing, see create_normals
+    label_extractor.ComputeGradientsOff()
+    label_extractor.SetNumberOfContours(len(label_values))
+    for i, label_value in enumerate(label_values):
+        label_extractor.SetValue(i, label_value)
+    return label_extractor
+
+
+def create_label_selector(label_extractor, label_value):
+    """
+    Selects the surface of one label from the output of create_label_extractor, it has the same triangles as the
+    create_mask_extractor surface of the label.
+    :param label_extractor: a vtkDiscreteFlyingEdges3D from create_label_extractor
+    :param label_value: the value of the label
+    :return: a vtkGeometryFilter whose output is the surface of the label
+    """
+    threshold = vtk.vtkThreshold()
+    threshold.SetInputConnection(label_extractor.GetOutputPort())
+    threshold.SetInputArrayToProcess(0, 0, 0, vtk.vtkDataObject.FIELD_ASSOCIATION_POINTS,
+                                     vtk.vtkDataSetAttributes.SCALARS)
+    threshold.SetThresholdFunction(vtk.vtkThreshold.THRESHOLD_BETWEEN)
+    threshold.SetLowerThreshold(label_value)
+    threshold.SetUpperThreshold(label_value)
+    threshold.ReleaseDataFlagOn()  # only read once by the geometry filter
+
+    selector = vtk.vtkGeometryFilter()
+    selector.SetInputConnection(threshold.GetOutputPort())
+    return selector
+
+
+def create_label_extractors(mask):
+    """
+    Picks how the labels of the mask are extracted. While the 1 voxel padded bounding boxes of the labels add up to at
+    most MASK_CROP_MAX_VOLUME of the mask, every label is extracted from its own box (create_mask_extractor), otherwise
+    (e.g. labels spread across the whole mask) every label is extracted in a single pass (create_label_extractor).
+    :param mask: a NiiObject with its reader, extent and label_index, the single pass extractor is stored as
+                 mask.extractor
+    :return: dict of label value -> extractor of the label surface
+    """
+    extents = {label_value: pad_extent(info['extent'], mask.extent) for label_value, info in mask.label_index.items()}
+    crop_volume = sum(extent_volume(extent) for extent in extents.values())
+    if LOW_MEMORY or crop_volume <= MASK_CROP_MAX_VOLUME * extent_volume(mask.extent):
+        extractors = {}
+        for label_value, extent in extents.items():
+            extractors[label_value] = create_mask_extractor(mask, extent)
+            extractors[label_value].SetValue(0, label_value)
+        return extractors
+
+    mask.extractor = create_label_extractor(mask, sorted(extents))
+    pipeline_stats.observe(mask.extractor, 'mask', 'extractor')
+    return {label_value: create_label_selector(mask.extractor, label_value) for label_value in extents}
+
+
 def create_polygon_reducer(extractor):
     """
     Reduces the number of polygons (triangles) in the volume. This is used to speed up rendering.
@@ -70,15 +189,43 @@ def create_polygon_reducer(extractor):
     return reducer
 
 
+def create_clustering_reducer(extractor, dimensions):
+    """
+    Reduces the number of polygons of a multi label surface by quadric clustering
+    (https://www.vtk.org/doc/nightly/html/classvtkQuadricClustering.html). Unlike vtkDecimatePro it keeps the label
+    value of every triangle (cell data), so a single surface can hold every label of a mask.
+    :param extractor: a vtkDiscreteMarchingCubes extracting several labels
+    :param dimensions: voxel dimensions of the extracted volume, the clustering grid has MASK_COMPACT_CLUSTERING bins
+                       per voxel along each axis
+    :return: the clustered surface
+    """
+    reducer = vtk.vtkQuadricClustering()
+    reducer.SetInputConnection(extractor.GetOutputPort())
+    reducer.SetNumberOfDivisions(*[max(int(d * MASK_COMPACT_CLUSTERING), 2) for d in dimensions])
+    reducer.AutoAdjustNumberOfDivisionsOff()
+    reducer.CopyCellDataOn()
+    return reducer
+
+
 def create_smoother(reducer, smoothness):
     """
-    Reorients some points in the volume to smooth the render edges.
-    (https://www.vtk.org/doc/nightly/html/classvtkSmoothPolyDataFilter.html)
+    Reorients some points in the volume to smooth the render edges. SMOOTHING_METHOD selects windowed sinc smoothing
+    (https://www.vtk.org/doc/nightly/html/classvtkWindowedSincPolyDataFilter.html), which converges in a few dozen
+    iterations without shrinking the surface, or Laplacian smoothing
+    (https://www.vtk.org/doc/nightly/html/classvtkSmoothPolyDataFilter.html).
     :param reducer:
-    :param smoothness:
+    :param smoothness: number of iterations
     :return:
     """
-    smoother = vtk.vtkSmoothPolyDataFilter()
+    if SMOOTHING_METHOD == "windowed_sinc":
+        smoother = vtk.vtkWindowedSincPolyDataFilter()
+        smoother.SetPassBand(SMOOTHING_PASS_BAND)
+        smoother.NormalizeCoordinatesOn()  # keeps the filter numerically stable for any volume size
+        smoother.BoundarySmoothingOn()
+        smoother.NonManifoldSmoothingOn()
+        smoother.FeatureEdgeSmoothingOff()
+    else:
+        smoother = vtk.vtkSmoothPolyDataFilter()
     smoother.SetInputConnection(reducer.GetOutputPort())
     smoother.SetNumberOfIterations(smoothness)
     return smoother
@@ -98,11 +245,9 @@ def create_normals(smoother):
     return brain_normals
 
 
-def create_mapper(stripper):
+def create_mapper():
     brain_mapper = vtk.vtkPolyDataMapper()
-    brain_mapper.SetInputConnection(stripper.GetOutputPort())
     brain_mapper.ScalarVisibilityOff()
-    brain_mapper.Update()
     return brain_mapper
 
 
@@ -120,29 +265,19 @@ def create_actor(mapper, prop):
     return actor
 
 
-def create_mask_table():
-    m_mask_opacity = 1
-    brain_lut = vtk.vtkLookupTable()
-    brain_lut.SetRange(0, 4)
-    brain_lut.SetRampToLinear()
-    brain_lut.SetValueRange(0, 1)
-    brain_lut.SetHueRange(0, 0)
-    brain_lut.SetSaturationRange(0, 0)
-
-    brain_lut.SetNumberOfTableValues(10)
-    brain_lut.SetTableRange(0, 9)
-    brain_lut.SetTableValue(0, 0, 0, 0, 0)
-    brain_lut.SetTableValue(1, 1, 0, 0, m_mask_opacity)  # RED
-    brain_lut.SetTableValue(2, 0, 1, 0, m_mask_opacity)  # GREEN
-    brain_lut.SetTableValue(3, 1, 1, 0, m_mask_opacity)  # YELLOW
-    brain_lut.SetTableValue(4, 0, 0, 1, m_mask_opacity)  # BLUE
-    brain_lut.SetTableValue(5, 1, 0, 1, m_mask_opacity)  # MAGENTA
-    brain_lut.SetTableValue(6, 0, 1, 1, m_mask_opacity)  # CYAN
-    brain_lut.SetTableValue(7, 1, 0.5, 0.5, m_mask_opacity)  # RED_2
-    brain_lut.SetTableValue(8, 0.5, 1, 0.5, m_mask_opacity)  # GREEN_2
-    brain_lut.SetTableValue(9, 0.5, 0.5, 1, m_mask_opacity)  # BLUE_2
-    brain_lut.Build()
-    return brain_lut
+def create_mask_table(labels):
+    """
+    Creates an indexed lookup table with one entry (color and opacity) per mask label, keyed by the label value.
+    :param labels: the NiiLabels of the mask
+    :return: vtkLookupTable (https://www.vtk.org/doc/nightly/html/classvtkLookupTable.html)
+    """
+    mask_lut = vtk.vtkLookupTable()
+    mask_lut.IndexedLookupOn()
+    mask_lut.SetNumberOfTableValues(len(labels))
+    for label_idx, label in enumerate(labels):
+        mask_lut.SetAnnotation(vtk.vtkVariant(label.value), label.name)
+        mask_lut.SetTableValue(label_idx, label.color[0], label.color[1], label.color[2], label.opacity)
+    return mask_lut
 
 
 def create_table():
@@ -154,21 +289,320 @@ def create_table():
     table.SetSaturationRange(0, 0)
 
 
-def add_surface_rendering(nii_object, label_idx, label_value):
+def add_surface_rendering(nii_object, label_idx, label_value, compute=True):
+    nii_object.labels[label_idx].value = label_value
     nii_object.labels[label_idx].extractor.SetValue(0, label_value)
-    nii_object.labels[label_idx].extractor.Update()
+    create_surface_actor(nii_object, nii_object.labels[label_idx], compute)
+
+
+def create_surface_actor(nii_object, label, compute=True):
+    """
+    Builds the reducer -> smoother -> normals chain on top of the label extractor, computes the surface (or loads it
+    from the mesh cache) and creates the actor if the label has any data.
+    :param nii_object: the NiiObject the label belongs to
+    :param label: a NiiLabel with an extractor, and optionally a reducer (vtkDecimatePro by default)
+    :param compute: if False only the extractor runs and the surface is left to update_surface, e.g. once
+                    fit_triangle_budget has chosen the reduction
+    """
+    if label.reducer is None:
+        label.reducer = create_polygon_reducer(label.extractor)
+    label.smoother = create_smoother(label.reducer, label.smoothness)
+    label.normals = create_normals(label.smoother)
+    label.mapper = create_mapper()
+
+    for stage in ('extractor', 'reducer', 'smoother', 'normals'):
+        pipeline_stats.observe(getattr(label, stage), label.name, stage)
+
+    # if there are no cells then there is no label data
+    if compute:
+        n_cells = update_surface(nii_object, label).GetNumberOfCells()
+    else:
+        label.extractor.Update()
+        n_cells = label.extractor.GetOutput().GetNumberOfCells()
+    if n_cells:
+        label.property = create_property(label.opacity, label.color)
+        label.actor = create_actor(label.mapper, label.property)
+
+
+def reducer_params(label):
+    """:return: dict of every parameter the decimated surface of the label depends on (besides the volume)"""
+    if label.triangle_target is not None:
+        reduction = None  # derived from the triangle target by load_reduced_surface
+    elif label.reducer.IsA('vtkQuadricClustering'):
+        reduction = list(label.reducer.GetNumberOfDivisions())
+    else:
+        reduction = label.reducer.GetTargetReduction()
+    return {'extractor': label.extractor.GetClassName(), 'value': label.value, 'reduction': reduction,
+            'triangle_target': label.triangle_target}
+
+
+def surface_cache_key(nii_object, label):
+    pass_band = label.smoother.GetPassBand() if label.smoother.IsA('vtkWindowedSincPolyDataFilter') else None
+    return mesh_cache.key(nii_object.file,
+                          smoother=label.smoother.GetClassName(),
+                          smoothness=label.smoother.GetNumberOfIterations(),
+                          pass_band=pass_band,
+                          feature_angle=label.normals.GetFeatureAngle(),
+                          **reducer_params(label))
+
+
+def upstream_filters(algorithm):
+    """
+    :return: the algorithm and the filters feeding it (e.g. a vtkExtractVOI or vtkImageShrink3D), upstream first. The
+             reader is left out, it is shared by every pipeline of the volume and only executes once.
+    """
+    filters = [algorithm]
+    while filters[0].GetNumberOfInputConnections(0):
+        upstream = filters[0].GetInputAlgorithm()
+        if not upstream.GetNumberOfInputPorts():
+            break
+        filters.insert(0, upstream)
+    return filters
+
 
-    # if the cell size is 0 then there is no label_idx data
-    if nii_object.labels[label_idx].extractor.GetOutput().GetMaxCellSize():
-        reducer = create_polygon_reducer(nii_object.labels[label_idx].extractor)
-        smoother = create_smoother(reducer, nii_object.labels[label_idx].smoothness)
-        normals = create_normals(smoother)
-        actor_mapper = create_mapper(normals)
-        actor_property = create_property(nii_object.labels[label_idx].opacity, nii_object.labels[label_idx].color)
-        actor = create_actor(actor_mapper, actor_property)
-        nii_object.labels[label_idx].actor = actor
-        nii_object.labels[label_idx].smoother = smoother
-        nii_object.labels[label_idx].property = actor_property
+def surface_filters(label):
+    """
+    :return: every filter which executes when the surface of the label is computed, upstream first
+    """
+    return upstream_filters(label.extractor) + [label.reducer, label.smoother, label.normals]
+
+
+def preview_filters(label):
+    """:return: every filter which executes when the preview surface of the label is computed, upstream first"""
+    return upstream_filters(label.preview_extractor)
+
+
+def load_reduced_surface(nii_object, label):
+    """
+    Returns the decimated surface of the label, the input of its smoother. It is kept on the label and in the mesh
+    cache, so a smoothness change only runs the smoother and normals again, even if the surface came from the cache.
+    :param nii_object: the NiiObject the label belongs to
+    :param label: one of the surface_labels of nii_object
+    :return: the decimated vtkPolyData (empty if the label has no data) or None if a filter was aborted
+    """
+    params = reducer_params(label)
+    if label.reduced is not None and label.reduced_params == params:
+        return label.reduced
+
+    label.reduced = None
+    cache_key = mesh_cache.key(nii_object.file, stage='reduced', **params)
+    start = time.perf_counter()
+    polydata = mesh_cache.get(cache_key)
+    if polydata is not None:
+        pipeline_stats.record(label.name, 'reducer_cache', time.perf_counter() - start, polydata.GetNumberOfCells(),
+                              polydata.GetActualMemorySize())
+    else:
+        label.extractor.Update()
+        polydata = vtk.vtkPolyData()
+        if label.extractor.GetOutput().GetNumberOfCells():
+            if label.triangle_target is not None:
+                set_triangle_target(label, label.triangle_target)
+            label.reducer.Update()
+            polydata.ShallowCopy(label.reducer.GetOutput())  # the next reducer run allocates new arrays
+        if any(f.GetAbortExecute() for f in upstream_filters(label.extractor) + [label.reducer]):
+            return None
+        mesh_cache.put(cache_key, polydata)
+
+    label.reduced, label.reduced_params = polydata, params
+    return polydata
+
+
+def compute_surface(label, reduced):
+    """
+    Smooths the decimated surface and computes its normals, returning a copy of the output so later pipeline runs
+    never modify a rendered surface.
+    :param label: a NiiLabel with a complete pipeline
+    :param reduced: the decimated surface of the label, see load_reduced_surface
+    :return: the final vtkPolyData of the label (empty if the label has no data) or None if a filter was aborted
+    """
+    polydata = vtk.vtkPolyData()
+    if reduced.GetNumberOfCells():
+        label.smoother.SetInputData(reduced)
+        label.normals.Update()
+        if LOW_MEMORY:
+            polydata.ShallowCopy(label.normals.GetOutput())  # the normals output is released, see release_outputs
+        else:
+            polydata.DeepCopy(label.normals.GetOutput())
+    if label.smoother.GetAbortExecute() or label.normals.GetAbortExecute():
+        return None
+    return polydata
+
+
+def set_triangle_target(label, target):
+    """
+    Sets the reducer of the label so its surface ends up with about target triangles, relative to the current
+    extractor output. vtkDecimatePro stops far short of high reductions while it preserves the topology, so that is
+    turned off in favour of meeting the target.
+    :param label: a NiiLabel with an updated extractor
+    """
+    n_cells = label.extractor.GetOutput().GetNumberOfCells()
+    if label.reducer.IsA('vtkQuadricClustering'):
+        # a clustered surface has about as many triangles as there are bins on its surface, a 2D measure
+        factor = min(math.sqrt(target / float(n_cells)), 1.0) if n_cells else 1.0
+        dimensions = label.extractor.GetInput().GetDimensions()
+        label.reducer.SetNumberOfDivisions(*[max(int(d * factor), 2) for d in dimensions])
+    else:
+        label.reducer.PreserveTopologyOff()
+        label.reducer.SetTargetReduction(max(1.0 - target / float(n_cells), 0.0) if n_cells else 0.0)
+
+
+def fit_triangle_budget(nii_objects, budget):
+    """
+    Splits the triangle budget across the surfaces of nii_objects by the size of their extracted surfaces (see
+    allocate_triangles), stores the target of every surface in its label and computes the surfaces. Later updates of a
+    surface (e.g. a new threshold) keep its target, only the reduction is recomputed.
+    :param nii_objects: NiiObjects set up with compute_surfaces=False
+    :param budget: total number of triangles
+    :return: triangle_report of nii_objects
+    """
+    labels = [(nii_object, label) for nii_object in nii_objects for label in surface_labels(nii_object)]
+    counts = [label.extractor.GetOutput().GetNumberOfCells() for _, label in labels]
+    for (nii_object, label), target in zip(labels, allocate_triangles(counts, budget)):
+        label.triangle_target = target
+        update_surface(nii_object, label)
+    return triangle_report(nii_objects)
+
+
+def triangle_report(nii_objects):
+    """
+    :return: list of dicts with the label name, its triangle target (None without a budget) and the number of
+             triangles of its rendered surface
+    """
+    return [{'label': label.name, 'target': label.triangle_target,
+             'triangles': label.mapper.GetInput().GetNumberOfCells() if label.mapper.GetInput() else 0}
+            for nii_object in nii_objects for label in surface_labels(nii_object)]
+
+
+def load_surface(nii_object, label):
+    """
+    Loads the surface of the label from the mesh cache or computes it. Only touches the label pipeline, never the
+    mapper or actor, so it can run on a worker thread.
+    :param nii_object: the NiiObject the label belongs to
+    :param label: one of the surface_labels of nii_object
+    :return: the vtkPolyData of the label, or None if the computation was aborted
+    """
+    cache_key = surface_cache_key(nii_object, label)
+    start = time.perf_counter()
+    polydata = mesh_cache.get(cache_key)
+    if polydata is not None:
+        pipeline_stats.record(label.name, 'mesh_cache', time.perf_counter() - start, polydata.GetNumberOfCells(),
+                              polydata.GetActualMemorySize())
+    else:
+        reduced = load_reduced_surface(nii_object, label)
+        polydata = compute_surface(label, reduced) if reduced is not None else None
+        if polydata is not None:
+            mesh_cache.put(cache_key, polydata)
+    if LOW_MEMORY:
+        release_outputs(label)
+    return polydata
+
+
+def release_outputs(label):
+    """
+    Frees the outputs of every stage of the label pipeline and the kept decimated surface, leaving only the rendered
+    surface. The pipeline keeps its filters and parameters, so the stages run again when a parameter changes.
+    """
+    label.reduced, label.reduced_params = None, None
+    for algorithm in surface_filters(label):
+        algorithm.GetOutputDataObject(0).ReleaseData()
+
+
+def load_preview_surface(label, value):
+    """
+    Computes the coarse preview surface of the label at value. Like load_surface it only touches the label pipeline,
+    so it can run on a worker thread. label.value stays the value of the full resolution surface.
+    :param label: a NiiLabel with a preview_extractor
+    :return: the preview vtkPolyData of the label, also kept as label.preview_surface, or None if the extraction was
+             aborted
+    """
+    label.preview_extractor.SetValue(0, value)
+    label.preview_extractor.Update()
+    if any(f.GetAbortExecute() for f in preview_filters(label)):
+        return None
+    polydata = vtk.vtkPolyData()
+    polydata.DeepCopy(label.preview_extractor.GetOutput())
+    label.preview_surface = polydata
+    return polydata
+
+
+def update_surface(nii_object, label):
+    """
+    Recomputes the surface of the label after a pipeline parameter changed and hands it to the label mapper.
+    :param nii_object: the NiiObject the label belongs to
+    :param label: one of the surface_labels of nii_object
+    :return: the new vtkPolyData of the label
+    """
+    polydata = load_surface(nii_object, label)
+    label.mapper.SetInputData(polydata)
+    return polydata
+
+
+def surface_labels(nii_object):
+    """
+    :return: the NiiLabels which own a rendered surface, the single compact label of a mask with more than
+             MASK_COMPACT_LABELS labels, otherwise every label with an actor
+    """
+    if nii_object.compact_label is not None:
+        return [nii_object.compact_label] if nii_object.compact_label.actor else []
+    return [label for label in nii_object.labels if label.actor]
+
+
+def create_interactive_surface(polydata, divisions=INTERACTIVE_DIVISIONS):
+    """
+    :return: a reduced copy of a surface for rendering during interaction, quadric clustered into divisions bins along
+             the longest axis of its bounds, the cell data (label values of a compact surface) is kept
+    """
+    bounds = polydata.GetBounds()
+    sizes = [bounds[1] - bounds[0], bounds[3] - bounds[2], bounds[5] - bounds[4]]
+    bin_size = max(sizes) / divisions or 1.0
+    reducer = vtk.vtkQuadricClustering()
+    reducer.SetInputData(polydata)
+    reducer.SetNumberOfDivisions(*[max(int(math.ceil(size / bin_size)), 2) for size in sizes])
+    reducer.AutoAdjustNumberOfDivisionsOff()
+    reducer.CopyCellDataOn()
+    reducer.Update()
+    return reducer.GetOutput()
+
+
+def set_interactive_detail(nii_objects, interactive, min_triangles=INTERACTIVE_MIN_TRIANGLES):
+    """
+    Switches the surfaces with more than min_triangles triangles to reduced copies (see create_interactive_surface)
+    while interactive, and back to full detail afterwards. A reduced copy is made once per surface and kept in
+    label.interactive_surface. A surface replaced (e.g. by the pipeline worker) during the interaction stays.
+    :return: the number of surfaces drawn at reduced detail
+    """
+    reduced = 0
+    for nii_object in nii_objects:
+        for label in surface_labels(nii_object):
+            full, copy = label.interactive_surface or (None, None)
+            if not interactive:
+                if copy is not None and label.mapper.GetInput() is copy:
+                    label.mapper.SetInputData(full)
+                elif copy is not None:
+                    label.interactive_surface = None  # the surface was replaced, the copy is stale
+                continue
+            polydata = label.mapper.GetInput()
+            if polydata is None or polydata.GetNumberOfPolys() <= min_triangles:
+                continue
+            if polydata is not full:
+                label.interactive_surface = (polydata, create_interactive_surface(polydata))
+            label.mapper.SetInputData(label.interactive_surface[1])
+            reduced += 1
+    return reduced
+
+
+def set_label_appearance(nii_object, label, color, opacity):
+    """
+    Sets the color and opacity (0 hides it) of a mask label, on its own actor or in the lookup table of the compact
+    surface.
+    """
+    if nii_object.compact_label is not None:
+        lut = nii_object.compact_label.mapper.GetLookupTable()
+        lut.SetTableValue(lut.GetAnnotatedValueIndex(vtk.vtkVariant(label.value)), color[0], color[1], color[2],
+                          opacity)
+    elif label.property:
+        label.property.SetColor(color[0], color[1], color[2])
+        label.property.SetOpacity(opacity)
 
 
 def setup_slicer(renderer, brain):
@@ -180,7 +614,7 @@ def setup_slicer(renderer, brain):
     axial_prop = vtk.vtkImageProperty()
     axial_prop.SetOpacity(0)
     axial.SetProperty(axial_prop)
-    axial.GetMapper().SetInputConnection(brain.image_mapper.GetOutputPort())
+    axial.GetMapper().SetInputConnection(brain.reader.GetOutputPort())
     axial.SetDisplayExtent(0, x, 0, y, int(z/2), int(z/2))
     axial.InterpolateOn()
     axial.ForceOpaqueOn()
@@ -189,7 +623,7 @@ def setup_slicer(renderer, brain):
     cor_prop = vtk.vtkImageProperty()
     cor_prop.SetOpacity(0)
     coronal.SetProperty(cor_prop)
-    coronal.GetMapper().SetInputConnection(brain.image_mapper.GetOutputPort())
+    coronal.GetMapper().SetInputConnection(brain.reader.GetOutputPort())
     coronal.SetDisplayExtent(0, x, int(y/2), int(y/2), 0, z)
     coronal.InterpolateOn()
     coronal.ForceOpaqueOn()
@@ -198,11 +632,12 @@ def setup_slicer(renderer, brain):
     sag_prop = vtk.vtkImageProperty()
     sag_prop.SetOpacity(0)
     sagittal.SetProperty(sag_prop)
-    sagittal.GetMapper().SetInputConnection(brain.image_mapper.GetOutputPort())
+    sagittal.GetMapper().SetInputConnection(brain.reader.GetOutputPort())
     sagittal.SetDisplayExtent(int(x/2), int(x/2), 0, y, 0, z)
     sagittal.InterpolateOn()
     sagittal.ForceOpaqueOn()
 
+    set_image_intensity([axial_prop, cor_prop, sag_prop], brain.scalar_range, BRAIN_IMAGE_INTENSITY)
     renderer.AddActor(axial)
     renderer.AddActor(coronal)
     renderer.AddActor(sagittal)
@@ -223,50 +658,373 @@ def setup_projection(brain, renderer):
     image_slice = vtk.vtkImageSlice()
     image_slice.SetMapper(slice_mapper)
     image_slice.SetProperty(brain_image_prop)
-    image_slice.GetMapper().SetInputConnection(brain.image_mapper.GetOutputPort())
+    set_image_intensity([brain_image_prop], brain.scalar_range, BRAIN_IMAGE_INTENSITY)
     renderer.AddViewProp(image_slice)
     return brain_image_prop
 
 
-def setup_brain(renderer, file):
+def set_image_intensity(properties, scalar_range, intensity):
+    """
+    Maps the image intensity picker onto the window/level of the slicer and projection images: gray values scale with
+    intensity and saturate above 1 / intensity of the scalar range. The images read the original scalars and only the
+    displayed slices are colored while drawing, so a change costs a frame and no colored copy of the volume is kept.
+    :param properties: the vtkImageProperty of every image slice of the brain
+    :param scalar_range: (min, max) of the brain volume
+    :param intensity: the image intensity, 1 maps the scalar range linearly from black to white
+    """
+    low, high = scalar_range
+    window = (high - low) / max(intensity, 1e-3)
+    for image_property in properties:
+        image_property.SetColorWindow(window)
+        image_property.SetColorLevel(low + window / 2)
+
+
+def create_volume(nii_object):
+    """
+    Renders the volume directly with the multi-threaded CPU ray cast mapper
+    (https://www.vtk.org/doc/nightly/html/classvtkFixedPointVolumeRayCastMapper.html), so it works without a GPU.
+    The look is set by the transfer functions of the volume property only, see set_brain_transfer_functions and
+    set_mask_transfer_functions, changing them costs a frame instead of a pipeline run.
+    :param nii_object: a NiiObject with a reader
+    :return: the vtkVolume, initially hidden
+    """
+    mapper = vtk.vtkFixedPointVolumeRayCastMapper()
+    mapper.SetInputConnection(nii_object.reader.GetOutputPort())
+    if VOLUME_RENDER_THREADS:
+        mapper.SetNumberOfThreads(VOLUME_RENDER_THREADS)
+
+    prop = vtk.vtkVolumeProperty()
+    prop.SetColor(vtk.vtkColorTransferFunction())
+    prop.SetScalarOpacity(vtk.vtkPiecewiseFunction())
+    prop.ShadeOff()
+
+    volume = vtk.vtkVolume()
+    volume.SetMapper(mapper)
+    volume.SetProperty(prop)
+    volume.VisibilityOff()
+    return volume
+
+
+def set_brain_transfer_functions(brain, threshold, opacity, intensity):
+    """
+    Maps the brain threshold, opacity and image intensity pickers onto the transfer functions of brain.volume: voxels
+    below the threshold are transparent, above it the opacity ramps up to opacity and the gray value saturates like
+    the window/level of the slicer images, see set_image_intensity.
+    """
+    low, high = brain.scalar_range
+    prop = brain.volume.GetProperty()
+
+    scalar_opacity = prop.GetScalarOpacity()
+    scalar_opacity.RemoveAllPoints()
+    scalar_opacity.AddPoint(low, 0)
+    scalar_opacity.AddPoint(threshold, 0)
+    scalar_opacity.AddPoint(high, opacity)
+
+    color = prop.GetRGBTransferFunction()
+    color.RemoveAllPoints()
+    color.AddRGBPoint(low, 0, 0, 0)
+    if intensity > 1:
+        saturated = low + (high - low) / intensity
+        color.AddRGBPoint(saturated, 1, 1, 1)
+        color.AddRGBPoint(high, 1, 1, 1)
+    else:
+        color.AddRGBPoint(high, intensity, intensity, intensity)
+
+
+def set_mask_transfer_functions(mask, appearance):
+    """
+    Gives every label of mask.volume its own color and opacity. Labels are sampled with nearest neighbour
+    interpolation, so the opacity drops to 0 half way to the next label value.
+    :param appearance: list of (label value, color, opacity), labels with opacity 0 are hidden
+    """
+    prop = mask.volume.GetProperty()
+    prop.SetInterpolationTypeToNearest()
+    scalar_opacity = prop.GetScalarOpacity()
+    scalar_opacity.RemoveAllPoints()
+    color = prop.GetRGBTransferFunction()
+    color.RemoveAllPoints()
+    scalar_opacity.AddPoint(0, 0)  # background
+    for label_value, label_color, label_opacity in appearance:
+        scalar_opacity.AddPoint(label_value - 0.5, 0)
+        scalar_opacity.AddPoint(label_value, label_opacity)
+        scalar_opacity.AddPoint(label_value + 0.5, 0)
+        color.AddRGBPoint(label_value, label_color[0], label_color[1], label_color[2])
+
+
+def set_axial_view(renderer):
+    renderer.ResetCamera()
+    fp = renderer.GetActiveCamera().GetFocalPoint()
+    p = renderer.GetActiveCamera().GetPosition()
+    dist = math.sqrt((p[0] - fp[0]) ** 2 + (p[1] - fp[1]) ** 2 + (p[2] - fp[2]) ** 2)
+    renderer.GetActiveCamera().SetPosition(fp[0], fp[1], fp[2] + dist)
+    renderer.GetActiveCamera().SetViewUp(0.0, 1.0, 0.0)
+    renderer.GetActiveCamera().Zoom(1.8)
+
+
+def set_coronal_view(renderer):
+    renderer.ResetCamera()
+    fp = renderer.GetActiveCamera().GetFocalPoint()
+    p = renderer.GetActiveCamera().GetPosition()
+    dist = math.sqrt((p[0] - fp[0]) ** 2 + (p[1] - fp[1]) ** 2 + (p[2] - fp[2]) ** 2)
+    renderer.GetActiveCamera().SetPosition(fp[0], fp[2] - dist, fp[1])
+    renderer.GetActiveCamera().SetViewUp(0.0, 0.5, 0.5)
+    renderer.GetActiveCamera().Zoom(1.8)
+
+
+def set_sagittal_view(renderer):
+    renderer.ResetCamera()
+    fp = renderer.GetActiveCamera().GetFocalPoint()
+    p = renderer.GetActiveCamera().GetPosition()
+    dist = math.sqrt((p[0] - fp[0]) ** 2 + (p[1] - fp[1]) ** 2 + (p[2] - fp[2]) ** 2)
+    renderer.GetActiveCamera().SetPosition(fp[2] + dist, fp[0], fp[1])
+    renderer.GetActiveCamera().SetViewUp(0.0, 0.0, 1.0)
+    renderer.GetActiveCamera().Zoom(1.6)
+
+
+def record_volume_stats(name, nii_object):
+    image = nii_object.reader.GetOutput()
+    pipeline_stats.record(name, 'read_volume', nii_object.load_time, image.GetNumberOfPoints(),
+                          image.GetActualMemorySize())
+
+
+def setup_brain(renderer, file, compute_surfaces=True):
     brain = NiiObject()
     brain.file = file
+    load_brain(brain, compute_surfaces)
+    renderer.AddActor(brain.labels[0].actor)
+    renderer.AddVolume(brain.volume)
+    return brain
+
+
+def load_brain(brain, compute_surfaces=True):
+    """
+    Reads brain.file and builds the surface pipeline, histogram and volume of the brain. Nothing is added to a
+    renderer, so it can run on a worker thread.
+    :param brain: a NiiObject with only its file set
+    :param compute_surfaces: if False only the extractor runs, see create_surface_actor
+    """
+    start = time.time()
     brain.reader = read_volume(brain.file)
+    brain.load_time = time.time() - start
+    record_volume_stats('brain', brain)
     brain.labels.append(NiiLabel(BRAIN_COLORS[0], BRAIN_OPACITY, BRAIN_SMOOTHNESS))
+    brain.labels[0].name = 'brain'
     brain.labels[0].extractor = create_brain_extractor(brain)
+    brain.labels[0].preview_extractor = create_preview_extractor(brain)
+    pipeline_stats.observe(brain.labels[0].preview_extractor.GetInputAlgorithm(), 'brain', 'shrink')
+    pipeline_stats.observe(brain.labels[0].preview_extractor, 'brain', 'preview')
     brain.extent = brain.reader.GetDataExtent()
 
     scalar_range = brain.reader.GetOutput().GetScalarRange()
-    bw_lut = vtk.vtkLookupTable()
-    bw_lut.SetTableRange(scalar_range)
-    bw_lut.SetSaturationRange(0, 0)
-    bw_lut.SetHueRange(0, 0)
-    bw_lut.SetValueRange(0, 2)
-    bw_lut.Build()
-
-    view_colors = vtk.vtkImageMapToColors()
-    view_colors.SetInputConnection(brain.reader.GetOutputPort())
-    view_colors.SetLookupTable(bw_lut)
-    view_colors.Update()
-    brain.image_mapper = view_colors
     brain.scalar_range = scalar_range
+    start = time.perf_counter()
+    brain.histogram = volume_histogram(brain.reader.GetOutput(), HISTOGRAM_BINS)
+    pipeline_stats.record('brain', 'histogram', time.perf_counter() - start, HISTOGRAM_BINS)
 
-    add_surface_rendering(brain, 0, sum(scalar_range)/2)  # render index, default extractor value
-    renderer.AddActor(brain.labels[0].actor)
-    return brain
+    threshold = initial_threshold(brain)
+    add_surface_rendering(brain, 0, threshold, compute_surfaces)  # render index, default extractor value
+
+    brain.volume = create_volume(brain)
+    set_brain_transfer_functions(brain, threshold, BRAIN_OPACITY, BRAIN_IMAGE_INTENSITY)
+
+
+def initial_threshold(brain):
+    """
+    :param brain: a NiiObject with scalar_range and histogram
+    :return: the isosurface threshold of a newly loaded brain, see BRAIN_THRESHOLD
+    """
+    if BRAIN_THRESHOLD == "otsu" and brain.histogram is not None:
+        threshold = otsu_threshold(*brain.histogram)
+    else:
+        threshold = sum(brain.scalar_range) / 2
+    return round(threshold, 2)  # the precision of the threshold picker
 
 
-def setup_mask(renderer, file):
+def setup_mask(renderer, file, compute_surfaces=True):
     mask = NiiObject()
     mask.file = file
+    start = time.time()
     mask.reader = read_volume(mask.file)
+    mask.load_time = time.time() - start
+    record_volume_stats('mask', mask)
     mask.extent = mask.reader.GetDataExtent()
-    n_labels = int(mask.reader.GetOutput().GetScalarRange()[1])
-    n_labels = n_labels if n_labels <= 10 else 10
-
-    for label_idx in range(n_labels):
-        mask.labels.append(NiiLabel(MASK_COLORS[label_idx], MASK_OPACITY, MASK_SMOOTHNESS))
-        mask.labels[label_idx].extractor = create_mask_extractor(mask)
-        add_surface_rendering(mask, label_idx, label_idx + 1)
-        renderer.AddActor(mask.labels[label_idx].actor)
+
+    # one pass over the voxels finds the present labels and their bounding boxes, so only those get a NiiLabel and
+    # small labels are extracted from their own sub-volume instead of the whole mask, see create_label_extractors
+    mask.label_index = build_label_index(mask.reader.GetOutput())
+    label_values = sorted(mask.label_index)
+    colors = generate_palette(len(label_values), MASK_COLORS)
+    for label_idx, label_value in enumerate(label_values):
+        mask.labels.append(NiiLabel(colors[label_idx], MASK_OPACITY, MASK_SMOOTHNESS))
+        mask.labels[label_idx].value = label_value
+        mask.labels[label_idx].name = 'label {}'.format(label_value)
+
+    mask.volume = create_volume(mask)
+    set_mask_transfer_functions(mask, [(label.value, label.color, label.opacity) for label in mask.labels])
+    renderer.AddVolume(mask.volume)
+
+    if len(label_values) > MASK_COMPACT_LABELS:
+        setup_compact_mask(renderer, mask, compute_surfaces)
+        return mask
+
+    extractors = create_label_extractors(mask)
+    for label in mask.labels:
+        label.extractor = extractors[label.value]
+        stage = 'crop' if mask.extractor is None else 'selector'  # the vtkExtractVOI or vtkThreshold of the label
+        pipeline_stats.observe(label.extractor.GetInputAlgorithm(), label.name, stage)
+        create_surface_actor(mask, label, compute_surfaces)
+        renderer.AddActor(label.actor)
     return mask
+
+
+def setup_compact_mask(renderer, mask, compute_surfaces=True):
+    """
+    Extracts every label of the mask with a single extractor -> clustering -> smoother -> normals chain into one
+    surface and one actor. The triangles keep their label value, the mapper colors them through create_mask_table, so
+    labels are recolored and hidden without touching the pipeline. Used for masks with many labels (parcellations),
+    where a pipeline and actor per label would be too slow and too large.
+    :param mask: a NiiObject whose labels are set up, the shared label is stored as mask.compact_label
+    """
+    label = NiiLabel(MASK_COLORS[0], 1.0, MASK_SMOOTHNESS)  # per label opacity is in the lookup table
+    label.name = 'labels'
+    label.value = [l.value for l in mask.labels]
+    extent = pad_extent(union_extent(info['extent'] for info in mask.label_index.values()), mask.extent)
+    label.extractor = create_mask_extractor(mask, extent)
+    label.extractor.SetNumberOfContours(len(label.value))
+    for i, label_value in enumerate(label.value):
+        label.extractor.SetValue(i, label_value)
+    dimensions = [extent[1] - extent[0] + 1, extent[3] - extent[2] + 1, extent[5] - extent[4] + 1]
+    label.reducer = create_clustering_reducer(label.extractor, dimensions)
+    mask.compact_label = label
+    pipeline_stats.observe(label.extractor.GetInputAlgorithm(), label.name, 'crop')
+    create_surface_actor(mask, label, compute_surfaces)
+
+    label.mapper.ScalarVisibilityOn()
+    label.mapper.SetScalarModeToUseCellData()
+    label.mapper.SetColorModeToMapScalars()
+    label.mapper.SetLookupTable(create_mask_table(mask.labels))
+    label.mapper.UseLookupTableScalarRangeOn()
+    if label.actor:
+        renderer.AddActor(label.actor)
+
+
+def setup_case(renderer, brain_file, mask_file):
+    """
+    Sets up the brain and mask of a case. With a TRIANGLE_BUDGET the surfaces are only computed once both are
+    extracted, so the budget can be split across all of them.
+    :return: brain and mask NiiObjects
+    """
+    brain = setup_brain(renderer, brain_file, compute_surfaces=TRIANGLE_BUDGET is None)
+    mask = setup_mask(renderer, mask_file, compute_surfaces=TRIANGLE_BUDGET is None)
+    if TRIANGLE_BUDGET is not None:
+        fit_triangle_budget([brain, mask], TRIANGLE_BUDGET)
+    return brain, mask
+
+
+def case_images(image):
+    """:return: the image files of a case as a tuple, a case has a single image file or one per modality"""
+    return (image,) if isinstance(image, str) else tuple(image)
+
+
+def modality_name(file_name):
+    """:return: the file name without its extension, e.g. 'T1CE' for '10labels_example/T1CE.nii.gz'"""
+    return os.path.basename(file_name).split(os.extsep, 1)[0]
+
+
+def read_geometry(file_name):
+    """:return: (extent, spacing) of a NIfTI volume, only the header is read"""
+    reader = vtk.vtkNIFTIImageReader()
+    reader.SetFileName(file_name)
+    reader.UpdateInformation()
+    return tuple(reader.GetDataExtent()), tuple(round(s, 5) for s in reader.GetDataSpacing())
+
+
+def load_case(case):
+    """
+    Loads a case into its own renderer, so switching cases only swaps renderers in the render window. Nothing is
+    rendered, so cases can be loaded on a background thread. Only the first modality of the case is read, the others
+    are read by set_modality on first use.
+    :param case: (name, image file or tuple of image files of the modalities, mask file)
+    :return: NiiCase
+    """
+    nii_case = NiiCase()
+    nii_case.name, images, mask_file = case
+    images = case_images(images)
+    geometry = read_geometry(images[0])
+    for image in images[1:]:
+        if read_geometry(image) != geometry:
+            raise ValueError("'{}' does not share the extent and spacing of '{}'".format(image, images[0]))
+    nii_case.modalities = {modality_name(image): image for image in images}
+    nii_case.modality = modality_name(images[0])
+
+    start = time.perf_counter()
+    nii_case.renderer = vtk.vtkRenderer()
+    nii_case.brain, nii_case.mask = setup_case(nii_case.renderer, images[0], mask_file)
+    nii_case.brains[nii_case.modality] = nii_case.brain
+    nii_case.brain_image_prop = setup_projection(nii_case.brain, nii_case.renderer)
+    nii_case.brain_slicer_props = setup_slicer(nii_case.renderer, nii_case.brain)
+    set_axial_view(nii_case.renderer)
+    pipeline_stats.record(nii_case.name, 'case', time.perf_counter() - start, None, case_memory_size(nii_case) / 1024)
+    return nii_case
+
+
+def set_modality(nii_case, modality, compute_surfaces=True, brain=None):
+    """
+    Shows another modality of a case as its brain. A modality is read on first use and stays loaded with the case.
+    The mask and its surfaces, the projection and the slicer are shared by every modality, only the brain surface and
+    volume are swapped and the slices read the scalars of the new modality.
+    :param nii_case: a NiiCase loaded by load_case
+    :param modality: a key of nii_case.modalities
+    :param compute_surfaces: if False the brain surface of a newly read modality is left to update_surface
+    :param brain: the brain of a modality which is not loaded yet, read elsewhere by load_brain (e.g. on a worker
+                  thread), instead of reading it here
+    :return: the brain NiiObject of the modality
+    """
+    with nii_case.lock:
+        if brain is not None:
+            nii_case.brains.setdefault(modality, brain)
+        brain = nii_case.brains.get(modality)
+        if brain is None:
+            brain = setup_brain(nii_case.renderer, nii_case.modalities[modality], compute_surfaces)
+            nii_case.brains[modality] = brain
+        elif brain is not nii_case.brain:
+            for prop in (brain.labels[0].actor, brain.volume):
+                if prop is not None:
+                    nii_case.renderer.AddViewProp(prop)
+        if brain is not nii_case.brain:
+            for prop in (nii_case.brain.labels[0].actor, nii_case.brain.volume):
+                if prop is not None:
+                    nii_case.renderer.RemoveViewProp(prop)
+
+        for image_slice in (nii_case.renderer.GetViewProps().GetItemAsObject(i)
+                            for i in range(nii_case.renderer.GetViewProps().GetNumberOfItems())):
+            if image_slice.IsA('vtkImageSlice'):  # the projection and the slicer actors
+                image_slice.GetMapper().SetInputConnection(brain.reader.GetOutputPort())
+        nii_case.brain, nii_case.modality = brain, modality
+    return brain
+
+
+def case_memory_size(nii_case):
+    """
+    :return: bytes held by the volumes and surfaces of the case, data shared between pipeline stages is counted once
+             per stage so this is an upper bound
+    """
+    with nii_case.lock:  # set_modality may swap the brains on another thread
+        data = {}
+        for nii_object in list(nii_case.brains.values()) + [nii_case.mask]:
+            if nii_object.reader is not None:
+                data[id(nii_object.reader.GetOutputDataObject(0))] = nii_object.reader.GetOutputDataObject(0)
+            for label in nii_object.labels + [nii_object.compact_label]:
+                if label is None or label.mapper is None:
+                    continue
+                for algorithm in surface_filters(label):
+                    data[id(algorithm.GetOutputDataObject(0))] = algorithm.GetOutputDataObject(0)
+                for polydata in (label.reduced, label.mapper.GetInput()):
+                    if polydata is not None:
+                        data[id(polydata)] = polydata
+        return 1024 * sum(d.GetActualMemorySize() for d in data.values() if d is not None)
+
+
+def release_case(nii_case):
+    """Drops the props of an evicted case from its renderer, so its volumes and surfaces can be freed."""
+    nii_case.renderer.RemoveAllViewProps()